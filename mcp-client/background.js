@@ -3,6 +3,324 @@ const tabConnections = new Map();
 
 const MAX_RECONNECT_ATTEMPTS = 5;
 const RECONNECT_INTERVAL = 5000; // 5 seconds
+// Close code the server uses when it restarts; the next instance is already listening
+const CLOSE_SERVICE_RESTART = 1012;
+const RESTART_RECONNECT_DELAY = 250;
+// Send a full snapshot instead of a patch when the patch is this large relative to the page
+const MAX_PATCH_RATIO = 0.5;
+
+function isHighSurrogate(code) {
+  return code >= 0xD800 && code <= 0xDBFF;
+}
+
+// Compute a single [start, end, text] splice turning oldText into newText.
+// Offsets are UTF-16 code units into oldText; surrogate pairs are never split.
+function diffText(oldText, newText) {
+  if (oldText === newText) {
+    return [];
+  }
+
+  const minLength = Math.min(oldText.length, newText.length);
+  let prefix = 0;
+  while (prefix < minLength && oldText.charCodeAt(prefix) === newText.charCodeAt(prefix)) {
+    prefix++;
+  }
+  if (prefix > 0 && isHighSurrogate(oldText.charCodeAt(prefix - 1))) {
+    prefix--;
+  }
+
+  let suffix = 0;
+  const maxSuffix = minLength - prefix;
+  while (suffix < maxSuffix &&
+         oldText.charCodeAt(oldText.length - 1 - suffix) === newText.charCodeAt(newText.length - 1 - suffix)) {
+    suffix++;
+  }
+  if (suffix > 0 && isHighSurrogate(oldText.charCodeAt(oldText.length - 1 - suffix))) {
+    suffix--;
+  }
+
+  return [[prefix, oldText.length - suffix, newText.slice(prefix, newText.length - suffix)]];
+}
+
+function patchSize(patch) {
+  return patch.reduce((size, [, , text]) => size + text.length, 0);
+}
+
+// Wire encoding negotiated with the server (see mcp-server/src/framing.py)
+const WIRE_ENCODING = 'deflate';
+// Messages at least this long are sent as compressed binary frames
+const COMPRESS_THRESHOLD = 16384;
+const FRAME_DEFLATE = 0x01;
+const FRAME_BLOB = 0x02;
+const FRAME_CHANNEL = 0x03;
+// Carry every tab over one extension-level websocket to /mcp-mux instead of one socket per tab
+const MULTIPLEX = true;
+// Text frame the server sends on a channel it closed (slow consumer, stalled send)
+const CHANNEL_CLOSE_PREFIX = '{"type":"close",';
+// extractTable results with more rows than this are streamed instead of sent inline
+const TABLE_INLINE_ROWS = 500;
+// Full snapshots at least this long are streamed in chunks (see mcp-server/src/streams.py)
+const STREAM_THRESHOLD = 262144;
+// Compressed bytes per streamChunk frame
+const STREAM_CHUNK_SIZE = 65536;
+// Pause a stream while this many bytes are still waiting in the socket's send buffer
+const STREAM_HIGH_WATER = 1048576;
+
+function sleep(ms) {
+  return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+// Split a data: URL into its media type and raw bytes
+function dataUrlToBytes(dataUrl) {
+  const comma = dataUrl.indexOf(',');
+  const meta = dataUrl.slice(5, comma);
+  const body = dataUrl.slice(comma + 1);
+  const mediaType = meta.split(';')[0] || 'application/octet-stream';
+  if (meta.endsWith(';base64')) {
+    const binary = atob(body);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+      bytes[i] = binary.charCodeAt(i);
+    }
+    return { mediaType, bytes };
+  }
+  return { mediaType, bytes: new TextEncoder().encode(decodeURIComponent(body)) };
+}
+
+async function pipeBytes(bytes, transform) {
+  const stream = new Blob([bytes]).stream().pipeThrough(transform);
+  return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+function withTag(tag, parts) {
+  const length = parts.reduce((size, part) => size + part.length, 1);
+  const frame = new Uint8Array(length);
+  frame[0] = tag;
+  let offset = 1;
+  for (const part of parts) {
+    frame.set(part, offset);
+    offset += part.length;
+  }
+  return frame;
+}
+
+async function encodeFrame(message) {
+  const text = JSON.stringify(message);
+  if (text.length < COMPRESS_THRESHOLD) {
+    return text;
+  }
+  const compressed = await pipeBytes(new TextEncoder().encode(text), new CompressionStream('deflate'));
+  return withTag(FRAME_DEFLATE, [compressed]);
+}
+
+function encodeBlobFrame(header, bytes) {
+  const headerBytes = new TextEncoder().encode(JSON.stringify(header));
+  const headerLength = new Uint8Array(4);
+  new DataView(headerLength.buffer).setUint32(0, headerBytes.length);
+  return withTag(FRAME_BLOB, [headerLength, headerBytes, bytes]);
+}
+
+async function decodeFrame(data) {
+  if (typeof data === 'string') {
+    return JSON.parse(data);
+  }
+  const bytes = new Uint8Array(data);
+  if (bytes[0] === FRAME_DEFLATE) {
+    const inflated = await pipeBytes(bytes.subarray(1), new DecompressionStream('deflate'));
+    return JSON.parse(new TextDecoder().decode(inflated));
+  }
+  if (bytes[0] === FRAME_BLOB) {
+    const headerLength = new DataView(bytes.buffer, bytes.byteOffset + 1, 4).getUint32(0);
+    const message = JSON.parse(new TextDecoder().decode(bytes.subarray(5, 5 + headerLength)));
+    message.blob = bytes.subarray(5 + headerLength);
+    return message;
+  }
+  throw new Error(`Unknown frame type: ${bytes[0]}`);
+}
+
+// One tab's logical connection inside a MuxConnection.
+// Implements the part of the WebSocket API that TabConnection uses.
+class MuxChannel {
+  constructor(mux, tabId) {
+    this.mux = mux;
+    this.tabId = String(tabId);
+    this.channelBytes = new TextEncoder().encode(this.tabId);
+    this.readyState = WebSocket.CONNECTING;
+    this.binaryType = 'arraybuffer';
+    this.onopen = null;
+    this.onclose = null;
+    this.onerror = null;
+    this.onmessage = null;
+  }
+
+  // Streams pace themselves on the shared socket's buffer
+  get bufferedAmount() {
+    return this.mux.socket ? this.mux.socket.bufferedAmount : 0;
+  }
+
+  send(frame) {
+    const inner = typeof frame === 'string' ? new TextEncoder().encode(frame) : frame;
+    const header = new Uint8Array([this.channelBytes.length]);
+    this.mux.sendFrame(withTag(FRAME_CHANNEL, [header, this.channelBytes, inner]));
+  }
+
+  close() {
+    if (this.readyState === WebSocket.CLOSED) {
+      return;
+    }
+    if (this.readyState === WebSocket.OPEN) {
+      this.send(JSON.stringify({ type: 'close' }));
+    }
+    this.mux.detach(this);
+    this.closed();
+  }
+
+  opened() {
+    this.readyState = WebSocket.OPEN;
+    if (this.onopen) {
+      this.onopen();
+    }
+  }
+
+  closed(code) {
+    if (this.readyState === WebSocket.CLOSED) {
+      return;
+    }
+    this.readyState = WebSocket.CLOSED;
+    // Like a real socket, report the close asynchronously
+    setTimeout(() => {
+      if (this.onclose) {
+        this.onclose({ code });
+      }
+    }, 0);
+  }
+
+  failed(error, code) {
+    if (this.readyState === WebSocket.CONNECTING && this.onerror) {
+      this.onerror(error);
+    }
+    this.closed(code);
+  }
+
+  // Inner frames are JSON text or a compressed/blob frame understood by decodeFrame()
+  receive(inner) {
+    if (inner[0] === FRAME_DEFLATE || inner[0] === FRAME_BLOB) {
+      this.onmessage?.({ data: inner.slice().buffer });
+      return;
+    }
+    const text = new TextDecoder().decode(inner);
+    if (text.startsWith(CHANNEL_CLOSE_PREFIX)) {
+      this.mux.detach(this);
+      this.closed(JSON.parse(text).code);
+      return;
+    }
+    this.onmessage?.({ data: text });
+  }
+}
+
+// Extension-level websocket carrying channel-tagged frames for every tab
+class MuxConnection {
+  constructor(serverUrl) {
+    this.url = `${serverUrl}-mux?encoding=${WIRE_ENCODING}`;
+    this.socket = null;
+    this.channels = new Map();
+  }
+
+  isOpen() {
+    return this.socket !== null && this.socket.readyState === WebSocket.OPEN;
+  }
+
+  openChannel(tabId) {
+    const channel = new MuxChannel(this, tabId);
+    const previous = this.channels.get(channel.tabId);
+    if (previous) {
+      previous.closed();
+    }
+    this.channels.set(channel.tabId, channel);
+    if (this.isOpen()) {
+      setTimeout(() => this.announce(channel), 0);
+    } else {
+      this.ensureSocket();
+    }
+    return channel;
+  }
+
+  announce(channel) {
+    if (this.channels.get(channel.tabId) !== channel || !this.isOpen()) {
+      return;
+    }
+    channel.send(JSON.stringify({ type: 'open' }));
+    channel.opened();
+  }
+
+  detach(channel) {
+    if (this.channels.get(channel.tabId) === channel) {
+      this.channels.delete(channel.tabId);
+    }
+  }
+
+  ensureSocket() {
+    if (this.socket) {
+      return;
+    }
+    const socket = new WebSocket(this.url);
+    socket.binaryType = 'arraybuffer';
+    this.socket = socket;
+
+    socket.onopen = () => {
+      console.log('Multiplexed connection open');
+      for (const channel of this.channels.values()) {
+        this.announce(channel);
+      }
+    };
+
+    socket.onmessage = (event) => {
+      if (typeof event.data === 'string') {
+        return;
+      }
+      const bytes = new Uint8Array(event.data);
+      if (bytes[0] !== FRAME_CHANNEL) {
+        console.error(`Unexpected frame type on multiplexed connection: ${bytes[0]}`);
+        return;
+      }
+      const innerStart = 2 + bytes[1];
+      const tabId = new TextDecoder().decode(bytes.subarray(2, innerStart));
+      this.channels.get(tabId)?.receive(bytes.subarray(innerStart));
+    };
+
+    socket.onerror = (error) => {
+      console.error('Multiplexed connection error:', error);
+    };
+
+    // Every channel closes with the socket; each TabConnection reconnects on its own schedule
+    socket.onclose = (event) => {
+      this.socket = null;
+      const channels = [...this.channels.values()];
+      this.channels.clear();
+      for (const channel of channels) {
+        channel.failed(new Error('Multiplexed connection closed'), event.code);
+      }
+    };
+  }
+
+  sendFrame(frame) {
+    if (this.isOpen()) {
+      this.socket.send(frame);
+    }
+  }
+}
+
+// Shared multiplexed connections, keyed by server URL
+const muxConnections = new Map();
+
+function getMuxConnection(serverUrl) {
+  let mux = muxConnections.get(serverUrl);
+  if (!mux) {
+    mux = new MuxConnection(serverUrl);
+    muxConnections.set(serverUrl, mux);
+  }
+  return mux;
+}
 
 class TabConnection {
   constructor(tabId, serverUrl) {
@@ -14,6 +332,14 @@ class TabConnection {
     this.reconnectDelay = 5000;
     this.reconnectTimer = null;
     this.serverUrl = serverUrl;
+    // Last snapshot sent to the server, used as the base for patches
+    this.lastHtml = null;
+    this.lastUrl = null;
+    this.stateVersion = 0;
+    // Frames are encoded asynchronously; chain them to keep wire order
+    this.sendChain = Promise.resolve();
+    this.receiveChain = Promise.resolve();
+    this.streamCounter = 0;
   }
 
   connect() {
@@ -23,24 +349,36 @@ class TabConnection {
       }
 
       try {
-        const wsUrl = `${this.serverUrl}/${this.tabId}`;
-        this.socket = new WebSocket(wsUrl);
+        if (MULTIPLEX) {
+          this.socket = getMuxConnection(this.serverUrl).openChannel(this.tabId);
+        } else {
+          const wsUrl = `${this.serverUrl}/${this.tabId}?encoding=${WIRE_ENCODING}`;
+          this.socket = new WebSocket(wsUrl);
+          this.socket.binaryType = 'arraybuffer';
+        }
 
         this.socket.onopen = () => {
           this.isConnected = true;
           this.reconnectAttempts = 0;
           clearTimeout(this.reconnectTimer);
+          this.resetState();
           console.log(`Tab ${this.tabId}: Connected to server`);
 
           this.sendState();
           resolve();
         };
 
-        this.socket.onclose = () => {
+        this.socket.onclose = (event) => {
           this.isConnected = false;
           this.socket = null;
           console.log(`Tab ${this.tabId}: Disconnected from server`);
-          this.attemptReconnect();
+          if (event && event.code === CLOSE_SERVICE_RESTART) {
+            // Planned restart: reconnect promptly and without using up attempts
+            this.reconnectAttempts = 0;
+            this.attemptReconnect(RESTART_RECONNECT_DELAY);
+          } else {
+            this.attemptReconnect();
+          }
         };
 
         this.socket.onerror = (error) => {
@@ -51,13 +389,20 @@ class TabConnection {
         };
 
         this.socket.onmessage = (event) => {
-          try {
-            const message = JSON.parse(event.data);
+          this.receiveChain = this.receiveChain.then(() => decodeFrame(event.data)).then(message => {
+            if (message.type === 'resyncState') {
+              this.resetState();
+              this.sendState();
+              return;
+            }
+            if (message.type === 'ping') {
+              this.send({ type: 'pong', ping_id: message.ping_id });
+              return;
+            }
             this.handleCommand(message);
-            this.sendState();
-          } catch (error) {
+          }).catch(error => {
             console.error(`Tab ${this.tabId}: Error parsing message:`, error);
-          }
+          });
         };
       } catch (error) {
         console.error(`Tab ${this.tabId}: Connection error:`, error);
@@ -78,60 +423,227 @@ class TabConnection {
 
   handleCommand(message) {
     const tabId = this.tabId; // Store tabId in local variable to avoid 'this' context issues
-    chrome.tabs.sendMessage(tabId, message, () => {
+    const onResponse = (response) => {
+      if (message.type === 'takeScreenshot' && response && response.success) {
+        this.captureScreenshot(response).then(captured => {
+          this.sendResult(message, captured);
+        });
+        return;
+      }
+      this.sendResult(message, response);
+      this.sendState();
+    };
+    chrome.tabs.sendMessage(tabId, message, (response) => {
       if (chrome.runtime.lastError) {
         chrome.scripting.executeScript({
           target: { tabId: tabId },
           files: ['content.js']
         }).then(() => {
-          chrome.tabs.sendMessage(tabId, message, () => {
+          chrome.tabs.sendMessage(tabId, message, (retryResponse) => {
+            if (chrome.runtime.lastError) {
+              onResponse({ success: false, error: chrome.runtime.lastError.message });
+            } else {
+              onResponse(retryResponse);
+            }
           });
+        }).catch(error => {
+          onResponse({ success: false, error: error.message });
         });
+      } else {
+        onResponse(response);
       }
     });
   }
 
+  // Capture the pixels for a takeScreenshot the content script has measured; the
+  // capture is streamed to the server as a transfer by sendResult
+  captureScreenshot(response) {
+    return chrome.tabs.get(this.tabId).then(tab => {
+      if (!tab.active) {
+        throw new Error('Only the active tab of a window can be captured');
+      }
+      return chrome.tabs.captureVisibleTab(tab.windowId, { format: 'png' });
+    }).then(dataUrl => ({
+      success: true,
+      result: { ...response.result, dataUrl }
+    })).catch(error => ({
+      success: false,
+      error: `Screenshot failed: ${error.message}`
+    }));
+  }
+
+  // Queue a message, compressing it when large, behind anything already being sent
+  send(message) {
+    const socket = this.socket;
+    this.sendChain = this.sendChain.then(() => encodeFrame(message)).then(frame => {
+      if (socket && socket.readyState === WebSocket.OPEN) {
+        socket.send(frame);
+      }
+    }).catch(error => {
+      console.error(`Tab ${this.tabId}: Error sending message:`, error);
+    });
+    return this.sendChain;
+  }
+
+  // Queue a message whose payload is raw bytes (sent as a blob frame, not base64)
+  sendBlob(header, bytes) {
+    const socket = this.socket;
+    this.sendChain = this.sendChain.then(() => {
+      if (socket && socket.readyState === WebSocket.OPEN) {
+        socket.send(encodeBlobFrame(header, bytes));
+      }
+    }).catch(error => {
+      console.error(`Tab ${this.tabId}: Error sending blob:`, error);
+    });
+    return this.sendChain;
+  }
+
+  // Queue a large payload as a chunked stream: compressed on the fly and sent in
+  // pieces, pausing while the socket drains so other tabs' frames are not held up
+  sendStream(header, bytes) {
+    const socket = this.socket;
+    const streamId = `${this.tabId}-${Date.now().toString(36)}-${++this.streamCounter}`;
+    this.sendChain = this.sendChain.then(async () => {
+      if (!socket || socket.readyState !== WebSocket.OPEN) {
+        return;
+      }
+      socket.send(JSON.stringify({
+        ...header,
+        type: 'streamStart',
+        stream_id: streamId,
+        size: bytes.length,
+        encoding: 'deflate',
+      }));
+      const reader = new Blob([bytes]).stream().pipeThrough(new CompressionStream('deflate')).getReader();
+      let seq = 0;
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) {
+          break;
+        }
+        for (let offset = 0; offset < value.length; offset += STREAM_CHUNK_SIZE) {
+          while (socket.readyState === WebSocket.OPEN && socket.bufferedAmount > STREAM_HIGH_WATER) {
+            await sleep(10);
+          }
+          if (socket.readyState !== WebSocket.OPEN) {
+            reader.cancel();
+            return;
+          }
+          const chunkHeader = { type: 'streamChunk', stream_id: streamId, seq: seq++ };
+          socket.send(encodeBlobFrame(chunkHeader, value.subarray(offset, offset + STREAM_CHUNK_SIZE)));
+        }
+      }
+      socket.send(JSON.stringify({ type: 'streamEnd', stream_id: streamId, chunks: seq }));
+    }).catch(error => {
+      console.error(`Tab ${this.tabId}: Error streaming ${header.kind}:`, error);
+    });
+    return streamId;
+  }
+
+  // Reply to a server command that is waiting on a result
+  sendResult(message, response) {
+    if (!message.request_id || !this.socket || this.socket.readyState !== WebSocket.OPEN) {
+      return;
+    }
+    const reply = response || { success: false, error: 'No response from content script' };
+    let result = reply.result;
+    // Binary results (image data URLs) are streamed and referenced by transfer ID
+    if (result && typeof result.dataUrl === 'string' && result.dataUrl.startsWith('data:')) {
+      const { dataUrl, ...rest } = result;
+      const { mediaType, bytes } = dataUrlToBytes(dataUrl);
+      const transferId = this.sendStream({ kind: 'transfer', media_type: mediaType }, bytes);
+      result = { ...rest, transfer: { transfer_id: transferId, size: bytes.length, media_type: mediaType } };
+    }
+    // Large extracted tables are streamed as JSONL, one row per line (see mcp-server/src/tables.py)
+    if (result && Array.isArray(result.rows) && result.rows.length > TABLE_INLINE_ROWS) {
+      const { rows, ...rest } = result;
+      const bytes = new TextEncoder().encode(rows.map(row => JSON.stringify(row)).join('\n'));
+      const transferId = this.sendStream({ kind: 'transfer', media_type: 'application/jsonl' }, bytes);
+      result = { ...rest, rows_transfer: { transfer_id: transferId, size: bytes.length, media_type: 'application/jsonl' } };
+    }
+    this.send({
+      type: 'commandResult',
+      request_id: message.request_id,
+      success: reply.success,
+      result: result,
+      error: reply.error,
+    });
+  }
+
   sendState() {
     console.log('Sending state to server');
     const tabId = this.tabId;
-    const socket = this.socket;
-    chrome.tabs.sendMessage(tabId, {
-      type: 'status',
-    }, function(response) {
+    const statusMessage = { type: 'status' };
+    const onStatus = (response) => {
+      if (response && response.success) {
+        this.pushState(response.result.url, response.result.html);
+      }
+    };
+    chrome.tabs.sendMessage(tabId, statusMessage, (response) => {
       if (chrome.runtime.lastError) {
         chrome.scripting.executeScript({
           target: { tabId: tabId },
           files: ['content.js']
         }).then(() => {
-          chrome.tabs.sendMessage(tabId, data, function(response) {
-            if (response.success) {
-              socket.send(JSON.stringify({
-                type: 'updateState',
-                args: [response.result.url, response.result.html],
-              }));
-            }
-          });
+          chrome.tabs.sendMessage(tabId, statusMessage, onStatus);
         }).catch(err => {
         });
       } else {
-        if (response.success) {
-          socket.send(JSON.stringify({
-            type: 'updateState',
-            args: [response.result.url, response.result.html],
-          }));
-        }
+        onStatus(response);
       }
     });
   }
 
-  attemptReconnect() {
+  // Send a patch against the last snapshot the server acknowledged, or a full snapshot
+  pushState(url, html) {
+    const socket = this.socket;
+    if (!socket || socket.readyState !== WebSocket.OPEN) {
+      return;
+    }
+
+    // Nothing changed since the last update (e.g. after changeBackground); skip it entirely
+    if (html === this.lastHtml && url === this.lastUrl) {
+      return;
+    }
+
+    const baseVersion = this.stateVersion;
+    this.stateVersion++;
+    const patch = this.lastHtml === null ? null : diffText(this.lastHtml, html);
+    this.lastHtml = html;
+    this.lastUrl = url;
+
+    if (patch && patchSize(patch) < html.length * MAX_PATCH_RATIO) {
+      this.send({
+        type: 'patchState',
+        args: [url],
+        version: this.stateVersion,
+        base_version: baseVersion,
+        patch: patch,
+      });
+    } else if (html.length >= STREAM_THRESHOLD) {
+      this.sendStream({ kind: 'state', args: [url], version: this.stateVersion }, new TextEncoder().encode(html));
+    } else {
+      this.send({
+        type: 'updateState',
+        args: [url, html],
+        version: this.stateVersion,
+      });
+    }
+  }
+
+  // Server lost track of our snapshot; next update must be a full one
+  resetState() {
+    this.lastHtml = null;
+  }
+
+  attemptReconnect(delay = this.reconnectDelay) {
     if (this.reconnectAttempts < this.maxReconnectAttempts) {
       this.reconnectAttempts++;
       this.reconnectTimer = setTimeout(() => {
         this.connect().catch(error => {
           console.error(`Failed to reconnect WebSocket for tab ${this.tabId}:`, error);
         });
-      }, this.reconnectDelay);
+      }, delay);
     }
   }
 }
@@ -205,10 +205,17 @@ const commands = {
       throw new Error(`Table not found: ${selector}`);
     }
 
-    const headers = Array.from(table.querySelectorAll('th')).map(th => th.textContent.trim());
-    const rows = Array.from(table.querySelectorAll('tr')).map(tr => 
-      Array.from(tr.querySelectorAll('td')).map(td => td.textContent.trim())
-    ).filter(row => row.length > 0);
+    // Header: the first row of <thead>, or else the first row made only of <th> cells
+    const allRows = Array.from(table.querySelectorAll('tr'));
+    const headerRow = allRows.find(tr => tr.parentElement && tr.parentElement.tagName === 'THEAD')
+      || allRows.find(tr => tr.querySelector('th') && !tr.querySelector('td'));
+    const headers = headerRow ? Array.from(headerRow.children).map(cell => cell.textContent.trim()) : [];
+    // Body rows keep row-header <th> cells so columns stay aligned
+    const rows = allRows
+      .filter(tr => tr !== headerRow && tr.querySelector('td'))
+      .map(tr => Array.from(tr.children)
+        .filter(cell => cell.tagName === 'TD' || cell.tagName === 'TH')
+        .map(cell => cell.textContent.trim()));
 
     return {
       headers,
@@ -218,19 +225,25 @@ const commands = {
     };
   },
   'takeScreenshot': async (selector) => {
-    try {
-      // This is a placeholder as actual screenshot functionality requires additional setup
-      if (selector) {
-        const element = document.querySelector(selector);
-        if (!element) {
-          throw new Error(`Element not found: ${selector}`);
-        }
-        return { message: 'Screenshot of element requested', selector };
-      }
-      return { message: 'Full page screenshot requested' };
-    } catch (error) {
-      throw new Error(`Screenshot failed: ${error.message}`);
+    // The background script captures the visible tab; this only reports which
+    // part of the viewport to keep, in CSS pixels (see mcp-server/src/screenshots.py)
+    const viewport = { width: window.innerWidth, height: window.innerHeight };
+    const devicePixelRatio = window.devicePixelRatio;
+    if (!selector) {
+      return { viewport, devicePixelRatio };
     }
+    const element = document.querySelector(selector);
+    if (!element) {
+      throw new Error(`Screenshot failed: Element not found: ${selector}`);
+    }
+    element.scrollIntoView({ block: 'center', inline: 'center', behavior: 'instant' });
+    const rect = element.getBoundingClientRect();
+    return {
+      selector,
+      viewport,
+      devicePixelRatio,
+      clip: { x: rect.left, y: rect.top, width: rect.width, height: rect.height }
+    };
   }
 };
 
@@ -0,0 +1,306 @@
+"""Load test for the websocket bridge using simulated extension clients.
+
+Starts the real FastAPI ``app`` from server.py on a local port, connects
+``--tabs`` simulated tabs that behave like background.js (connect to
+/mcp/{tab_id}, send an updateState snapshot, answer commands with
+commandResult) and measures:
+
+    connect     connection setup rate until every tab received its welcome message
+    state       updateState ingest time and memory per tab
+    commands    send_command round-trip latency and throughput
+    broadcast   time for one broadcast to reach every tab
+
+Results are printed as one JSON document (or written to ``--output``) so runs
+can be compared over time. Everything runs offline on localhost.
+
+Usage:
+    cd mcp-server
+    python benchmarks/bench_bridge.py --tabs 200 --html-size 65536 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Keep the benchmark self-contained: no spill files, no eager indexing noise
+os.environ.setdefault("TAB_SPILL_DIR", "")
+os.environ.setdefault("DOM_INDEX_EAGER", "0")
+# Measure the bridge itself, not the admission limits (set these to benchmark them)
+os.environ.setdefault("TAB_RATE_LIMIT", "0")
+os.environ.setdefault("COMMAND_RATE_LIMITS", "")
+os.environ.setdefault("MAX_CONCURRENT_COMMANDS", "0")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import psutil
+import uvicorn
+import websockets
+
+import server
+from framing import ENCODING_DEFLATE, ENCODING_JSON, decode_binary
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summary statistics in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+
+def make_html(size: int, seed: int) -> str:
+    """A page of roughly ``size`` characters, distinct per tab so bodies are not deduplicated"""
+    row = f"<tr><td class='cell'>tab {seed}</td><td><a href='/item/{seed}'>item</a></td></tr>"
+    rows = row * max(1, size // len(row))
+    return f"<html><head><title>Tab {seed}</title></head><body><table>{rows}</table></body></html>"
+
+
+class SimulatedTab:
+    """Minimal stand-in for a background.js TabConnection"""
+    def __init__(self, url: str, tab_id: str, html: str):
+        self.url = url
+        self.tab_id = tab_id
+        self.html = html
+        self.socket = None
+        self.welcomed = asyncio.Event()
+        self.broadcasts: Dict[str, float] = {}
+        self.broadcast_seen = asyncio.Event()
+        self.expected_broadcast: Optional[str] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        self.socket = await websockets.connect(self.url, max_size=None, compression=None)
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        try:
+            async for frame in self.socket:
+                if isinstance(frame, bytes):
+                    message = decode_binary(frame, 1 << 30)
+                else:
+                    message = json.loads(frame)
+                kind = message.get("type")
+                if kind == "system":
+                    self.welcomed.set()
+                elif kind == "benchBroadcast":
+                    marker = message["args"][0]
+                    self.broadcasts[marker] = time.perf_counter()
+                    if marker == self.expected_broadcast:
+                        self.broadcast_seen.set()
+                elif message.get("request_id"):
+                    # Answer like handleCommand() does
+                    await self.socket.send(json.dumps({
+                        "type": "commandResult",
+                        "request_id": message["request_id"],
+                        "success": True,
+                        "result": {"command": kind}
+                    }))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def send_state(self, version: int = 1) -> None:
+        await self.socket.send(json.dumps({
+            "type": "updateState",
+            "args": [f"https://bench.local/{self.tab_id}", self.html],
+            "version": version
+        }))
+
+    async def close(self) -> None:
+        await self.socket.close()
+        if self._reader is not None:
+            await self._reader
+
+
+async def wait_until(predicate, timeout: float, interval: float = 0.005) -> None:
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Benchmark condition not reached in time")
+        await asyncio.sleep(interval)
+
+
+async def bench_connect(base_url: str, args) -> Tuple[List[SimulatedTab], Dict[str, Any]]:
+    tabs = [
+        SimulatedTab(f"{base_url}/mcp/bench-{i}?encoding={args.encoding}", f"bench-{i}", make_html(args.html_size, i))
+        for i in range(args.tabs)
+    ]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+
+    async def open_tab(tab: SimulatedTab) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await tab.connect()
+            await tab.welcomed.wait()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(open_tab(tab) for tab in tabs))
+    elapsed = time.perf_counter() - started
+    return tabs, {
+        "tabs": len(tabs),
+        "seconds": round(elapsed, 4),
+        "connections_per_second": round(len(tabs) / elapsed, 1),
+        "latency": percentiles(latencies)
+    }
+
+
+async def bench_state(tabs: List[SimulatedTab], args) -> Dict[str, Any]:
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    store_before = server.manager.state_store.stats()["memory_bytes"]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(tab.send_state() for tab in tabs))
+    await wait_until(lambda: all(server.manager.tab_info.get(tab.tab_id, {}).get("hash") for tab in tabs),
+                     args.timeout)
+    elapsed = time.perf_counter() - started
+
+    store_stats = server.manager.state_store.stats()
+    payload = sum(len(tab.html) for tab in tabs)
+    return {
+        "html_size": args.html_size,
+        "seconds": round(elapsed, 4),
+        "updates_per_second": round(len(tabs) / elapsed, 1),
+        "megabytes_per_second": round(payload / elapsed / (1024 * 1024), 2),
+        "store_bytes_per_tab": round((store_stats["memory_bytes"] - store_before) / len(tabs)),
+        "rss_bytes_per_tab": round((process.memory_info().rss - rss_before) / len(tabs)),
+        "store": store_stats
+    }
+
+
+async def bench_commands(tabs: List[SimulatedTab], args) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    failures = 0
+
+    async def one(i: int) -> None:
+        nonlocal failures
+        tab = tabs[i % len(tabs)]
+        async with semaphore:
+            started = time.perf_counter()
+            result = await server.send_command(tab.tab_id, "status", [], timeout=args.timeout)
+            latencies.append(time.perf_counter() - started)
+            if not result.get("success"):
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.commands)))
+    elapsed = time.perf_counter() - started
+    return {
+        "commands": args.commands,
+        "concurrency": args.concurrency,
+        "failures": failures,
+        "seconds": round(elapsed, 4),
+        "commands_per_second": round(args.commands / elapsed, 1),
+        "latency": percentiles(latencies)
+    }
+
+
+async def bench_broadcast(tabs: List[SimulatedTab], args) -> Dict[str, Any]:
+    durations: List[float] = []
+    for round_number in range(args.broadcasts):
+        marker = f"b{round_number}"
+        for tab in tabs:
+            tab.expected_broadcast = marker
+            tab.broadcast_seen.clear()
+        message = server.Message(type="benchBroadcast", args=[marker], sender_id="server").to_json()
+        started = time.perf_counter()
+        await server.manager.broadcast(message)
+        await asyncio.wait_for(asyncio.gather(*(tab.broadcast_seen.wait() for tab in tabs)), args.timeout)
+        durations.append(max(tab.broadcasts[marker] for tab in tabs) - started)
+    return {
+        "rounds": args.broadcasts,
+        "tabs": len(tabs),
+        "fan_out": percentiles(durations)
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    logging.getLogger().setLevel(logging.WARNING)
+    config = uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning",
+                            ws_max_size=1 << 30)
+    uvicorn_server = uvicorn.Server(config)
+    serve_task = asyncio.create_task(uvicorn_server.serve())
+    await wait_until(lambda: uvicorn_server.started, 10)
+    port = uvicorn_server.servers[0].sockets[0].getsockname()[1]
+    base_url = f"ws://127.0.0.1:{port}"
+
+    results: Dict[str, Any] = {
+        "benchmark": "bridge",
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {
+            "tabs": args.tabs,
+            "html_size": args.html_size,
+            "commands": args.commands,
+            "concurrency": args.concurrency,
+            "broadcasts": args.broadcasts,
+            "encoding": args.encoding
+        }
+    }
+    tabs: List[SimulatedTab] = []
+    try:
+        tabs, results["connect"] = await bench_connect(base_url, args)
+        results["state"] = await bench_state(tabs, args)
+        results["commands"] = await bench_commands(tabs, args)
+        results["broadcast"] = await bench_broadcast(tabs, args)
+        results["queues"] = {
+            "dropped": sum(stats["dropped"] for stats in server.manager.get_queue_stats().values()),
+            "max_high_water": max((stats["queue_high_water"]
+                                   for stats in server.manager.get_queue_stats().values()), default=0)
+        }
+    finally:
+        await asyncio.gather(*(tab.close() for tab in tabs if tab.socket is not None), return_exceptions=True)
+        uvicorn_server.should_exit = True
+        await serve_task
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tabs", type=int, default=100, help="Simulated tabs to connect")
+    parser.add_argument("--html-size", type=int, default=32768, help="Characters per updateState snapshot")
+    parser.add_argument("--commands", type=int, default=2000, help="Command round trips to measure")
+    parser.add_argument("--concurrency", type=int, default=64, help="Connections/commands in flight at once")
+    parser.add_argument("--broadcasts", type=int, default=20, help="Broadcast rounds to measure")
+    parser.add_argument("--encoding", choices=(ENCODING_JSON, ENCODING_DEFLATE), default=ENCODING_DEFLATE,
+                        help="Wire encoding the simulated tabs negotiate")
+    parser.add_argument("--port", type=int, default=0, help="Port to listen on (default: any free port)")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds before a phase is considered stuck")
+    parser.add_argument("--output", type=Path, help="Write the JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    document = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(document + "\n")
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
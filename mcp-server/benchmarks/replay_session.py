@@ -0,0 +1,291 @@
+"""Replay a recorded session (MCP_RECORD_DIR) against the server, without a browser.
+
+Starts the real FastAPI ``app`` from server.py on a local port and plays the
+recording back through it:
+
+    - every recorded tab connects to /mcp/{tab_id} with its recorded encoding
+      when its connection opened, and disconnects when it closed
+    - frames the extension sent (updateState, patchState, streams ...) are sent
+      again byte for byte at their recorded offsets
+    - commands the server sent are issued again through send_command() under
+      their original request IDs; the simulated tab answers each with the
+      recorded commandResult after the recorded browser latency
+
+``--speed`` scales time (2 = twice as fast, 0 = as fast as possible, keeping
+order). Results compare command latency and outbound message counts of the
+replay with the recording and are printed as one JSON document (or written
+to ``--output``), like bench_bridge.py.
+
+Usage:
+    cd mcp-server
+    python benchmarks/replay_session.py ~/.mcp-server/recordings/20250101-120000-1234 --speed 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Never record the replay itself, and keep it self-contained
+os.environ["MCP_RECORD_DIR"] = ""
+os.environ.setdefault("TAB_SPILL_DIR", "")
+# Recorded commands are replayed as sent; faster playback must not trip the rate limits
+os.environ.setdefault("TAB_RATE_LIMIT", "0")
+os.environ.setdefault("COMMAND_RATE_LIMITS", "")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import uvicorn
+import websockets
+
+import server
+from bench_bridge import percentiles, wait_until
+from codec import loads
+from framing import FRAME_BLOB, FRAME_DEFLATE, decode_binary
+from recorder import DIRECTION_IN, KIND_BINARY, KIND_CLOSE, KIND_OPEN, Record, SessionReader
+
+
+def decode_frame(record: Record) -> Optional[Dict[str, Any]]:
+    """Decoded message of a recorded text or binary frame, or None if it cannot be decoded"""
+    try:
+        if record.kind == KIND_BINARY and record.payload[:1] in (bytes([FRAME_DEFLATE]), bytes([FRAME_BLOB])):
+            return decode_binary(record.payload, 1 << 30)
+        return loads(record.payload)
+    except ValueError:
+        return None
+
+
+def is_command(message: Optional[Dict[str, Any]]) -> bool:
+    return bool(message and message.get("request_id") and message.get("sender_id") == "server")
+
+
+class Recording:
+    """Commands and replies of a session, paired by request ID (first pass over the log)"""
+    def __init__(self, reader: SessionReader, start: Optional[float], end: Optional[float]):
+        self.replies: Dict[str, Record] = {}
+        self.browser_latency: Dict[str, float] = {}
+        self.command_latency: List[float] = []
+        self.outbound_types: Counter = Counter()
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        self.records = 0
+        sent: Dict[str, float] = {}
+        for record in reader.records(start, end):
+            self.records += 1
+            self.first = record.time if self.first is None else self.first
+            self.last = record.time
+            if record.kind in (KIND_OPEN, KIND_CLOSE):
+                continue
+            message = decode_frame(record)
+            if message is None:
+                continue
+            if record.direction == DIRECTION_IN:
+                request_id = message.get("request_id")
+                if message.get("type") == "commandResult" and request_id in sent:
+                    self.replies[request_id] = record
+                    self.browser_latency[request_id] = record.time - sent[request_id]
+                    self.command_latency.append(record.time - sent[request_id])
+            else:
+                self.outbound_types[message.get("type")] += 1
+                if is_command(message):
+                    sent[message["request_id"]] = record.time
+
+
+class ReplayTab:
+    """Plays one recorded tab: sends its frames and answers replayed commands"""
+    def __init__(self, base_url: str, tab_id: str, encoding: str, recording: Recording, speed: float,
+                 stats: Dict[str, Any]):
+        self.url = f"{base_url}/mcp/{tab_id}?encoding={encoding}"
+        self.tab_id = tab_id
+        self.recording = recording
+        self.speed = speed
+        self.stats = stats
+        self.socket = None
+        self._reader: Optional[asyncio.Task] = None
+        self._replies: set = set()
+
+    async def connect(self) -> None:
+        self.socket = await websockets.connect(self.url, max_size=None, compression=None)
+        self._reader = asyncio.create_task(self._read())
+
+    async def send(self, record: Record) -> None:
+        frame = record.payload if record.kind == KIND_BINARY else record.text()
+        await self.socket.send(frame)
+
+    async def _read(self) -> None:
+        try:
+            async for frame in self.socket:
+                message = decode_binary(frame, 1 << 30) if isinstance(frame, bytes) else loads(frame)
+                self.stats["outbound_types"][message.get("type")] += 1
+                if is_command(message):
+                    task = asyncio.create_task(self._answer(message))
+                    self._replies.add(task)
+                    task.add_done_callback(self._replies.discard)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _answer(self, message: Dict[str, Any]) -> None:
+        request_id = message["request_id"]
+        reply = self.recording.replies.get(request_id)
+        if reply is None:
+            self.stats["unmatched_commands"] += 1
+            await self.socket.send(json.dumps({
+                "type": "commandResult", "request_id": request_id, "success": False,
+                "error": "No recorded reply"
+            }))
+            return
+        if self.speed:
+            await asyncio.sleep(self.recording.browser_latency[request_id] / self.speed)
+        try:
+            await self.send(reply)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def close(self) -> None:
+        if self.socket is not None:
+            await self.socket.close()
+        if self._reader is not None:
+            await self._reader
+
+
+async def replay(reader: SessionReader, recording: Recording, base_url: str, args) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"outbound_types": Counter(), "unmatched_commands": 0}
+    tabs: Dict[str, ReplayTab] = {}
+    commands: List[asyncio.Task] = []
+    pending: Dict[str, List[asyncio.Task]] = {}
+    latencies: List[float] = []
+    failures = 0
+    frames_sent = 0
+
+    async def open_tab(tab_id: str, encoding: str) -> ReplayTab:
+        previous = tabs.pop(tab_id, None)
+        if previous is not None:
+            await previous.close()
+        tab = tabs[tab_id] = ReplayTab(base_url, tab_id, encoding, recording, args.speed, stats)
+        await tab.connect()
+        return tab
+
+    async def issue(message: Dict[str, Any], tab_id: str) -> None:
+        nonlocal failures
+        started = time.perf_counter()
+        result = await server.send_command(tab_id, message["type"], message.get("args") or [],
+                                           timeout=args.timeout, request_id=message["request_id"])
+        latencies.append(time.perf_counter() - started)
+        if not result.get("success") and message["request_id"] in recording.replies:
+            failures += 1
+
+    started = time.perf_counter()
+    for record in reader.records(args.start, args.end):
+        if args.speed:
+            delay = (record.time - recording.first) / args.speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        if record.direction == DIRECTION_IN:
+            if record.kind == KIND_OPEN:
+                await open_tab(record.tab_id, record.text() or "json")
+            elif record.kind == KIND_CLOSE:
+                # Commands answered before the recorded disconnect must be answered in the replay too
+                await asyncio.gather(*pending.pop(record.tab_id, []))
+                tab = tabs.pop(record.tab_id, None)
+                if tab is not None:
+                    await tab.close()
+            else:
+                message = decode_frame(record)
+                if message is not None and message.get("type") == "commandResult":
+                    # Answered by ReplayTab when the replayed command arrives
+                    continue
+                tab = tabs.get(record.tab_id) or await open_tab(record.tab_id, "deflate")
+                await tab.send(record)
+                frames_sent += 1
+        elif record.kind not in (KIND_OPEN, KIND_CLOSE):
+            message = decode_frame(record)
+            if is_command(message) and record.tab_id in tabs:
+                task = asyncio.create_task(issue(message, record.tab_id))
+                commands.append(task)
+                pending.setdefault(record.tab_id, []).append(task)
+
+    await asyncio.gather(*commands)
+    elapsed = time.perf_counter() - started
+    # Let trailing outbound frames arrive before counting them
+    await asyncio.sleep(0.2)
+    await asyncio.gather(*(tab.close() for tab in tabs.values()), return_exceptions=True)
+
+    return {
+        "seconds": round(elapsed, 4),
+        "frames_sent": frames_sent,
+        "commands": len(commands),
+        "command_failures": failures,
+        "unmatched_commands": stats["unmatched_commands"],
+        "command_latency": percentiles(latencies),
+        "outbound_types": dict(stats["outbound_types"])
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    logging.getLogger().setLevel(logging.WARNING)
+    reader = SessionReader(args.session)
+    recording = Recording(reader, args.start, args.end)
+    if recording.first is None:
+        raise SystemExit("No records in the selected range")
+
+    config = uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning",
+                            ws_max_size=1 << 30)
+    uvicorn_server = uvicorn.Server(config)
+    serve_task = asyncio.create_task(uvicorn_server.serve())
+    await wait_until(lambda: uvicorn_server.started, 10)
+    port = uvicorn_server.servers[0].sockets[0].getsockname()[1]
+    try:
+        replayed = await replay(reader, recording, f"ws://127.0.0.1:{port}", args)
+    finally:
+        uvicorn_server.should_exit = True
+        await serve_task
+
+    return {
+        "benchmark": "replay",
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "session": str(args.session),
+        "speed": args.speed,
+        "recorded": {
+            "records": recording.records,
+            "seconds": round(recording.last - recording.first, 4),
+            "commands": len(recording.command_latency),
+            "command_latency": percentiles(recording.command_latency),
+            "outbound_types": dict(recording.outbound_types)
+        },
+        "replay": replayed
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("session", type=Path, help="Session directory written by the recorder")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Playback speed factor; 0 replays as fast as possible")
+    parser.add_argument("--start", type=float, help="Only replay records at or after this epoch time")
+    parser.add_argument("--end", type=float, help="Only replay records up to this epoch time")
+    parser.add_argument("--port", type=int, default=0, help="Port to listen on (default: any free port)")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for each replayed command")
+    parser.add_argument("--output", type=Path, help="Write the JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    document = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(document + "\n")
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Admission control for browser commands.
+
+Two layers keep a runaway agent loop from flooding tabs and the server:
+
+    rate limits   token buckets per tab (all commands) and per tab and
+                  command type (navigateTo, reload ...). Every command is
+                  charged to its command type's bucket, including each step
+                  of a pipeline, macro or batch; the tab bucket is charged
+                  once per tool call, so long flows do not throttle
+                  themselves on the tab limit. A command over either limit
+                  is rejected right away with a retry hint; it never queues.
+    concurrency   at most ``max_concurrent`` commands await browser replies
+                  across all tabs. Further commands wait in FIFO order, at
+                  most ``max_queue`` of them for at most ``queue_timeout``
+                  seconds, and anything beyond that is shed.
+
+Both raise Throttled, which tools return to the agent as
+{"success": false, "throttled": true, "retry_after": seconds, ...}. Failing
+fast keeps latency predictable under bursts: a command either runs soon or
+is turned away, instead of piling up behind others (and behind the
+updateState traffic every navigation triggers).
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+REASON_TAB_RATE = "tab_rate"
+REASON_COMMAND_RATE = "command_rate"
+REASON_OVERLOADED = "overloaded"
+
+# Retry hint for shed commands; the queue drains at the browsers' pace, not a known rate
+SHED_RETRY_AFTER = 1.0
+
+# Buckets kept before idle ones are dropped; a bucket that refilled to its burst
+# behaves exactly like a new one, so dropping it only frees memory
+PRUNE_BUCKETS = 1024
+
+
+class Throttled(Exception):
+    """A command was not admitted; retry after ``retry_after`` seconds"""
+    def __init__(self, message: str, reason: str, retry_after: float):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``; one token per command"""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "navigateTo=1/5,reload=0.5" into {command: (rate per second, burst)}
+
+    The burst defaults to the rate (at least 1).
+
+    Raises:
+        ValueError: If an entry is malformed or a rate is not positive
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        command, separator, value = entry.partition("=")
+        if not separator or not command.strip():
+            raise ValueError(f"Expected command=rate[/burst], got {entry!r}")
+        rate, _, burst = value.partition("/")
+        rate = float(rate)
+        if rate <= 0:
+            raise ValueError(f"Rate for {command.strip()} must be positive")
+        limits[command.strip()] = (rate, float(burst) if burst else rate)
+    return limits
+
+
+class RateLimiter:
+    """Token buckets per tab and per (tab, command type)
+
+    Args:
+        tab_rate: Commands per second each tab accepts (0: no per-tab limit)
+        tab_burst: Commands a tab accepts at once after being idle
+        command_limits: Command type -> (rate, burst), applied per tab on top of the tab limit
+    """
+    def __init__(self, tab_rate: float, tab_burst: float, command_limits: Dict[str, Tuple[float, float]]):
+        self.tab_rate = tab_rate
+        self.tab_burst = tab_burst
+        self.command_limits = command_limits
+        self._tabs: Dict[str, TokenBucket] = {}
+        self._commands: Dict[Tuple[str, str], TokenBucket] = {}
+        self.throttled = {REASON_TAB_RATE: 0, REASON_COMMAND_RATE: 0}
+
+    def check(self, tab_id: str, command: Optional[str] = None, tab: bool = True) -> None:
+        """Take one token from the bucket of ``command`` and, if ``tab``, one from the tab's bucket
+
+        Nothing is charged unless every bucket has a token. Callers should
+        only pass connected tabs: each new tab ID gets its own buckets.
+
+        Raises:
+            Throttled: If the tab or the command type is over its limit
+        """
+        now = time.monotonic()
+        command_bucket = None
+        limit = self.command_limits.get(command) if command is not None else None
+        if limit is not None:
+            command_bucket = self._commands.get((tab_id, command))
+            if command_bucket is None:
+                command_bucket = self._commands[(tab_id, command)] = TokenBucket(*limit, now)
+        tab_bucket = None
+        if tab and self.tab_rate > 0:
+            tab_bucket = self._tabs.get(tab_id)
+            if tab_bucket is None:
+                tab_bucket = self._tabs[tab_id] = TokenBucket(self.tab_rate, self.tab_burst, now)
+
+        if command_bucket is not None:
+            wait = command_bucket.wait_time(now)
+            if wait > 0:
+                self.throttled[REASON_COMMAND_RATE] += 1
+                raise Throttled(
+                    f"Too many {command} commands for tab {tab_id} "
+                    f"(limit {command_bucket.rate:g}/s); retry in {wait:.2f}s",
+                    REASON_COMMAND_RATE, wait
+                )
+        if tab_bucket is not None:
+            wait = tab_bucket.wait_time(now)
+            if wait > 0:
+                self.throttled[REASON_TAB_RATE] += 1
+                raise Throttled(
+                    f"Too many commands for tab {tab_id} (limit {self.tab_rate:g}/s); retry in {wait:.2f}s",
+                    REASON_TAB_RATE, wait
+                )
+            tab_bucket.take()
+        if command_bucket is not None:
+            command_bucket.take()
+        if len(self._tabs) + len(self._commands) > PRUNE_BUCKETS:
+            self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        """Drop buckets that refilled, e.g. of tabs held by other workers that went away"""
+        for buckets in (self._tabs, self._commands):
+            for key in [key for key, bucket in buckets.items() if bucket.full(now)]:
+                del buckets[key]
+
+    def forget(self, tab_id: str) -> None:
+        """Drop a disconnected tab's buckets"""
+        self._tabs.pop(tab_id, None)
+        for key in [key for key in self._commands if key[0] == tab_id]:
+            del self._commands[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tab_rate": self.tab_rate,
+            "tab_burst": self.tab_burst,
+            "command_limits": {command: {"rate": rate, "burst": burst}
+                               for command, (rate, burst) in self.command_limits.items()},
+            "buckets": len(self._tabs) + len(self._commands),
+            "throttled": dict(self.throttled)
+        }
+
+
+class ConcurrencyLimiter:
+    """Cap on commands awaiting replies across all tabs, with a bounded FIFO queue
+
+    Args:
+        max_concurrent: Commands allowed in flight at once (0: unlimited)
+        max_queue: Commands allowed to wait for a slot; more are shed
+        queue_timeout: Seconds a command may wait for a slot before it is shed
+    """
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.peak = 0
+        self.queued_total = 0
+        self.shed = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+
+    async def acquire(self) -> None:
+        """Wait for a slot
+
+        Raises:
+            Throttled: If the queue is full or no slot frees up within ``queue_timeout``
+        """
+        if self.max_concurrent <= 0:
+            return
+        if self.active < self.max_concurrent and not self._waiters:
+            self._admit()
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise Throttled(
+                f"Server busy: {self.active} commands running and {len(self._waiters)} queued",
+                REASON_OVERLOADED, SHED_RETRY_AFTER
+            )
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued_total += 1
+        try:
+            # Shielded so a slot handed over at the deadline is never lost
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return
+            waiter.cancel()
+            self._discard(waiter)
+            self.shed += 1
+            raise Throttled(
+                f"Server busy: no command slot within {self.queue_timeout:g}s",
+                REASON_OVERLOADED, SHED_RETRY_AFTER
+            ) from None
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release()
+            else:
+                waiter.cancel()
+                self._discard(waiter)
+            raise
+
+    def release(self) -> None:
+        """Free a slot, handing it straight to the longest-waiting command if any"""
+        if self.max_concurrent <= 0:
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _admit(self) -> None:
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "peak": self.peak,
+            "queued": len(self._waiters),
+            "max_queue": self.max_queue,
+            "queued_total": self.queued_total,
+            "shed": self.shed
+        }
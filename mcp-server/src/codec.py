@@ -0,0 +1,117 @@
+"""JSON encoding and inbound message validation for the websocket hot path.
+
+Uses orjson when it is installed (``pip install mcp-server[fast]``) and the
+standard library otherwise; both produce compact JSON. Parse errors raise
+json.JSONDecodeError either way (orjson's error is a subclass).
+
+Inbound messages of the types the server acts on are checked against a
+small field table before they are handled, so a malformed frame is answered
+with an error message instead of failing deep inside a handler.
+"""
+import json
+from typing import Any, Dict, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_NONE = type(None)
+
+
+class MessageError(ValueError):
+    """An inbound message does not match the schema of its type"""
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(value: Any) -> str:
+        try:
+            return orjson.dumps(value, option=_ORJSON_OPTIONS).decode("utf-8")
+        except TypeError:
+            # Integers beyond 64 bits and other types orjson rejects
+            return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+    def dumps(value: Any) -> str:
+        return _encoder.encode(value)
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+# Field name -> (accepted types, required) for every inbound type the server handles
+INBOUND_SCHEMAS: Dict[str, Dict[str, Tuple[Tuple[type, ...], bool]]] = {
+    "updateState": {
+        "args": ((list,), True),
+        "version": ((int, _NONE), False),
+    },
+    "patchState": {
+        "args": ((list,), True),
+        "base_version": ((int, _NONE), False),
+        "version": ((int, _NONE), False),
+        "patch": ((list, _NONE), False),
+    },
+    "commandResult": {
+        "request_id": ((str,), True),
+        "success": ((bool, _NONE), False),
+        "error": ((str, _NONE), False),
+    },
+    "streamStart": {
+        "stream_id": ((str,), True),
+        "kind": ((str,), True),
+        "size": ((int, _NONE), False),
+        "encoding": ((str,), False),
+    },
+    "streamChunk": {
+        "stream_id": ((str,), True),
+        "seq": ((int,), True),
+        "blob": ((bytes,), True),
+    },
+    "streamEnd": {
+        "stream_id": ((str,), True),
+        "chunks": ((int, _NONE), False),
+    },
+    "error": {
+        "args": ((list, _NONE), False),
+    },
+    "pong": {
+        "ping_id": ((str,), True),
+    },
+}
+
+
+def validate_inbound(message: Any) -> Dict[str, Any]:
+    """Check a decoded inbound message; types without a schema pass through
+
+    Raises:
+        MessageError: If the message is not an object with a string type, or a
+            field of a known type is missing or has the wrong type
+    """
+    if not isinstance(message, dict):
+        raise MessageError("Message must be a JSON object")
+    message_type = message.get("type")
+    if not isinstance(message_type, str):
+        raise MessageError("Message needs a string type")
+    schema = INBOUND_SCHEMAS.get(message_type)
+    if schema is None:
+        return message
+    for name, (types, required) in schema.items():
+        if name not in message:
+            if required:
+                raise MessageError(f"{message_type} is missing {name}")
+            continue
+        if not isinstance(message[name], types):
+            raise MessageError(f"{message_type}.{name} has the wrong type")
+    if message_type == "updateState":
+        args = message["args"]
+        if len(args) < 2 or not isinstance(args[0], (str, _NONE)) or not isinstance(args[1], str):
+            raise MessageError("updateState args must be [url, html]")
+    return message
@@ -0,0 +1,443 @@
+import html
+import re
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+# Elements that never have children or an end tag
+VOID_ELEMENTS = frozenset({
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+    "param", "source", "track", "wbr"
+})
+# Elements whose text is not escaped when serialized
+RAW_TEXT_ELEMENTS = frozenset({"script", "style"})
+# Opening one of these closes an unterminated sibling listed for it
+AUTO_CLOSE = {
+    "p": frozenset({"p"}),
+    "li": frozenset({"li"}),
+    "option": frozenset({"option"}),
+    "tr": frozenset({"tr", "td", "th"}),
+    "td": frozenset({"td", "th"}),
+    "th": frozenset({"td", "th"}),
+    "dt": frozenset({"dt", "dd"}),
+    "dd": frozenset({"dt", "dd"}),
+}
+# An unterminated <p> ends where a block element starts
+_CLOSES_ON_BLOCK = frozenset({"p"})
+# Never part of the visible text
+HIDDEN_ELEMENTS = frozenset({"script", "style", "noscript", "template", "head", "svg", "iframe"})
+# Page chrome skipped by readable extraction
+BOILERPLATE_ELEMENTS = frozenset({"nav", "header", "footer", "aside", "form", "button"})
+# Elements rendered as their own line(s) in extracted text
+BLOCK_ELEMENTS = frozenset({
+    "address", "article", "blockquote", "body", "br", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+    "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "tr", "ul"
+})
+# Approximate memory a DomIndex takes per character of its HTML source; nodes,
+# attribute dicts and index lists of markup-dense pages measure about 20 bytes
+INDEX_BYTES_PER_CHAR = 20
+
+
+class Node:
+    """Element in a parsed page; text is stored as plain strings in ``children``"""
+    __slots__ = ("tag", "attrs", "children", "parent")
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["Node"] = None):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: List[Union["Node", str]] = []
+        self.parent = parent
+
+    @property
+    def classes(self) -> List[str]:
+        return self.attrs.get("class", "").split()
+
+    def iter_elements(self) -> Iterator["Node"]:
+        """Yield descendant elements in document order"""
+        stack = [child for child in reversed(self.children) if isinstance(child, Node)]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(child for child in reversed(node.children) if isinstance(child, Node))
+
+
+class _TreeBuilder(HTMLParser):
+    """Build a Node tree from serialized HTML such as document.outerHTML"""
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#document", {})
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        closes = AUTO_CLOSE.get(tag)
+        if closes is None and tag in BLOCK_ELEMENTS:
+            closes = _CLOSES_ON_BLOCK
+        while closes and len(self.stack) > 1 and self.stack[-1].tag in closes:
+            self.stack.pop()
+        parent = self.stack[-1]
+        node = Node(tag, {name: value or "" for name, value in attrs}, parent)
+        parent.children.append(node)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        parent = self.stack[-1]
+        parent.children.append(Node(tag, {name: value or "" for name, value in attrs}, parent))
+
+    def handle_endtag(self, tag):
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index].tag == tag:
+                del self.stack[index:]
+                return
+
+    def handle_data(self, data):
+        children = self.stack[-1].children
+        if children and isinstance(children[-1], str):
+            children[-1] += data
+        else:
+            children.append(data)
+
+
+def parse_html(source: str) -> Node:
+    """Parse an HTML document into a Node tree rooted at a #document node"""
+    builder = _TreeBuilder()
+    builder.feed(source)
+    builder.close()
+    return builder.root
+
+
+def outer_html(node: Node) -> str:
+    """Serialize a node and its subtree back to HTML"""
+    parts: List[str] = []
+    _serialize(node, parts, raw=False)
+    return "".join(parts)
+
+
+def _serialize(node: Node, parts: List[str], raw: bool) -> None:
+    attrs = "".join(f' {name}="{html.escape(value)}"' for name, value in node.attrs.items())
+    parts.append(f"<{node.tag}{attrs}>")
+    if node.tag in VOID_ELEMENTS:
+        return
+    raw = raw or node.tag in RAW_TEXT_ELEMENTS
+    for child in node.children:
+        if isinstance(child, Node):
+            _serialize(child, parts, raw)
+        else:
+            parts.append(child if raw else html.escape(child, quote=False))
+    parts.append(f"</{node.tag}>")
+
+
+def text_content(node: Node) -> str:
+    """Concatenated text of a node's subtree, whitespace collapsed"""
+    parts: List[str] = []
+    stack: List[Union[Node, str]] = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+        elif item.tag not in HIDDEN_ELEMENTS or item is node:
+            stack.extend(reversed(item.children))
+    return " ".join("".join(parts).split())
+
+
+def extract_text(root: Node, readable: bool = False) -> str:
+    """Visible text of a page with one line per block element.
+
+    With ``readable`` set, extraction starts at the page's <main> or <article>
+    when present and skips navigation, headers, footers and other page chrome.
+    """
+    start = root
+    skip = HIDDEN_ELEMENTS
+    if readable:
+        skip = HIDDEN_ELEMENTS | BOILERPLATE_ELEMENTS
+        for node in root.iter_elements():
+            if node.tag in ("main", "article"):
+                start = node
+                break
+
+    lines: List[str] = []
+    current: List[str] = []
+
+    def flush():
+        line = " ".join("".join(current).split())
+        if line:
+            lines.append(line)
+        current.clear()
+
+    # Walk with explicit enter/exit markers so block boundaries become line breaks
+    stack: List[Tuple[bool, Union[Node, str]]] = [(False, start)]
+    while stack:
+        exiting, item = stack.pop()
+        if isinstance(item, str):
+            current.append(item)
+            continue
+        if item.tag in BLOCK_ELEMENTS:
+            flush()
+        if exiting or (item.tag in skip and item is not start):
+            continue
+        stack.append((True, item))
+        stack.extend((False, child) for child in reversed(item.children))
+    flush()
+    return "\n".join(lines)
+
+
+# --- CSS selectors -------------------------------------------------------------
+
+_TOKEN = re.compile(r"""
+    \s*(?P<combinator>[>+~,])\s*
+  | (?P<space>\s+)
+  | (?P<tag>\*|[a-zA-Z][\w-]*)
+  | \#(?P<id>[\w-]+)
+  | \.(?P<cls>[\w-]+)
+  | \[\s*(?P<attr>[\w:-]+)\s*(?:(?P<op>[~^$*|]?=)\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[^\]\s]+))\s*)?\]
+""", re.VERBOSE)
+
+
+class Compound:
+    """One compound selector such as ``a.external[href^="http"]``"""
+    __slots__ = ("tag", "id", "classes", "attrs")
+
+    def __init__(self):
+        self.tag: Optional[str] = None
+        self.id: Optional[str] = None
+        self.classes: List[str] = []
+        self.attrs: List[Tuple[str, Optional[str], Optional[str]]] = []
+
+    def matches(self, node: Node) -> bool:
+        if self.tag is not None and node.tag != self.tag:
+            return False
+        if self.id is not None and node.attrs.get("id") != self.id:
+            return False
+        if self.classes:
+            node_classes = node.classes
+            if any(cls not in node_classes for cls in self.classes):
+                return False
+        for name, op, value in self.attrs:
+            actual = node.attrs.get(name)
+            if actual is None or not _attr_matches(actual, op, value):
+                return False
+        return True
+
+
+def _attr_matches(actual: str, op: Optional[str], value: Optional[str]) -> bool:
+    if op is None:
+        return True
+    if op == "=":
+        return actual == value
+    if op == "~=":
+        return value in actual.split()
+    if op == "^=":
+        return bool(value) and actual.startswith(value)
+    if op == "$=":
+        return bool(value) and actual.endswith(value)
+    if op == "*=":
+        return bool(value) and value in actual
+    if op == "|=":
+        return actual == value or actual.startswith(value + "-")
+    return False
+
+
+# A selector is a list of (combinator, compound) steps, left to right;
+# the first step's combinator is always None
+Selector = List[Tuple[Optional[str], Compound]]
+
+
+def parse_selector(selector: str) -> List[Selector]:
+    """Parse a comma-separated selector list.
+
+    Supports type, universal, #id, .class and [attr] / [attr op value] simple
+    selectors combined with descendant, ``>``, ``+`` and ``~`` combinators.
+
+    Raises:
+        ValueError: If the selector uses unsupported syntax
+    """
+    groups: List[Selector] = []
+    steps: Selector = []
+    compound: Optional[Compound] = None
+    pending: Optional[str] = None
+    position = 0
+    selector = selector.strip()
+
+    def finish_compound():
+        nonlocal compound, pending
+        if compound is not None:
+            steps.append((pending if steps else None, compound))
+            compound, pending = None, None
+
+    while position < len(selector):
+        match = _TOKEN.match(selector, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Unsupported selector syntax at {selector[position:]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        if kind in ("combinator", "space"):
+            combinator = match.group("combinator") or " "
+            finish_compound()
+            if combinator == ",":
+                if not steps:
+                    raise ValueError(f"Empty selector in {selector!r}")
+                groups.append(steps)
+                steps = []
+            elif combinator != " " or pending is None:
+                if not steps:
+                    raise ValueError(f"Selector cannot start with {combinator!r}")
+                pending = combinator
+            continue
+
+        if compound is None:
+            compound = Compound()
+        if kind == "tag":
+            compound.tag = None if match.group("tag") == "*" else match.group("tag").lower()
+        elif kind == "id":
+            compound.id = match.group("id")
+        elif kind == "cls":
+            compound.classes.append(match.group("cls"))
+        else:
+            value = next((v for v in (match.group("dq"), match.group("sq"), match.group("bare")) if v is not None), None)
+            compound.attrs.append((match.group("attr").lower(), match.group("op"), value))
+
+    finish_compound()
+    if pending is not None or not steps:
+        raise ValueError(f"Incomplete selector: {selector!r}")
+    groups.append(steps)
+    return groups
+
+
+def _previous_siblings(node: Node) -> Iterator[Node]:
+    if node.parent is None:
+        return
+    siblings = [child for child in node.parent.children if isinstance(child, Node)]
+    index = next(i for i, child in enumerate(siblings) if child is node)
+    for sibling in reversed(siblings[:index]):
+        yield sibling
+
+
+def matches(node: Node, selector: Selector, index: Optional[int] = None) -> bool:
+    """Check whether a node matches a parsed selector, evaluating right to left"""
+    if index is None:
+        index = len(selector) - 1
+    combinator, compound = selector[index]
+    if not compound.matches(node):
+        return False
+    if index == 0:
+        return True
+
+    if combinator == ">":
+        parent = node.parent
+        return parent is not None and parent.tag != "#document" and matches(parent, selector, index - 1)
+    if combinator == "+":
+        previous = next(_previous_siblings(node), None)
+        return previous is not None and matches(previous, selector, index - 1)
+    if combinator == "~":
+        return any(matches(sibling, selector, index - 1) for sibling in _previous_siblings(node))
+    ancestor = node.parent
+    while ancestor is not None and ancestor.tag != "#document":
+        if matches(ancestor, selector, index - 1):
+            return True
+        ancestor = ancestor.parent
+    return False
+
+
+def select(root: Node, selector: str, limit: Optional[int] = None) -> List[Node]:
+    """Return elements under ``root`` matching a CSS selector, in document order"""
+    groups = parse_selector(selector)
+    results: List[Node] = []
+    for node in root.iter_elements():
+        if any(matches(node, group) for group in groups):
+            results.append(node)
+            if limit is not None and len(results) >= limit:
+                break
+    return results
+
+
+class DomIndex:
+    """Parsed page with id, class and tag indexes for fast selector queries
+
+    A query starts from the smallest candidate set the rightmost compound
+    selector allows (an id, the rarest class, or a tag) and only runs full
+    matching on those candidates.
+    """
+    def __init__(self, root: Node, source_length: int = 0):
+        self.root = root
+        # Rough memory footprint, used to bound caches holding indexes
+        self.approximate_size = INDEX_BYTES_PER_CHAR * source_length
+        self.by_id: Dict[str, List[Node]] = {}
+        self.by_class: Dict[str, List[Node]] = {}
+        self.by_tag: Dict[str, List[Node]] = {}
+        self.elements: List[Node] = []
+        # Document position of each element, keyed by id(node)
+        self._position: Dict[int, int] = {}
+
+        for position, node in enumerate(root.iter_elements()):
+            self.elements.append(node)
+            self._position[id(node)] = position
+            self.by_tag.setdefault(node.tag, []).append(node)
+            element_id = node.attrs.get("id")
+            if element_id:
+                self.by_id.setdefault(element_id, []).append(node)
+            for cls in node.classes:
+                self.by_class.setdefault(cls, []).append(node)
+
+    @classmethod
+    def from_html(cls, source: str) -> "DomIndex":
+        return cls(parse_html(source), len(source))
+
+    def _candidates(self, compound: Compound) -> List[Node]:
+        if compound.id is not None:
+            return self.by_id.get(compound.id, [])
+        if compound.classes:
+            return min((self.by_class.get(cls, []) for cls in compound.classes), key=len)
+        if compound.tag is not None:
+            return self.by_tag.get(compound.tag, [])
+        return self.elements
+
+    def _scoped_candidates(self, group: Selector) -> Iterator[Node]:
+        """Candidates for a selector group, narrowed to the subtree of an #id ancestor when possible"""
+        candidates = self._candidates(group[-1][1])
+        for index in range(len(group) - 2, -1, -1):
+            if group[index + 1][0] not in (" ", ">"):
+                break
+            scope_id = group[index][1].id
+            if scope_id is not None:
+                scopes = self.by_id.get(scope_id, [])
+                scoped = [node for scope in scopes for node in scope.iter_elements()]
+                if len(scoped) < len(candidates):
+                    return iter(scoped)
+                break
+        return iter(candidates)
+
+    def select(self, selector: str, limit: Optional[int] = None) -> List[Node]:
+        """Return elements matching a CSS selector, in document order"""
+        groups = parse_selector(selector)
+        found: Dict[int, Node] = {}
+        for group in groups:
+            for node in self._scoped_candidates(group):
+                if id(node) not in found and matches(node, group):
+                    found[id(node)] = node
+        results = sorted(found.values(), key=lambda node: self._position[id(node)])
+        return results if limit is None else results[:limit]
+
+
+def describe(node: Node, fields: List[str]) -> Dict[str, object]:
+    """Pick the requested fields of an element.
+
+    Known fields are tag, id, class, text, html and attrs; any other name is
+    read as an attribute (e.g. "href", "src", "content").
+    """
+    result: Dict[str, object] = {}
+    for field in fields:
+        if field == "tag":
+            result["tag"] = node.tag
+        elif field == "id":
+            result["id"] = node.attrs.get("id")
+        elif field == "class":
+            result["class"] = node.classes
+        elif field == "text":
+            result["text"] = text_content(node)
+        elif field == "html":
+            result["html"] = outer_html(node)
+        elif field == "attrs":
+            result["attrs"] = dict(node.attrs)
+        else:
+            result[field] = node.attrs.get(field)
+    return result
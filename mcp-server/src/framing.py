@@ -0,0 +1,141 @@
+"""Websocket framing for the /mcp/{tab_id} endpoint.
+
+Text frames always carry plain JSON. A tab that connects with
+``?encoding=deflate`` may also exchange binary frames whose first byte selects
+the layout:
+
+    0x01 | zlib(JSON)                                  compressed message
+    0x02 | u32 header length | JSON header | raw bytes  message with a binary blob
+    0x03 | u8 channel length | channel | inner frame    message for one tab on /mcp-mux
+
+The zlib format matches the browser's ``CompressionStream('deflate')``, so the
+extension needs no extra libraries. Blob frames carry screenshots and other
+binary payloads without base64 inflation; the decoded message exposes the raw
+bytes under the ``blob`` key.
+Payloads too large for one frame are sent as chunked streams whose chunks
+are blob frames (see streams.py).
+
+On the multiplexed ``/mcp-mux`` endpoint every frame is a binary 0x03 frame
+whose channel is the tab ID. The inner frame is either UTF-8 JSON text or a
+0x01 / 0x02 frame as above; a JSON inner frame always starts with ``{`` so the
+two cannot be confused.
+"""
+import struct
+import zlib
+from typing import Any, Dict, Tuple, Union
+
+from codec import dumps, loads
+
+ENCODING_JSON = "json"
+ENCODING_DEFLATE = "deflate"
+ENCODINGS = (ENCODING_JSON, ENCODING_DEFLATE)
+
+FRAME_DEFLATE = 0x01
+FRAME_BLOB = 0x02
+FRAME_CHANNEL = 0x03
+
+_HEADER_LENGTH = struct.Struct(">I")
+
+
+class FrameError(ValueError):
+    """Raised when a binary frame cannot be decoded"""
+
+
+def encode_message(message: str, encoding: str, threshold: int) -> Union[str, bytes]:
+    """Encode an outgoing JSON message for a tab's negotiated encoding.
+
+    Messages shorter than ``threshold`` characters stay as text frames since
+    compressing them costs more than it saves.
+    """
+    if encoding == ENCODING_DEFLATE and len(message) >= threshold:
+        return bytes([FRAME_DEFLATE]) + zlib.compress(message.encode("utf-8"), 6)
+    return message
+
+
+def encode_blob(header: Dict[str, Any], blob: bytes) -> bytes:
+    """Build a blob frame from a JSON header and raw bytes"""
+    header_bytes = dumps(header).encode("utf-8")
+    return bytes([FRAME_BLOB]) + _HEADER_LENGTH.pack(len(header_bytes)) + header_bytes + blob
+
+
+def decode_binary(data: bytes, max_size: int) -> Dict[str, Any]:
+    """Decode a binary frame into a message dict.
+
+    Raises:
+        FrameError: If the frame is malformed or inflates beyond ``max_size``
+    """
+    if not data:
+        raise FrameError("Empty binary frame")
+
+    kind = data[0]
+    if kind == FRAME_DEFLATE:
+        inflater = zlib.decompressobj()
+        try:
+            payload = inflater.decompress(memoryview(data)[1:], max_size)
+        except zlib.error as e:
+            raise FrameError(f"Invalid compressed frame: {e}") from e
+        if inflater.unconsumed_tail:
+            raise FrameError(f"Compressed frame exceeds {max_size} bytes")
+        message = loads(payload)
+        if not isinstance(message, dict):
+            raise FrameError("Compressed message must be a JSON object")
+        return message
+
+    if kind == FRAME_BLOB:
+        if len(data) < 1 + _HEADER_LENGTH.size:
+            raise FrameError("Truncated blob frame")
+        (header_length,) = _HEADER_LENGTH.unpack_from(data, 1)
+        body_start = 1 + _HEADER_LENGTH.size + header_length
+        if body_start > len(data):
+            raise FrameError("Truncated blob header")
+        message = loads(data[1 + _HEADER_LENGTH.size:body_start])
+        if not isinstance(message, dict):
+            raise FrameError("Blob header must be a JSON object")
+        message["blob"] = data[body_start:]
+        return message
+
+    raise FrameError(f"Unknown frame type: {kind:#x}")
+
+
+def encode_channel_frame(channel: str, frame: Union[str, bytes]) -> bytes:
+    """Tag an encoded frame (text or binary) with the tab channel it belongs to"""
+    channel_bytes = channel.encode("utf-8")
+    if len(channel_bytes) > 255:
+        raise FrameError(f"Channel name too long: {channel[:32]}...")
+    inner = frame.encode("utf-8") if isinstance(frame, str) else frame
+    return bytes([FRAME_CHANNEL, len(channel_bytes)]) + channel_bytes + inner
+
+
+def split_channel_frame(data: bytes) -> Tuple[str, bytes]:
+    """Split a channel frame into its channel and the still encoded inner frame
+
+    Raises:
+        FrameError: If the frame is not a well-formed channel frame
+    """
+    if len(data) < 2 or data[0] != FRAME_CHANNEL:
+        raise FrameError("Expected a channel frame")
+    inner_start = 2 + data[1]
+    if inner_start >= len(data):
+        raise FrameError("Truncated channel frame")
+    try:
+        channel = data[2:inner_start].decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise FrameError(f"Invalid channel name: {e}") from e
+    return channel, data[inner_start:]
+
+
+def decode_channel_frame(data: bytes, max_size: int) -> Tuple[str, Dict[str, Any]]:
+    """Split a channel frame into its channel and decoded message.
+
+    Raises:
+        FrameError: If the frame is not a well-formed channel frame
+    """
+    channel, inner = split_channel_frame(data)
+    if inner[0] in (FRAME_DEFLATE, FRAME_BLOB):
+        return channel, decode_binary(inner, max_size)
+    if len(inner) > max_size:
+        raise FrameError(f"Channel frame exceeds {max_size} bytes")
+    message = loads(inner)
+    if not isinstance(message, dict):
+        raise FrameError("Channel message must be a JSON object")
+    return channel, message
@@ -0,0 +1,185 @@
+"""Server-driven liveness checks for tab connections.
+
+A tab that stops sending (a suspended or closed Chrome tab behind a
+half-open socket) is never reported by the socket itself. Every tab is
+pinged once it has been silent for ``interval`` seconds:
+
+    server -> tab   {"type": "ping", "sender_id": "server", "ping_id": id}
+    tab -> server   {"type": "pong", "ping_id": id}
+
+Any inbound message counts as a sign of life, a matching pong also measures
+the round trip, and a tab silent for ``timeout`` seconds is handed to
+``on_dead`` to be disconnected.
+
+Deadlines live in one min-heap checked by a single task. Touching a tab only
+updates its last-seen time; its heap entry is re-pushed with the real
+deadline when it comes due, so the per-message cost is O(1) and a check is
+O(log n).
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from codec import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class _Liveness:
+    """Heartbeat state of one connected tab"""
+    __slots__ = ("generation", "connected", "last_seen", "ping_id", "ping_sent", "rtt", "missed")
+
+    def __init__(self, generation: int, now: float):
+        # Distinguishes a reconnected tab's entries from stale heap entries of its old connection
+        self.generation = generation
+        self.connected = now
+        self.last_seen = now
+        self.ping_id: Optional[str] = None
+        self.ping_sent = 0.0
+        self.rtt: Optional[float] = None
+        # Pings sent since the last sign of life
+        self.missed = 0
+
+
+class Heartbeats:
+    """Ping idle tabs and report the ones that stop answering
+
+    Args:
+        send: Queues a text frame for a tab; returns False if it was not queued
+        on_dead: Called with the tab ID of a tab silent for ``timeout`` seconds
+        interval: Seconds of silence before a tab is pinged (0 disables heartbeats)
+        timeout: Seconds of silence before a tab is considered dead
+    """
+    def __init__(self, send: Callable[[str, str], Awaitable[bool]], on_dead: Callable[[str], Awaitable[None]],
+                 interval: float = 15.0, timeout: float = 45.0):
+        self.send = send
+        self.on_dead = on_dead
+        self.interval = interval
+        self.timeout = max(timeout, interval)
+        self._tabs: Dict[str, _Liveness] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._generations = itertools.count()
+        self._ping_ids = itertools.count(1)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.pings = 0
+        self.reaped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def start(self) -> None:
+        """Start the reaper on the running event loop; no-op if disabled or already running"""
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def add(self, tab_id: str) -> None:
+        """Start tracking a newly connected tab"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        entry = self._tabs[tab_id] = _Liveness(next(self._generations), now)
+        self._push(now + self.interval, entry.generation, tab_id)
+
+    def remove(self, tab_id: str) -> None:
+        """Stop tracking a tab; its heap entry is dropped when it comes due"""
+        self._tabs.pop(tab_id, None)
+
+    def touch(self, tab_id: str) -> None:
+        """Record a sign of life (any message from the tab)"""
+        entry = self._tabs.get(tab_id)
+        if entry is not None:
+            entry.last_seen = time.monotonic()
+            entry.missed = 0
+
+    def pong(self, tab_id: str, ping_id: Any) -> None:
+        """Complete the round trip of the tab's latest ping"""
+        entry = self._tabs.get(tab_id)
+        if entry is None or ping_id != entry.ping_id:
+            return
+        entry.rtt = time.monotonic() - entry.ping_sent
+        entry.ping_id = None
+        self.touch(tab_id)
+
+    def describe(self, tab_id: str) -> Optional[Dict[str, Any]]:
+        """Seconds since the tab was last heard from and its last ping round trip"""
+        entry = self._tabs.get(tab_id)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        return {
+            "last_seen_seconds": round(now - entry.last_seen, 3),
+            "connected_seconds": round(now - entry.connected, 3),
+            "rtt_ms": round(entry.rtt * 1000, 2) if entry.rtt is not None else None,
+            "missed_pings": entry.missed
+        }
+
+    def _push(self, due: float, generation: int, tab_id: str) -> None:
+        wake = not self._heap or due < self._heap[0][0]
+        heapq.heappush(self._heap, (due, generation, tab_id))
+        if wake:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            delay = self._heap[0][0] - time.monotonic() if self._heap else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due, generation, tab_id = heapq.heappop(self._heap)
+            try:
+                await self._check(tab_id, generation)
+            except Exception as e:
+                logger.warning(f"Heartbeat check for tab {tab_id} failed: {e}")
+
+    async def _check(self, tab_id: str, generation: int) -> None:
+        entry = self._tabs.get(tab_id)
+        if entry is None or entry.generation != generation:
+            return
+        now = time.monotonic()
+        idle = now - entry.last_seen
+        if idle >= self.timeout:
+            logger.warning(f"Tab {tab_id} silent for {idle:.1f}s; disconnecting")
+            self.remove(tab_id)
+            self.reaped += 1
+            await self.on_dead(tab_id)
+            return
+        if idle < self.interval:
+            # Heard from since this entry was pushed
+            self._push(entry.last_seen + self.interval, generation, tab_id)
+            return
+        if entry.ping_id is None or now - entry.ping_sent >= self.interval:
+            entry.ping_id = f"{next(self._ping_ids)}"
+            entry.ping_sent = now
+            entry.missed += 1
+            self.pings += 1
+            await self.send(tab_id, dumps({"type": "ping", "sender_id": "server", "ping_id": entry.ping_id}))
+        self._push(now + min(self.interval, self.timeout - idle), generation, tab_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval_seconds": self.interval,
+            "timeout_seconds": self.timeout,
+            "tracked": len(self._tabs),
+            "pings": self.pings,
+            "reaped": self.reaped
+        }
@@ -0,0 +1,292 @@
+"""Declarative macros run server-side against one tab.
+
+A macro is a list of steps executed in order in a single tool call, so a
+flow like "navigate, wait, fill, click, extract" costs one dispatch instead
+of one LLM turn per action. Only the values captured along the way are
+returned.
+
+Step kinds (exactly one per step):
+
+    {"command": "clickElement", "args": ["#submit"], "timeout": 10}
+        Browser command sent to the extension
+    {"wait": "selector_appeared", "selector": "#results", "timeout": 10}
+        Wait for a page state condition (see watchers.CONDITIONS)
+    {"query": "a.result", "fields": ["text", "href"], "limit": 20}
+        Query the server's copy of the DOM without a browser round trip
+    {"sleep": 0.5}
+        Pause, in seconds
+    {"assert": <condition>, "message": "Not logged in"}
+        Fail the macro unless the condition holds
+
+Common keys:
+
+    "when": <condition>   Run the step only if the condition holds
+    "capture": "name"     Store the step's value under ``name``
+    "pick": "rows.0"      Dotted path into the value before it is captured
+    "retry": 2            Extra attempts if the step fails
+    "optional": true      Continue with the next step if this one fails
+
+Conditions are dicts: {"var": "name", "equals" | "not_equals" | "contains" |
+"matches": value} or {"var": "name"} for truthiness, {"url_contains": "..."},
+{"selector": "css"} (present in the current snapshot), and {"not": c},
+{"all": [c, ...]}, {"any": [c, ...]} to combine them.
+
+String arguments may reference captures: "${name}" alone is replaced by the
+captured value itself, "${name.path}" inside longer text by its string form.
+"""
+import asyncio
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from watchers import CONDITIONS, CONDITION_SELECTOR_APPEARED, CONDITION_SELECTOR_GONE
+
+MAX_STEPS = 100
+MAX_RETRIES = 5
+
+STEP_KINDS = ("command", "wait", "query", "sleep", "assert")
+COMPARISONS = ("equals", "not_equals", "contains", "matches")
+
+_REFERENCE = re.compile(r"\$\{([^}]+)\}")
+
+
+class MacroError(Exception):
+    """A step failed, or the macro is malformed"""
+
+
+def _lookup(value: Any, path: str) -> Any:
+    """Follow a dotted path through dicts and lists; None if it leads nowhere"""
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list) and part.lstrip("-").isdigit() and -len(value) <= int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return None
+    return value
+
+
+def substitute(value: Any, captures: Dict[str, Any]) -> Any:
+    """Replace ${name} references in strings, lists and dicts with captured values"""
+    if isinstance(value, str):
+        whole = _REFERENCE.fullmatch(value)
+        if whole:
+            return _lookup(captures, whole.group(1))
+        return _REFERENCE.sub(lambda m: "" if (found := _lookup(captures, m.group(1))) is None else str(found),
+                              value)
+    if isinstance(value, list):
+        return [substitute(item, captures) for item in value]
+    if isinstance(value, dict):
+        return {key: substitute(item, captures) for key, item in value.items()}
+    return value
+
+
+def validate_condition(condition: Any, where: str) -> None:
+    if not isinstance(condition, dict) or not condition:
+        raise MacroError(f"{where}: condition must be a non-empty object")
+    if "not" in condition:
+        validate_condition(condition["not"], where)
+    elif "all" in condition or "any" in condition:
+        parts = condition.get("all", condition.get("any"))
+        if not isinstance(parts, list) or not parts:
+            raise MacroError(f"{where}: all/any takes a non-empty list of conditions")
+        for part in parts:
+            validate_condition(part, where)
+    elif "var" in condition:
+        if len([key for key in COMPARISONS if key in condition]) > 1:
+            raise MacroError(f"{where}: use only one of {', '.join(COMPARISONS)}")
+        if "matches" in condition:
+            try:
+                re.compile(condition["matches"])
+            except (re.error, TypeError) as e:
+                raise MacroError(f"{where}: invalid pattern: {e}") from e
+    elif "url_contains" not in condition and "selector" not in condition:
+        raise MacroError(f"{where}: unknown condition {condition}")
+
+
+def validate(steps: List[Dict[str, Any]], commands) -> None:
+    """Check a macro before anything is sent to the browser
+
+    Raises:
+        MacroError: Describing the first malformed step
+    """
+    if not steps:
+        raise MacroError("At least one step is required")
+    if len(steps) > MAX_STEPS:
+        raise MacroError(f"Macros are limited to {MAX_STEPS} steps")
+    for index, step in enumerate(steps):
+        where = f"Step {index}"
+        if not isinstance(step, dict):
+            raise MacroError(f"{where}: must be an object")
+        kinds = [kind for kind in STEP_KINDS if kind in step]
+        if len(kinds) != 1:
+            raise MacroError(f"{where}: needs exactly one of {', '.join(STEP_KINDS)}")
+        kind = kinds[0]
+        if kind == "command" and step["command"] not in commands:
+            raise MacroError(f"{where}: unknown command {step['command']}")
+        if kind == "wait":
+            if step["wait"] not in CONDITIONS:
+                raise MacroError(f"{where}: unknown wait condition {step['wait']}")
+            if step["wait"] in (CONDITION_SELECTOR_APPEARED, CONDITION_SELECTOR_GONE) and not step.get("selector"):
+                raise MacroError(f"{where}: {step['wait']} needs a selector")
+        if kind == "sleep" and not isinstance(step["sleep"], (int, float)):
+            raise MacroError(f"{where}: sleep takes a number of seconds")
+        if kind == "assert":
+            validate_condition(step["assert"], where)
+        if "when" in step:
+            validate_condition(step["when"], where)
+        retry = step.get("retry", 0)
+        if not isinstance(retry, int) or not 0 <= retry <= MAX_RETRIES:
+            raise MacroError(f"{where}: retry must be between 0 and {MAX_RETRIES}")
+
+
+class MacroRunner:
+    """Execute validated macros through the server's command, wait and query paths
+
+    Args:
+        send_command: (tab_id, command, args, timeout) -> send_command() style result
+        wait_for: (tab_id, initial, condition, selector, timeout) -> PageWatchers.wait_for() style result
+        query: (tab_id, selector, fields, limit) -> tool_query_dom() style result
+        count_matches: (tab_id, selector) -> elements matching in the current snapshot
+        get_state: tab_id -> the tab's current info (url, hash ...) or None
+    """
+    def __init__(self, send_command: Callable[..., Awaitable[Dict[str, Any]]],
+                 wait_for: Callable[..., Awaitable[Dict[str, Any]]],
+                 query: Callable[..., Awaitable[Dict[str, Any]]],
+                 count_matches: Callable[[str, str], Awaitable[int]],
+                 get_state: Callable[[str], Optional[dict]]):
+        self.send_command = send_command
+        self.wait_for = wait_for
+        self.query = query
+        self.count_matches = count_matches
+        self.get_state = get_state
+
+    async def run(self, tab_id: str, steps: List[Dict[str, Any]],
+                  variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run the steps in order and return the values they captured
+
+        ``variables`` are visible to references and conditions like captures
+        but are not returned.
+
+        Returns:
+            Dict containing success, captures, and the number of steps run and
+            skipped; on failure also the failing step and its error
+        """
+        captures = dict(variables or {})
+        captured: List[str] = []
+        # Page state before the latest browser command: the baseline for *_changed waits,
+        # so a wait after navigateTo still sees a navigation that finished before it started
+        baseline = {"state": self.get_state(tab_id)}
+        started = time.monotonic()
+        ran = skipped = 0
+
+        def summary(**fields: Any) -> Dict[str, Any]:
+            return {
+                **fields,
+                "captures": {name: captures[name] for name in captured},
+                "steps_run": ran,
+                "skipped": skipped,
+                "elapsed": round(time.monotonic() - started, 3)
+            }
+
+        for index, step in enumerate(steps):
+            try:
+                if "when" in step and not await self.check(tab_id, step["when"], captures):
+                    skipped += 1
+                    continue
+                value = await self._attempt(tab_id, step, captures, baseline)
+            except MacroError as e:
+                return summary(success=False, error=str(e), failed_step=index)
+            ran += 1
+            if "capture" in step:
+                captures[step["capture"]] = _lookup(value, step["pick"]) if "pick" in step else value
+                if step["capture"] not in captured:
+                    captured.append(step["capture"])
+        return summary(success=True)
+
+    async def _attempt(self, tab_id: str, step: Dict[str, Any], captures: Dict[str, Any],
+                       baseline: Dict[str, Any]) -> Any:
+        """Run a step with its retries; an optional step that keeps failing yields None"""
+        attempts = 1 + step.get("retry", 0)
+        for attempt in range(attempts):
+            try:
+                return await self._run_step(tab_id, step, captures, baseline)
+            except MacroError:
+                if attempt + 1 < attempts:
+                    continue
+                if step.get("optional"):
+                    return None
+                raise
+
+    async def _run_step(self, tab_id: str, step: Dict[str, Any], captures: Dict[str, Any],
+                        baseline: Dict[str, Any]) -> Any:
+        label = next(kind for kind in STEP_KINDS if kind in step)
+        if label == "command":
+            baseline["state"] = self.get_state(tab_id)
+            result = await self.send_command(tab_id, step["command"], substitute(step.get("args") or [], captures),
+                                             step.get("timeout"))
+            if not result.get("success"):
+                raise MacroError(f"{step['command']} failed: {result.get('error', 'Unknown error')}")
+            return result.get("result")
+
+        if label == "wait":
+            result = await self.wait_for(tab_id, baseline["state"], step["wait"],
+                                         substitute(step.get("selector"), captures), step.get("timeout", 30))
+            if "error" in result:
+                raise MacroError(f"wait {step['wait']} failed: {result['error']}")
+            if not result.get("matched"):
+                raise MacroError(f"wait {step['wait']} timed out after {result.get('elapsed')}s")
+            return result
+
+        if label == "query":
+            result = await self.query(tab_id, substitute(step["query"], captures), step.get("fields"),
+                                      step.get("limit", 100))
+            if "error" in result:
+                raise MacroError(f"query {step['query']} failed: {result['error']}")
+            return result["elements"]
+
+        if label == "sleep":
+            await asyncio.sleep(max(0.0, step["sleep"]))
+            return None
+
+        if not await self.check(tab_id, step["assert"], captures):
+            raise MacroError(step.get("message") or f"Assertion failed: {step['assert']}")
+        return True
+
+    async def check(self, tab_id: str, condition: Dict[str, Any], captures: Dict[str, Any]) -> bool:
+        """Evaluate a condition against the captures and the tab's current state"""
+        if "not" in condition:
+            return not await self.check(tab_id, condition["not"], captures)
+        if "all" in condition:
+            for part in condition["all"]:
+                if not await self.check(tab_id, part, captures):
+                    return False
+            return True
+        if "any" in condition:
+            for part in condition["any"]:
+                if await self.check(tab_id, part, captures):
+                    return True
+            return False
+        if "var" in condition:
+            value = _lookup(captures, condition["var"])
+            if "equals" in condition:
+                return value == substitute(condition["equals"], captures)
+            if "not_equals" in condition:
+                return value != substitute(condition["not_equals"], captures)
+            if "contains" in condition:
+                try:
+                    return substitute(condition["contains"], captures) in value
+                except TypeError:
+                    return False
+            if "matches" in condition:
+                return value is not None and re.search(condition["matches"], str(value)) is not None
+            return bool(value)
+        if "url_contains" in condition:
+            state = self.get_state(tab_id) or {}
+            return substitute(condition["url_contains"], captures) in (state.get("url") or "")
+        try:
+            return await self.count_matches(tab_id, substitute(condition["selector"], captures)) > 0
+        except LookupError:
+            return False
+        except ValueError as e:
+            raise MacroError(f"Invalid selector {condition['selector']}: {e}") from e
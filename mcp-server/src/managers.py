@@ -1,17 +1,294 @@
+import asyncio
 import logging
-from typing import Dict, Optional, Set
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
 from fastapi import WebSocket, WebSocketDisconnect
 
+from admission import ConcurrencyLimiter
+from framing import ENCODING_JSON, encode_message
+from metrics import SIZE_BUCKETS, Metrics
+from models import Message
+from recorder import DIRECTION_OUT, SessionRecorder
+from store import TabStateStore
+from views import ViewCache
+
 logger = logging.getLogger(__name__)
 
+
+def apply_text_patch(base: str, patch: List[List[Any]]) -> str:
+    """Apply [start, end, text] splices to a document.
+
+    Offsets are UTF-16 code units, as produced by JavaScript string indexing,
+    and refer to the base document. Splices must be sorted and non-overlapping.
+
+    Raises:
+        ValueError: If a splice is malformed, out of range, unsorted or overlapping
+    """
+    if base.isascii():
+        pieces = []
+        cursor = 0
+        for start, end, text in _checked_splices(patch, len(base)):
+            pieces.append(base[cursor:start])
+            pieces.append(text)
+            cursor = end
+        pieces.append(base[cursor:])
+        return "".join(pieces)
+
+    # Non-ASCII pages: code point and UTF-16 offsets can differ, so splice the encoded form
+    encoded = base.encode("utf-16-le", "surrogatepass")
+    pieces = []
+    cursor = 0
+    for start, end, text in _checked_splices(patch, len(encoded) // 2):
+        pieces.append(encoded[cursor:start * 2])
+        pieces.append(text.encode("utf-16-le", "surrogatepass"))
+        cursor = end * 2
+    pieces.append(encoded[cursor:])
+    return b"".join(pieces).decode("utf-16-le", "surrogatepass")
+
+
+def _checked_splices(patch: List[List[Any]], length: int) -> Iterator[Tuple[int, int, str]]:
+    """Splices of ``patch`` with ``cursor <= start <= end <= length``, in order"""
+    cursor = 0
+    for splice in patch:
+        if not isinstance(splice, (list, tuple)) or len(splice) != 3:
+            raise ValueError(f"Expected [start, end, text], got {splice!r}")
+        start, end, text = splice
+        if type(start) is not int or type(end) is not int or not isinstance(text, str):
+            raise ValueError(f"Expected [start, end, text], got {splice!r}")
+        if not cursor <= start <= end <= length:
+            raise ValueError(f"Splice [{start}, {end}] is out of order or outside the {length} unit document")
+        yield start, end, text
+        cursor = end
+
+
+# What to do when a tab's outgoing queue is full
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_DROP_NEWEST = "drop_newest"
+POLICY_DISCONNECT = "disconnect"
+SLOW_CONSUMER_POLICIES = (POLICY_DROP_OLDEST, POLICY_DROP_NEWEST, POLICY_DISCONNECT)
+
+
+class OutboundQueue:
+    """Bounded outgoing queue for one websocket, drained by its own writer task
+
+    Senders never await the socket, so a slow or stalled tab only fills its own
+    queue. When the queue is full the slow-consumer policy either drops the
+    oldest frame, drops the new frame, or closes the connection.
+
+    Frames that carry a command are queued with its request ID; when such a
+    frame is dropped to make room, ``on_drop`` is called with the ID so the
+    caller can be failed right away instead of waiting for its timeout.
+    """
+    def __init__(self, websocket: WebSocket, tab_id: str, max_size: int,
+                 policy: str = POLICY_DROP_OLDEST, send_timeout: float = 10.0,
+                 on_drop: Optional[Callable[[str], None]] = None):
+        self.websocket = websocket
+        self.tab_id = tab_id
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.on_drop = on_drop
+        # (frame, request ID of the command it carries or None)
+        self.queue: "asyncio.Queue[Tuple[Union[str, bytes], Optional[str]]]" = asyncio.Queue(maxsize=max_size)
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.high_water = 0
+        self._task = asyncio.create_task(self._writer())
+
+    def put(self, frame: Union[str, bytes], request_id: Optional[str] = None) -> bool:
+        """Queue a frame for sending; returns False if it was not queued
+
+        Args:
+            request_id: ID of the command the frame carries, if any
+        """
+        if self.closed:
+            return False
+        if self.queue.full():
+            if self.policy == POLICY_DROP_NEWEST:
+                self.dropped += 1
+                return False
+            if self.policy == POLICY_DISCONNECT:
+                logger.warning(f"Send queue full for tab {self.tab_id}; disconnecting slow consumer")
+                self._abort(1013)
+                return False
+            _, dropped_request = self.queue.get_nowait()
+            self.dropped += 1
+            if dropped_request is not None and self.on_drop is not None:
+                self.on_drop(dropped_request)
+        self.queue.put_nowait((frame, request_id))
+        self.high_water = max(self.high_water, self.queue.qsize())
+        return True
+
+    async def _writer(self) -> None:
+        """Send queued frames in order until the connection fails or closes"""
+        try:
+            while True:
+                frame, _ = await self.queue.get()
+                if isinstance(frame, bytes):
+                    await asyncio.wait_for(self.websocket.send_bytes(frame), self.send_timeout)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(frame), self.send_timeout)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.warning(f"Send to tab {self.tab_id} stalled for {self.send_timeout}s; closing")
+            self.closed = True
+            self._close_socket(1011)
+        except Exception as e:
+            logger.warning(f"Send to tab {self.tab_id} failed: {e}")
+            self.closed = True
+
+    def _abort(self, code: int) -> None:
+        """Stop accepting frames and close the socket without blocking the caller"""
+        self.closed = True
+        self._task.cancel()
+        self._close_socket(code)
+
+    def _close_socket(self, code: int) -> None:
+        """Close the websocket in the background"""
+        async def close_socket():
+            try:
+                await self.websocket.close(code)
+            except Exception:
+                pass
+
+        asyncio.create_task(close_socket())
+
+    def close(self) -> None:
+        """Stop the writer task and discard anything still queued"""
+        self.closed = True
+        self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and delivery counters for this connection"""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_high_water": self.high_water,
+            "queue_capacity": self.queue.maxsize,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "closed": self.closed
+        }
+
+
+class CommandCancelled(Exception):
+    """Raised to a caller whose queued or in-flight command was cancelled"""
+
+
+class _Ticket:
+    """A command waiting for its turn in a CommandQueue"""
+    __slots__ = ("request_id", "barrier", "granted", "cancelled")
+
+    def __init__(self, request_id: str, barrier: bool):
+        self.request_id = request_id
+        self.barrier = barrier
+        # Set when cancelled after being granted but before it was sent
+        self.cancelled = False
+        # Resolved when the command may be sent
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class CommandQueue:
+    """Orders and pipelines the commands sent to one tab
+
+    Commands are released strictly in submission order. Up to
+    ``max_in_flight`` independent commands may await replies at once; a
+    barrier command (navigateTo, reload) waits until everything before it has
+    finished and holds back everything after it until it finishes itself.
+    """
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max(1, max_in_flight)
+        self.waiting: "deque[_Ticket]" = deque()
+        self.in_flight: Dict[str, _Ticket] = {}
+        self._barrier_running = False
+
+    def submit(self, request_id: str, barrier: bool) -> _Ticket:
+        ticket = _Ticket(request_id, barrier)
+        self.waiting.append(ticket)
+        self._pump()
+        return ticket
+
+    def release(self, ticket: _Ticket) -> None:
+        """Mark a command finished (or abandoned) and let the next ones go"""
+        if self.in_flight.pop(ticket.request_id, None) is not None:
+            if ticket.barrier:
+                self._barrier_running = False
+        else:
+            try:
+                self.waiting.remove(ticket)
+            except ValueError:
+                pass
+        self._pump()
+
+    def _pump(self) -> None:
+        while self.waiting and not self._barrier_running:
+            head = self.waiting[0]
+            if head.barrier and self.in_flight:
+                return
+            if not head.barrier and len(self.in_flight) >= self.max_in_flight:
+                return
+            self.waiting.popleft()
+            self.in_flight[head.request_id] = head
+            self._barrier_running = head.barrier
+            if not head.granted.done():
+                head.granted.set_result(None)
+
+    def fail_all(self, error: Exception) -> None:
+        """Reject every command still waiting for its turn"""
+        while self.waiting:
+            ticket = self.waiting.popleft()
+            if not ticket.granted.done():
+                ticket.granted.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self.waiting),
+            "in_flight": len(self.in_flight),
+            "max_in_flight": self.max_in_flight
+        }
+
+
 class ConnectionManager:
     """Modern WebSocket connection manager"""
-    def __init__(self):
+    def __init__(self, compress_threshold: int = 16384, send_queue_size: int = 256,
+                 slow_consumer_policy: str = POLICY_DROP_OLDEST, send_timeout: float = 10.0,
+                 state_store: Optional[TabStateStore] = None, metrics: Optional[Metrics] = None,
+                 max_in_flight: int = 4, barrier_commands: Tuple[str, ...] = ("navigateTo", "reload"),
+                 recorder: Optional[SessionRecorder] = None, concurrency: Optional[ConcurrencyLimiter] = None,
+                 views: Optional[ViewCache] = None):
         # Dictionary to store WebSocket connections by tab ID
         self.connections: Dict[str, WebSocket] = {}
-        # Dictionary to store tab information
+        # Outgoing queue and writer task per connection
+        self.outbound: Dict[str, OutboundQueue] = {}
+        self.send_queue_size = send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.send_timeout = send_timeout
+        # Wire encoding negotiated by each tab (see framing.py)
+        self.encodings: Dict[str, str] = {}
+        self.compress_threshold = compress_threshold
+        # Dictionary to store tab information (url, version); page content lives in state_store
         self.tab_info: Dict[str, dict] = {}
+        self.state_store = state_store or TabStateStore(memory_budget=256 * 1024 * 1024)
+        # Views derived from page content, shared by content hash
+        self.views = views or ViewCache()
         self.connection_groups: Dict[str, Set[str]] = {}
+        # Futures waiting for a commandResult, keyed by request ID
+        self.pending_requests: Dict[str, Tuple[str, asyncio.Future]] = {}
+        # Per-tab ordering of commands (see CommandQueue)
+        self.command_queues: Dict[str, CommandQueue] = {}
+        self.max_in_flight = max_in_flight
+        self.barrier_commands = set(barrier_commands)
+        self.metrics = metrics or Metrics()
+        # Records every queued frame when session recording is enabled
+        self.recorder = recorder
+        # Global cap on commands awaiting replies (see admission.py)
+        self.concurrency = concurrency
+        # Set on shutdown: new commands are refused while in-flight ones finish
+        self.draining = False
+        # Called with (tab_id, previous info, current info) whenever a tab's state changes
+        self.state_listeners: List[Callable[[str, Optional[dict], Optional[dict]], None]] = []
         self._connection_counter = 0
 
     def _generate_client_id(self) -> str:
@@ -19,56 +296,328 @@ class ConnectionManager:
         self._connection_counter += 1
         return f"client_{self._connection_counter}"
 
-    async def connect(self, websocket: WebSocket, tab_id: str) -> str:
-        """Connect a new WebSocket client for a specific tab"""
-        await websocket.accept()
+    def _generate_request_id(self) -> str:
+        """Generate a unique request ID"""
+        return uuid.uuid4().hex
+
+    async def connect(self, websocket: WebSocket, tab_id: str, encoding: str = ENCODING_JSON,
+                      accept: bool = True) -> str:
+        """Connect a new WebSocket client for a specific tab
+
+        ``websocket`` may also be a channel of a multiplexed connection (see
+        mux.py), which is already accepted and is registered with ``accept=False``.
+        """
+        if accept:
+            await websocket.accept()
+        # A reconnecting tab replaces its previous writer
+        if tab_id in self.outbound:
+            self.outbound.pop(tab_id).close()
         self.connections[tab_id] = websocket
+        self.encodings[tab_id] = encoding
+        self.outbound[tab_id] = OutboundQueue(
+            websocket, tab_id, self.send_queue_size, self.slow_consumer_policy, self.send_timeout,
+            on_drop=self._fail_dropped
+        )
         logger.info(f"New connection established for tab {tab_id}")
         return tab_id
 
-    def disconnect(self, tab_id: str):
-        """Disconnect a WebSocket client for a specific tab"""
+    async def disconnect(self, tab_id: str, websocket: Optional[WebSocket] = None):
+        """Disconnect a WebSocket client for a specific tab
+
+        When ``websocket`` is given, nothing happens unless it is still the
+        tab's current connection, so a stale socket closing after the tab
+        reconnected does not tear down the new one.
+        """
+        if websocket is not None and self.connections.get(tab_id) is not websocket:
+            return
         if tab_id in self.connections:
             del self.connections[tab_id]
             logger.info(f"Connection closed for tab {tab_id}")
+        self.encodings.pop(tab_id, None)
+        if tab_id in self.outbound:
+            self.outbound.pop(tab_id).close()
+        self.state_store.discard(tab_id)
         if tab_id in self.tab_info:
-            del self.tab_info[tab_id]
-            # Remove from all groups
-            for group in self.connection_groups.values():
-                group.discard(tab_id)
+            self._notify_state(tab_id, self.tab_info.pop(tab_id), None)
+        # Remove from all groups, and drop groups left empty
+        for group_name, group in list(self.connection_groups.items()):
+            group.discard(tab_id)
+            if not group:
+                del self.connection_groups[group_name]
+        self.metrics.forget("tab_id", tab_id)
+        # Fail any requests still waiting on this tab
+        queue = self.command_queues.pop(tab_id, None)
+        if queue is not None:
+            queue.fail_all(ConnectionError(f"Tab {tab_id} disconnected"))
+        for pending_tab_id, future in list(self.pending_requests.values()):
+            if pending_tab_id == tab_id and not future.done():
+                future.set_exception(ConnectionError(f"Tab {tab_id} disconnected"))
 
-    async def send_personal_message(self, message: str, tab_id: str):
-        """Send a message to a specific tab"""
-        if tab_id in self.connections:
-            await self.connections[tab_id].send_text(message)
+    async def send_personal_message(self, message: str, tab_id: str, request_id: Optional[str] = None) -> bool:
+        """Queue a message for a specific tab
+
+        Args:
+            request_id: ID of the command the message carries, so it fails
+                at once if the frame is dropped under backpressure
+
+        Returns:
+            bool: False if the tab is not connected or the message was dropped
+        """
+        outbound = self.outbound.get(tab_id)
+        if outbound is None:
+            return False
+        frame = self._encode_for(tab_id, message)
+        queued = outbound.put(frame, request_id)
+        self._record_outbound(tab_id, frame, queued)
+        return queued
+
+    def _fail_dropped(self, request_id: str) -> None:
+        """Fail a command whose frame a full send queue dropped before it was sent"""
+        pending = self.pending_requests.get(request_id)
+        if pending is not None and not pending[1].done():
+            pending[1].set_exception(ConnectionError(
+                f"Command {request_id} for tab {pending[0]} dropped: backpressure (send queue full)"
+            ))
+
+    def _record_outbound(self, tab_id: str, frame: Union[str, bytes], queued: bool) -> None:
+        self.metrics.inc("mcp_outbound_messages_total", "Messages queued for tabs, by result",
+                         {"tab_id": tab_id, "result": "queued" if queued else "dropped"})
+        self.metrics.observe("mcp_outbound_message_bytes", "Size of outgoing frames", len(frame),
+                             buckets=SIZE_BUCKETS)
+        if queued and self.recorder is not None:
+            self.recorder.record(DIRECTION_OUT, tab_id, frame)
+
+    def _encode_for(self, tab_id: str, message: str) -> Union[str, bytes]:
+        """Encode a JSON message using the tab's negotiated wire encoding"""
+        return encode_message(message, self.encodings.get(tab_id, ENCODING_JSON), self.compress_threshold)
+
+    def get_queue_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Outgoing queue metrics for every connected tab"""
+        return {tab_id: outbound.stats() for tab_id, outbound in self.outbound.items()}
+
+    async def send_request(self, message: Message, tab_id: str, timeout: float) -> Dict[str, Any]:
+        """Send a command to a specific tab and wait for its commandResult reply
+
+        The command first waits for its turn in the tab's CommandQueue, then
+        for a slot under the global concurrency cap; ``timeout`` covers only
+        the round trip once it is sent.
+
+        Raises:
+            ConnectionError: If the tab is not connected or disconnects while waiting
+            asyncio.TimeoutError: If no reply arrives within ``timeout`` seconds
+            CommandCancelled: If cancel_requests() cancelled the command
+            Throttled: If the server is at its concurrency cap and the command was shed
+        """
+        if tab_id not in self.connections:
+            raise ConnectionError(f"Tab with ID {tab_id} not found or not connected")
+        if self.draining:
+            raise ConnectionError(f"Server is shutting down; tab {tab_id} will reconnect to the next instance")
+
+        if not message.request_id:
+            message.request_id = self._generate_request_id()
+        request_id = message.request_id
+
+        queue = self.command_queues.get(tab_id)
+        if queue is None:
+            queue = self.command_queues[tab_id] = CommandQueue(self.max_in_flight)
+        ticket = queue.submit(request_id, message.type in self.barrier_commands)
+        try:
+            await ticket.granted
+            if self.concurrency is not None:
+                await self.concurrency.acquire()
+            try:
+                # Also covers a cancel_requests() while waiting for a concurrency slot
+                if ticket.cancelled:
+                    raise CommandCancelled(f"Command {request_id} cancelled")
+                future = asyncio.get_running_loop().create_future()
+                self.pending_requests[request_id] = (tab_id, future)
+                if not await self.send_personal_message(message.to_json(), tab_id, request_id):
+                    raise ConnectionError(f"Could not queue {message.type} for tab {tab_id}")
+                return await asyncio.wait_for(future, timeout)
+            finally:
+                self.pending_requests.pop(request_id, None)
+                if self.concurrency is not None:
+                    self.concurrency.release()
+        finally:
+            queue.release(ticket)
+
+    def cancel_requests(self, tab_id: str, request_ids: Optional[List[str]] = None) -> int:
+        """Cancel a tab's queued and in-flight commands (all of them if ``request_ids`` is None)
+
+        In-flight commands stop being waited for; the browser may still run them.
+
+        Returns:
+            int: Number of commands cancelled
+        """
+        wanted = set(request_ids) if request_ids is not None else None
+        cancelled = 0
+        queue = self.command_queues.get(tab_id)
+        if queue is not None:
+            for ticket in [*queue.waiting, *queue.in_flight.values()]:
+                if wanted is not None and ticket.request_id not in wanted:
+                    continue
+                if not ticket.granted.done():
+                    ticket.granted.set_exception(CommandCancelled(f"Command {ticket.request_id} cancelled"))
+                    cancelled += 1
+                elif ticket.request_id not in self.pending_requests and not ticket.cancelled:
+                    ticket.cancelled = True
+                    cancelled += 1
+        for request_id, (pending_tab_id, future) in list(self.pending_requests.items()):
+            if pending_tab_id != tab_id or (wanted is not None and request_id not in wanted):
+                continue
+            if not future.done():
+                future.set_exception(CommandCancelled(f"Command {request_id} cancelled"))
+                cancelled += 1
+        return cancelled
+
+    def get_command_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Queued and in-flight command counts for every tab"""
+        return {tab_id: queue.stats() for tab_id, queue in self.command_queues.items()}
+
+    async def drain(self, timeout: float) -> bool:
+        """Refuse new commands and wait for queued and in-flight ones to finish
+
+        Also waits for every send queue to empty, so replies and final frames
+        reach their tabs before the connections are closed.
+
+        Returns:
+            bool: False if work was still outstanding after ``timeout`` seconds
+        """
+        self.draining = True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self._idle():
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def _idle(self) -> bool:
+        return (
+            not self.pending_requests
+            and not any(queue.waiting or queue.in_flight for queue in self.command_queues.values())
+            and all(outbound.queue.empty() for outbound in self.outbound.values())
+        )
+
+    def resolve_request(self, reply: Dict[str, Any]) -> bool:
+        """Complete the pending request matching a commandResult reply"""
+        pending = self.pending_requests.get(reply.get("request_id"))
+        if pending is None:
+            return False
+        _, future = pending
+        if not future.done():
+            future.set_result(reply)
+        return True
             
-    async def broadcast(self, message: str, exclude: Optional[str] = None):
-        """Broadcast a message to all connected tabs except the excluded one"""
-        for tab_id, connection in self.connections.items():
-            if tab_id != exclude:
-                await connection.send_text(message)
-                
-    def update_tab_info(self, tab_id: str, info: dict):
-        """Update information for a specific tab"""
+    async def broadcast(self, message: str, exclude: Optional[str] = None) -> int:
+        """Broadcast a message to all connected tabs except the excluded one
+
+        Frames are queued on every connection without waiting for any socket,
+        so one stalled tab cannot delay the others.
+
+        Returns:
+            int: Number of tabs the message was queued for
+        """
+        return self._fan_out(message, [tab_id for tab_id in self.outbound if tab_id != exclude])
+
+    def _fan_out(self, message: str, tab_ids) -> int:
+        """Queue one message on several connections, encoding once per wire encoding"""
+        frames: Dict[str, Union[str, bytes]] = {}
+        queued = 0
+        for tab_id in tab_ids:
+            outbound = self.outbound.get(tab_id)
+            if outbound is None:
+                continue
+            encoding = self.encodings.get(tab_id, ENCODING_JSON)
+            if encoding not in frames:
+                frames[encoding] = self._encode_for(tab_id, message)
+            frame = frames[encoding]
+            sent = outbound.put(frame)
+            self._record_outbound(tab_id, frame, sent)
+            if sent:
+                queued += 1
+        return queued
+
+    def update_tab_info(self, tab_id: str, info: dict) -> bool:
+        """Update information for a specific tab
+
+        The ``content`` key, if present, is moved into the state store and
+        replaced by its content ``hash``.
+
+        Returns:
+            bool: False if the page body is identical to the stored one, in
+            which case nothing downstream needs to be recomputed
+        """
+        info = dict(info)
+        changed = self.state_store.put(tab_id, info.pop("content", None))
+        info["hash"] = self.state_store.digest(tab_id)
+        previous = self.tab_info.get(tab_id)
         self.tab_info[tab_id] = info
+        self._notify_state(tab_id, previous, info)
+        return changed
         
-    def get_tab_info(self, tab_id: str) -> Optional[dict]:
-        """Get information for a specific tab"""
-        return self.tab_info.get(tab_id)
+    async def apply_state_patch(self, tab_id: str, url: Optional[str], base_version: int,
+                                version: int, patch: List[List[Any]]) -> bool:
+        """Apply an incremental page update on top of the stored snapshot
+
+        Returns:
+            bool: False when the stored version does not match ``base_version``
+            (or the snapshot was evicted, or the patch is malformed) and the tab
+            must resend a full snapshot
+        """
+        info = self.tab_info.get(tab_id)
+        if not info or info.get("version") != base_version:
+            return False
+        if not patch and tab_id in self.state_store:
+            # Nothing changed on the page; only the version moves forward
+            self.tab_info[tab_id] = {**info, "url": url if url is not None else info.get("url"), "version": version}
+            self._notify_state(tab_id, info, self.tab_info[tab_id])
+            return True
+        base = await self.state_store.load(tab_id)
+        if base is None or self.tab_info.get(tab_id) is not info:
+            # Evicted, or replaced by a newer update while the base was reloaded
+            return False
+        try:
+            content = apply_text_patch(base, patch)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Invalid state patch from tab {tab_id}: {e}")
+            return False
+        self.update_tab_info(tab_id, {
+            "url": url if url is not None else info.get("url"),
+            "content": content,
+            "version": version
+        })
+        return True
+
+    def _notify_state(self, tab_id: str, previous: Optional[dict], current: Optional[dict]) -> None:
+        """Tell state listeners a tab's info changed; ``current`` is None once the tab is gone"""
+        for listener in self.state_listeners:
+            try:
+                listener(tab_id, previous, current)
+            except Exception as e:
+                logger.error(f"State listener failed for tab {tab_id}: {e}")
+
+    async def get_tab_info(self, tab_id: str) -> Optional[dict]:
+        """Get information for a specific tab, including its page content"""
+        info = self.tab_info.get(tab_id)
+        if info is None:
+            return None
+        return {**info, "content": await self.state_store.load(tab_id)}
         
     def get_active_tabs(self) -> Set[str]:
         """Get all active tab IDs"""
         return set(self.connections.keys())
 
-    async def broadcast_to_group(self, group_name: str, message: str, exclude: Optional[str] = None) -> None:
+    async def broadcast_to_group(self, group_name: str, message: str, exclude: Optional[str] = None) -> int:
         """Broadcast a message to a specific group"""
         if group_name not in self.connection_groups:
             logger.warning(f"Group {group_name} not found")
-            return
+            return 0
 
-        for client_id in self.connection_groups[group_name]:
-            if client_id != exclude and client_id in self.connections:
-                await self.send_personal_message(message, client_id)
+        return self._fan_out(
+            message,
+            [client_id for client_id in self.connection_groups[group_name] if client_id != exclude]
+        )
 
     def add_to_group(self, group_name: str, client_id: str) -> None:
         """Add a client to a group"""
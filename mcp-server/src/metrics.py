@@ -0,0 +1,201 @@
+"""In-process metrics for the bridge, rendered in the Prometheus text format.
+
+Counters and histograms are keyed by metric name and a tuple of label
+values. Gauges are collected when ``/metrics`` is scraped through callbacks
+registered with ``Metrics.gauge``, so queue depths and connection counts are
+always current without being updated on every message.
+
+An optional JSON-lines trace log records one line per tool call, command and
+inbound message for offline analysis.
+"""
+import asyncio
+import functools
+import json
+import logging
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+LabelValues = Tuple[str, ...]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count for one label combination"""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Family:
+    """All label combinations of one metric"""
+    def __init__(self, kind: str, help_text: str, labels: Tuple[str, ...],
+                 buckets: Optional[Tuple[float, ...]] = None):
+        self.kind = kind
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values: Dict[LabelValues, Any] = {}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class TraceLog:
+    """Append-only JSON-lines event log
+
+    Lines are buffered and flushed at most once per ``flush_interval`` seconds
+    so tracing stays cheap on hot paths.
+    """
+    def __init__(self, path: Path, flush_interval: float = 1.0):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.flush_interval = flush_interval
+        self._file = path.open("a", encoding="utf-8")
+        self._last_flush = time.monotonic()
+
+    def write(self, event: str, **fields: Any) -> None:
+        fields["event"] = event
+        fields["ts"] = round(time.time(), 6)
+        try:
+            self._file.write(json.dumps(fields, default=str) + "\n")
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to write trace log {self.path}: {e}")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class Metrics:
+    """Registry of counters, histograms and collected gauges"""
+    def __init__(self, trace_log: Optional[TraceLog] = None):
+        self.trace_log = trace_log
+        self._families: Dict[str, _Family] = {}
+        self._gauges: List[Tuple[str, str, Tuple[str, ...], Callable[[], Dict[LabelValues, float]]]] = []
+
+    def _family(self, kind: str, name: str, help_text: str, labels: Tuple[str, ...],
+                buckets: Optional[Tuple[float, ...]] = None) -> _Family:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = _Family(kind, help_text, labels, buckets)
+        return family
+
+    def inc(self, name: str, help_text: str, labels: Dict[str, str] = None, value: float = 1) -> None:
+        """Increment a counter"""
+        labels = labels or {}
+        family = self._family("counter", name, help_text, tuple(labels))
+        key = tuple(labels.values())
+        family.values[key] = family.values.get(key, 0) + value
+
+    def observe(self, name: str, help_text: str, value: float, labels: Dict[str, str] = None,
+                buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        """Record a value in a histogram"""
+        labels = labels or {}
+        family = self._family("histogram", name, help_text, tuple(labels), buckets)
+        key = tuple(labels.values())
+        histogram = family.values.get(key)
+        if histogram is None:
+            histogram = family.values[key] = Histogram(family.buckets)
+        histogram.observe(value)
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...],
+              collect: Callable[[], Dict[LabelValues, float]]) -> None:
+        """Register a gauge whose values are read from ``collect`` at scrape time"""
+        self._gauges.append((name, help_text, labels, collect))
+
+    def forget(self, label: str, value: str) -> None:
+        """Drop every series carrying ``label=value``, e.g. a disconnected tab's counters"""
+        for family in self._families.values():
+            if label not in family.labels:
+                continue
+            position = family.labels.index(label)
+            for key in [key for key in family.values if key[position] == value]:
+                del family.values[key]
+
+    def trace(self, event: str, **fields: Any) -> None:
+        if self.trace_log is not None:
+            self.trace_log.write(event, **fields)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for name, family in self._families.items():
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for key, value in family.values.items():
+                if family.kind == "counter":
+                    lines.append(f"{name}{_format_labels(family.labels, key)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(family.buckets, value.counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(family.labels, key, f'le="{bound}"')
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = _format_labels(family.labels, key, 'le="+Inf"')
+                lines.append(f"{name}_bucket{bucket_labels} {value.count}")
+                lines.append(f"{name}_sum{_format_labels(family.labels, key)} {value.sum}")
+                lines.append(f"{name}_count{_format_labels(family.labels, key)} {value.count}")
+
+        for name, help_text, labels, collect in self._gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            try:
+                values = collect()
+            except Exception as e:
+                logger.warning(f"Failed to collect gauge {name}: {e}")
+                continue
+            for key, value in values.items():
+                lines.append(f"{name}{_format_labels(labels, key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def instrument_tool(self, func: Callable) -> Callable:
+        """Decorator timing an MCP tool; keeps the signature FastMCP reads its schema from"""
+        name = func.__name__
+        is_async = asyncio.iscoroutinefunction(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await func(*args, **kwargs) if is_async else func(*args, **kwargs)
+                if not (isinstance(result, dict) and ("error" in result or result.get("success") is False)):
+                    outcome = "ok"
+                return result
+            finally:
+                elapsed = time.perf_counter() - started
+                self.observe("mcp_tool_duration_seconds", "End-to-end MCP tool call latency",
+                             elapsed, {"tool": name})
+                self.inc("mcp_tool_calls_total", "MCP tool calls by outcome", {"tool": name, "outcome": outcome})
+                self.trace("tool", tool=name, outcome=outcome, duration=round(elapsed, 6))
+
+        return wrapper
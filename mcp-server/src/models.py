@@ -1,12 +1,41 @@
 from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel
-from dataclasses import field
-
-class MessageModel(BaseModel):
-    """WebSocket message model"""
-    type: str
-    # string array 타입
-    args: Optional[list[str]] = None
-    timestamp: datetime = field(default_factory=datetime.now)
-    sender_id: Optional[str] = None 
\ No newline at end of file
+from typing import Any, Dict, Optional
+
+from codec import dumps
+
+# Serialized '{"type":...,"sender_id":...' heads, one per (type, sender) pair
+_ENVELOPE_HEADS: Dict[tuple, str] = {}
+
+
+class Message:
+    """Outgoing WebSocket message, serialized without validation
+
+    Wire layout: {"type", "sender_id", "args", "request_id", "timestamp"}.
+    args is the command's argument list (strings, numbers and objects alike);
+    the extension echoes request_id in its commandResult. The envelope head
+    for each (type, sender) is serialized once and reused, and the timestamp
+    is taken when the message is serialized.
+    """
+    __slots__ = ("type", "args", "sender_id", "request_id")
+
+    def __init__(self, type: str, args: Optional[list] = None, sender_id: Optional[str] = None,
+                 request_id: Optional[str] = None):
+        self.type = type
+        self.args = args
+        self.sender_id = sender_id
+        self.request_id = request_id
+
+    def to_json(self) -> str:
+        key = (self.type, self.sender_id)
+        head = _ENVELOPE_HEADS.get(key)
+        if head is None:
+            head = _ENVELOPE_HEADS[key] = f'{{"type":{dumps(self.type)},"sender_id":{dumps(self.sender_id)}'
+        return (f'{head},"args":{dumps(self.args)},"request_id":{dumps(self.request_id)},'
+                f'"timestamp":"{datetime.now().isoformat()}"}}')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "args": self.args, "sender_id": self.sender_id, "request_id": self.request_id}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Message":
+        return cls(data["type"], data.get("args"), data.get("sender_id"), data.get("request_id"))
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+from fastapi import WebSocket
+
+from codec import dumps
+from framing import encode_channel_frame
+
+logger = logging.getLogger(__name__)
+
+
+class MuxChannel:
+    """One tab's logical connection inside a multiplexed websocket
+
+    Quacks like the parts of WebSocket that OutboundQueue uses, so
+    ConnectionManager treats a channel exactly like a dedicated socket: each
+    channel keeps its own bounded queue and slow-consumer policy, and only the
+    final socket write is shared.
+    """
+    def __init__(self, mux: "MuxConnection", tab_id: str):
+        self.mux = mux
+        self.tab_id = tab_id
+        self.closed = False
+
+    async def send_text(self, frame: str) -> None:
+        await self.mux.send(self.tab_id, frame)
+
+    async def send_bytes(self, frame: bytes) -> None:
+        await self.mux.send(self.tab_id, frame)
+
+    async def close(self, code: int = 1000) -> None:
+        """Close this channel only; the shared socket stays open for other tabs"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            # Compact JSON: the extension recognizes this frame by its prefix
+            await self.mux.send(self.tab_id, dumps({"type": "close", "code": code}))
+        except Exception:
+            pass
+        self.mux.channel_closed(self)
+
+
+class MuxConnection:
+    """An extension-level websocket carrying channel-tagged frames for many tabs"""
+    def __init__(self, websocket: WebSocket, on_channel_closed: Callable[[MuxChannel], None]):
+        self.websocket = websocket
+        self.channels: Dict[str, MuxChannel] = {}
+        self.on_channel_closed = on_channel_closed
+        # Channels write whole frames; the lock keeps them from interleaving on the socket
+        self._lock = asyncio.Lock()
+
+    def open(self, tab_id: str) -> MuxChannel:
+        """Open (or reopen) the channel for a tab"""
+        previous = self.channels.get(tab_id)
+        if previous is not None:
+            previous.closed = True
+        channel = self.channels[tab_id] = MuxChannel(self, tab_id)
+        return channel
+
+    def get(self, tab_id: str) -> Optional[MuxChannel]:
+        return self.channels.get(tab_id)
+
+    def discard(self, channel: MuxChannel) -> None:
+        channel.closed = True
+        if self.channels.get(channel.tab_id) is channel:
+            del self.channels[channel.tab_id]
+
+    def channel_closed(self, channel: MuxChannel) -> None:
+        """Called when the server side closes a channel (slow consumer, stalled send)"""
+        self.discard(channel)
+        self.on_channel_closed(channel)
+
+    async def send(self, tab_id: str, frame) -> None:
+        data = encode_channel_frame(tab_id, frame)
+        async with self._lock:
+            await self.websocket.send_bytes(data)
@@ -0,0 +1,263 @@
+"""Append-only recording of tab traffic for replay and offline analysis.
+
+Enabled with MCP_RECORD_DIR. Every server run writes one session directory
+holding numbered segments:
+
+    <dir>/<session>/000001.seg   compressed blocks of records
+    <dir>/<session>/000001.idx   one entry per block: offset, first/last time, count
+
+A record is one websocket message for one tab:
+
+    f64 time | u8 direction | u8 kind | u16 tab id length | u32 payload length | tab id | payload
+
+``direction`` is DIRECTION_IN (from the extension) or DIRECTION_OUT (from
+the server). ``kind`` says whether the payload is a text frame, a binary
+frame (0x01 / 0x02, see framing.py) or a connection event with no payload.
+
+Records are buffered into blocks of about ``block_size`` bytes, each written
+as ``u32 compressed length | u32 record count | zlib(records)``, so writing
+stays cheap and blocks compress well. A partial block is flushed once it is
+``flush_interval`` old, by the next record or by the owner calling
+``flush_due`` periodically while traffic is idle. Recording only appends to the buffer;
+full blocks are compressed and written by a background thread, so the event
+loop never waits on zlib or the disk. If the disk falls more than
+``max_pending`` blocks behind, new blocks are dropped (and counted) rather
+than held in memory. The index lets readers skip to a point
+in time without inflating earlier blocks; if it is missing (e.g. after a
+crash) readers scan the segment instead. A segment is closed and a new one
+started once it reaches ``segment_bytes``; only the newest ``max_segments``
+are kept when a limit is set.
+"""
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DIRECTION_IN = 0
+DIRECTION_OUT = 1
+
+KIND_TEXT = 0
+KIND_BINARY = 1
+KIND_OPEN = 2
+KIND_CLOSE = 3
+
+_RECORD = struct.Struct(">dBBHI")
+_BLOCK = struct.Struct(">II")
+_INDEX = struct.Struct(">QddI")
+
+
+class Record(NamedTuple):
+    time: float
+    direction: int
+    kind: int
+    tab_id: str
+    payload: bytes
+
+    def text(self) -> str:
+        return self.payload.decode("utf-8", "surrogatepass")
+
+
+class SessionRecorder:
+    """Write one session of tab traffic to segmented, block-compressed files
+
+    Args:
+        directory: Root directory; the session gets its own subdirectory
+        segment_bytes: Start a new segment once the current one reaches this size
+        max_segments: Keep only this many newest segments (0: keep all)
+        block_size: Uncompressed bytes buffered before a block is written
+        flush_interval: Longest a record waits in the buffer, in seconds
+        level: zlib compression level
+        max_pending: Blocks allowed to wait for the writer thread; more are dropped
+    """
+    def __init__(self, directory: Path, segment_bytes: int = 64 * 1024 * 1024, max_segments: int = 0,
+                 block_size: int = 256 * 1024, flush_interval: float = 1.0, level: int = 1,
+                 max_pending: int = 64):
+        self.session = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+        self.path = directory / self.session
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.level = level
+        self._buffer = bytearray()
+        self._count = 0
+        self._first = self._last = 0.0
+        self._last_flush = time.monotonic()
+        self._segment = 0
+        self._data = self._index = None
+        self.records = 0
+        self.bytes_written = 0
+        self.dropped_records = 0
+        self._open_segment()
+        # Blocks (buffer, count, first, last) for the writer; None stops it
+        self._pending: "queue.Queue[Optional[tuple]]" = queue.Queue(max_pending)
+        self._writer = threading.Thread(target=self._write_blocks, name="recorder", daemon=True)
+        self._writer.start()
+        logger.info(f"Recording tab traffic to {self.path}")
+
+    def _open_segment(self) -> None:
+        self._segment += 1
+        name = f"{self._segment:06d}"
+        self._data = (self.path / f"{name}.seg").open("ab")
+        self._index = (self.path / f"{name}.idx").open("ab")
+        if self.max_segments:
+            for old in sorted(self.path.glob("*.seg"))[:-self.max_segments]:
+                old.unlink(missing_ok=True)
+                old.with_suffix(".idx").unlink(missing_ok=True)
+
+    def record(self, direction: int, tab_id: str, frame: Union[str, bytes, None], kind: Optional[int] = None) -> None:
+        """Append one message (or, with kind KIND_OPEN / KIND_CLOSE, a connection event)"""
+        if kind is None:
+            kind = KIND_TEXT if isinstance(frame, str) else KIND_BINARY
+        payload = frame.encode("utf-8", "surrogatepass") if isinstance(frame, str) else (frame or b"")
+        tab_bytes = tab_id.encode("utf-8")
+        now = time.time()
+        self._buffer += _RECORD.pack(now, direction, kind, len(tab_bytes), len(payload))
+        self._buffer += tab_bytes
+        self._buffer += payload
+        if not self._count:
+            self._first = now
+        self._last = now
+        self._count += 1
+        self.records += 1
+        if len(self._buffer) >= self.block_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush_due(self) -> None:
+        """Flush buffered records if ``flush_interval`` has passed since the last flush"""
+        if self._count and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, wait: bool = False) -> None:
+        """Hand buffered records to the writer thread as one block
+
+        Args:
+            wait: Wait for room in the writer's queue instead of dropping the block
+        """
+        self._last_flush = time.monotonic()
+        if not self._count:
+            return
+        try:
+            self._pending.put((self._buffer, self._count, self._first, self._last), block=wait)
+        except queue.Full:
+            if not self.dropped_records:
+                logger.warning(f"Recording to {self.path} cannot keep up; dropping blocks")
+            self.dropped_records += self._count
+        self._buffer = bytearray()
+        self._count = 0
+
+    def _write_blocks(self) -> None:
+        """Writer thread: compress and append blocks until close()"""
+        while True:
+            block = self._pending.get()
+            if block is None:
+                return
+            buffer, count, first, last = block
+            try:
+                packed = zlib.compress(buffer, self.level)
+                offset = self._data.tell()
+                self._data.write(_BLOCK.pack(len(packed), count) + packed)
+                self._data.flush()
+                self._index.write(_INDEX.pack(offset, first, last, count))
+                self._index.flush()
+                self.bytes_written += _BLOCK.size + len(packed)
+                if offset + _BLOCK.size + len(packed) >= self.segment_bytes:
+                    self._data.close()
+                    self._index.close()
+                    self._open_segment()
+            except OSError as e:
+                logger.warning(f"Failed to write recording block to {self.path}: {e}")
+
+    def close(self) -> None:
+        """Write what is buffered and stop the writer thread"""
+        # Waits rather than drops: the last records matter most when shutting down
+        self.flush(wait=True)
+        self._pending.put(None)
+        self._writer.join()
+        self._data.close()
+        self._index.close()
+
+    def stats(self) -> dict:
+        return {
+            "session": str(self.path),
+            "segment": self._segment,
+            "records": self.records,
+            "bytes_written": self.bytes_written,
+            "pending_blocks": self._pending.qsize(),
+            "dropped_records": self.dropped_records
+        }
+
+
+def _read_index(path: Path) -> List[tuple]:
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return []
+    usable = len(data) - len(data) % _INDEX.size
+    return [_INDEX.unpack_from(data, offset) for offset in range(0, usable, _INDEX.size)]
+
+
+def _parse_block(block: bytes) -> Iterator[Record]:
+    position = 0
+    while position + _RECORD.size <= len(block):
+        when, direction, kind, tab_length, payload_length = _RECORD.unpack_from(block, position)
+        position += _RECORD.size
+        tab_id = block[position:position + tab_length].decode("utf-8")
+        position += tab_length
+        yield Record(when, direction, kind, tab_id, block[position:position + payload_length])
+        position += payload_length
+
+
+class SessionReader:
+    """Iterate over the records of a recorded session in time order"""
+    def __init__(self, path: Path):
+        self.path = path
+        self.segments = sorted(path.glob("*.seg"))
+        if not self.segments:
+            raise FileNotFoundError(f"No recorded segments in {path}")
+
+    def records(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Record]:
+        """Records with ``start <= time <= end`` (absolute epoch seconds)"""
+        for segment in self.segments:
+            index = _read_index(segment.with_suffix(".idx"))
+            if index and start is not None and index[-1][2] < start:
+                continue
+            if index and end is not None and index[0][1] > end:
+                return
+            offset = 0
+            for entry_offset, _first, last, _count in index:
+                if start is not None and last < start:
+                    continue
+                offset = entry_offset
+                break
+            yield from self._scan(segment, offset, start, end)
+
+    def _scan(self, segment: Path, offset: int, start: Optional[float], end: Optional[float]) -> Iterator[Record]:
+        with segment.open("rb") as file:
+            file.seek(offset)
+            while True:
+                head = file.read(_BLOCK.size)
+                if len(head) < _BLOCK.size:
+                    return
+                length, _count = _BLOCK.unpack(head)
+                packed = file.read(length)
+                try:
+                    block = zlib.decompress(packed)
+                except zlib.error:
+                    # Truncated final block of a session that did not shut down cleanly
+                    logger.warning(f"Stopping at damaged block in {segment}")
+                    return
+                for record in _parse_block(block):
+                    if start is not None and record.time < start:
+                        continue
+                    if end is not None and record.time > end:
+                        return
+                    yield record
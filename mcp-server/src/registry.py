@@ -0,0 +1,276 @@
+"""Tab registry and request routing across server workers.
+
+Each worker owns the websockets of the tabs connected to it. The registry
+records which worker holds each tab, and carries routed requests between
+workers, so a tool call arriving at any worker reaches the tab wherever its
+websocket lives.
+
+``TabRegistry`` is the in-process default for a single worker.
+``RedisTabRegistry`` shares the registry through any Redis-compatible server
+(hash of tab -> worker, one pub/sub channel per worker, a heartbeat key per
+worker so tabs of a dead worker disappear). It needs the optional ``redis``
+package: ``pip install mcp-server[redis]``.
+"""
+import asyncio
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from admission import REASON_OVERLOADED, SHED_RETRY_AFTER, Throttled
+from codec import dumps, loads
+from managers import CommandCancelled
+from models import Message
+
+logger = logging.getLogger(__name__)
+
+# Extra seconds a routing worker waits beyond the command timeout for the owner's reply
+ROUTE_GRACE = 2.0
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class TabRegistry:
+    """In-process registry: every tab is held by this worker"""
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self._tabs: Dict[str, str] = {}
+
+    async def start(self, handler: Handler) -> None:
+        """Start receiving envelopes routed to this worker"""
+
+    async def close(self) -> None:
+        self._tabs.clear()
+
+    async def register(self, tab_id: str) -> None:
+        self._tabs[tab_id] = self.worker_id
+
+    async def unregister(self, tab_id: str) -> None:
+        self._tabs.pop(tab_id, None)
+
+    async def lookup(self, tab_id: str) -> Optional[str]:
+        """Worker holding a tab, or None if no live worker has it"""
+        return self._tabs.get(tab_id)
+
+    async def tabs(self) -> Dict[str, str]:
+        """Every registered tab mapped to its worker"""
+        return dict(self._tabs)
+
+    async def publish(self, worker_id: str, envelope: Dict[str, Any]) -> None:
+        """Deliver an envelope to another worker"""
+        raise ConnectionError(f"Worker {worker_id} is not reachable from an in-process registry")
+
+
+class RedisTabRegistry(TabRegistry):
+    """Registry shared by all workers through a Redis-compatible server"""
+    def __init__(self, worker_id: str, url: str, prefix: str = "mcp", heartbeat: float = 5.0):
+        super().__init__(worker_id)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise ImportError("TAB_REGISTRY_URL requires the redis package: pip install mcp-server[redis]") from e
+        self.url = url
+        self.heartbeat = heartbeat
+        # RESP2 keeps the backend swappable for any Redis-compatible server
+        self._redis = redis.from_url(url, decode_responses=True, protocol=2)
+        self._tabs_key = f"{prefix}:tabs"
+        self._alive_prefix = f"{prefix}:alive:"
+        self._channel_prefix = f"{prefix}:worker:"
+        self._pubsub = None
+        self._tasks = []
+
+    def _alive_key(self, worker_id: str) -> str:
+        return self._alive_prefix + worker_id
+
+    async def start(self, handler: Handler) -> None:
+        await self._beat()
+        # Forget tabs a previous run of this worker left behind
+        stale = [tab_id for tab_id, worker in (await self._redis.hgetall(self._tabs_key)).items()
+                 if worker == self.worker_id]
+        if stale:
+            await self._redis.hdel(self._tabs_key, *stale)
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self._channel_prefix + self.worker_id)
+        self._tasks = [
+            asyncio.create_task(self._listen(handler)),
+            asyncio.create_task(self._heartbeat())
+        ]
+        logger.info(f"Worker {self.worker_id} joined tab registry at {self.url}")
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            mine = [tab_id for tab_id, worker in (await self._redis.hgetall(self._tabs_key)).items()
+                    if worker == self.worker_id]
+            if mine:
+                await self._redis.hdel(self._tabs_key, *mine)
+            await self._redis.delete(self._alive_key(self.worker_id))
+            if self._pubsub is not None:
+                await self._pubsub.aclose()
+        finally:
+            await self._redis.aclose()
+
+    async def _beat(self) -> None:
+        await self._redis.set(self._alive_key(self.worker_id), "1", ex=max(1, int(self.heartbeat * 3)))
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            try:
+                await self._beat()
+            except Exception as e:
+                logger.warning(f"Registry heartbeat failed: {e}")
+
+    async def _listen(self, handler: Handler) -> None:
+        async for item in self._pubsub.listen():
+            if item.get("type") != "message":
+                continue
+            try:
+                envelope = loads(item["data"])
+            except (TypeError, ValueError):
+                logger.warning("Ignoring malformed routed envelope")
+                continue
+            try:
+                await handler(envelope)
+            except Exception as e:
+                logger.error(f"Failed to handle routed envelope: {e}")
+
+    async def register(self, tab_id: str) -> None:
+        await self._redis.hset(self._tabs_key, tab_id, self.worker_id)
+
+    async def unregister(self, tab_id: str) -> None:
+        # Only remove the entry if the tab has not meanwhile reconnected to another worker
+        if await self._redis.hget(self._tabs_key, tab_id) == self.worker_id:
+            await self._redis.hdel(self._tabs_key, tab_id)
+
+    async def lookup(self, tab_id: str) -> Optional[str]:
+        worker = await self._redis.hget(self._tabs_key, tab_id)
+        if worker is None or not await self._redis.exists(self._alive_key(worker)):
+            return None
+        return worker
+
+    async def tabs(self) -> Dict[str, str]:
+        entries = await self._redis.hgetall(self._tabs_key)
+        workers = sorted(set(entries.values()))
+        alive = {
+            worker for worker, flag in zip(
+                workers, await self._redis.mget([self._alive_key(worker) for worker in workers])
+            ) if flag
+        } if workers else set()
+        return {tab_id: worker for tab_id, worker in entries.items() if worker in alive}
+
+    async def publish(self, worker_id: str, envelope: Dict[str, Any]) -> None:
+        receivers = await self._redis.publish(self._channel_prefix + worker_id, dumps(envelope))
+        if not receivers:
+            raise ConnectionError(f"Worker {worker_id} is not listening")
+
+
+class TabRouter:
+    """Send commands to tabs held by this worker or, through the registry, by any other"""
+    def __init__(self, manager, registry: TabRegistry):
+        self.manager = manager
+        self.registry = registry
+        # Futures waiting for replies from other workers, keyed by call ID
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._serving = set()
+
+    async def start(self) -> None:
+        await self.registry.start(self._handle)
+
+    async def close(self) -> None:
+        await self.registry.close()
+
+    async def register(self, tab_id: str) -> None:
+        try:
+            await self.registry.register(tab_id)
+        except Exception as e:
+            logger.error(f"Failed to register tab {tab_id}: {e}")
+
+    async def unregister(self, tab_id: str) -> None:
+        try:
+            await self.registry.unregister(tab_id)
+        except Exception as e:
+            logger.error(f"Failed to unregister tab {tab_id}: {e}")
+
+    async def tabs(self) -> Dict[str, str]:
+        """Every reachable tab mapped to the worker holding it"""
+        tabs = await self.registry.tabs()
+        # Local connections are authoritative even if the registry is lagging
+        tabs.update({tab_id: self.registry.worker_id for tab_id in self.manager.get_active_tabs()})
+        return tabs
+
+    async def send_request(self, message: Message, tab_id: str, timeout: float) -> Dict[str, Any]:
+        """Like ConnectionManager.send_request, for a tab on any worker
+
+        Raises:
+            ConnectionError: If no worker holds the tab or the owner is unreachable
+            asyncio.TimeoutError: If no reply arrives within ``timeout`` seconds
+            Throttled: If the owner shed the command at its concurrency cap
+        """
+        if tab_id in self.manager.connections:
+            return await self.manager.send_request(message, tab_id, timeout)
+
+        worker = await self.registry.lookup(tab_id)
+        if worker is None or worker == self.registry.worker_id:
+            raise ConnectionError(f"Tab with ID {tab_id} not found or not connected")
+
+        call_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._calls[call_id] = future
+        try:
+            await self.registry.publish(worker, {
+                "kind": "request",
+                "call_id": call_id,
+                "reply_to": self.registry.worker_id,
+                "tab_id": tab_id,
+                "message": message.to_dict(),
+                "timeout": timeout
+            })
+            envelope = await asyncio.wait_for(future, timeout + ROUTE_GRACE)
+        finally:
+            self._calls.pop(call_id, None)
+
+        error_type = envelope.get("error_type")
+        if error_type == "timeout":
+            raise asyncio.TimeoutError()
+        if error_type == "cancelled":
+            raise CommandCancelled(envelope.get("error", "Cancelled"))
+        if error_type == "throttled":
+            raise Throttled(envelope.get("error", "Throttled"), envelope.get("reason", REASON_OVERLOADED),
+                            envelope.get("retry_after", SHED_RETRY_AFTER))
+        if error_type is not None:
+            raise ConnectionError(envelope.get("error", f"Tab {tab_id} failed on worker {worker}"))
+        return envelope["reply"]
+
+    async def _handle(self, envelope: Dict[str, Any]) -> None:
+        if envelope.get("kind") == "reply":
+            future = self._calls.get(envelope.get("call_id"))
+            if future is not None and not future.done():
+                future.set_result(envelope)
+        elif envelope.get("kind") == "request":
+            # Serve concurrently; the listener must keep reading replies meanwhile
+            task = asyncio.create_task(self._serve(envelope))
+            self._serving.add(task)
+            task.add_done_callback(self._serving.discard)
+
+    async def _serve(self, envelope: Dict[str, Any]) -> None:
+        """Run a routed request against a local tab and publish the reply to its origin"""
+        reply: Dict[str, Any] = {"kind": "reply", "call_id": envelope.get("call_id")}
+        try:
+            reply["reply"] = await self.manager.send_request(
+                Message.from_dict(envelope["message"]), envelope["tab_id"], envelope["timeout"]
+            )
+        except asyncio.TimeoutError:
+            reply.update(error_type="timeout", error="Timed out")
+        except CommandCancelled as e:
+            reply.update(error_type="cancelled", error=str(e))
+        except Throttled as e:
+            reply.update(error_type="throttled", error=str(e), reason=e.reason, retry_after=e.retry_after)
+        except (ConnectionError, KeyError, TypeError, ValueError) as e:
+            reply.update(error_type="connection", error=str(e))
+        try:
+            await self.registry.publish(envelope["reply_to"], reply)
+        except Exception as e:
+            logger.warning(f"Could not return routed reply to {envelope.get('reply_to')}: {e}")
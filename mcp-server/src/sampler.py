@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Metrics kept in the rolling window and summarized as min/avg/max
+HISTORY_METRICS = (
+    "cpu_percent", "memory_percent", "disk_percent",
+    "process_cpu_percent", "process_rss_mb", "process_threads"
+)
+
+
+def _collect(process, disk_path: str) -> Dict[str, Any]:
+    """Take one sample; blocking calls, run in a worker thread"""
+    import psutil
+    memory = psutil.virtual_memory()
+    disk = psutil.disk_usage(disk_path)
+    with process.oneshot():
+        # cpu_percent(interval=None) compares against the previous call instead of sleeping
+        sample = {
+            "timestamp": time.time(),
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": memory.percent,
+            "memory_available": memory.available,
+            "disk_percent": disk.percent,
+            "disk_free": disk.free,
+            "process_cpu_percent": process.cpu_percent(interval=None),
+            "process_rss_mb": round(process.memory_info().rss / (1024 * 1024), 2),
+            "process_threads": process.num_threads(),
+        }
+        if hasattr(process, "num_fds"):
+            sample["process_fds"] = process.num_fds()
+    return sample
+
+
+class SystemSampler:
+    """Samples system and server process stats in the background
+
+    Reads return the latest precomputed snapshot, so they never block the
+    event loop shared with the websocket endpoint.
+    """
+    def __init__(self, interval: float = 5.0, window: int = 60, disk_path: str = "/"):
+        self.interval = interval
+        self.disk_path = disk_path
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=window)
+        # Set by start(); psutil is imported there so it stays off the startup path
+        self.boot_time = 0.0
+        self._process = None
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start sampling on the running event loop; no-op if already running"""
+        if self._task is not None and not self._task.done():
+            return
+        import psutil
+        if self._process is None:
+            self.boot_time = psutil.boot_time()
+            self._process = psutil.Process(os.getpid())
+        # Prime the CPU counters so the first real sample covers a full interval
+        psutil.cpu_percent(interval=None)
+        self._process.cpu_percent(interval=None)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        # First sample comes quickly so the resource is populated soon after startup
+        delay = min(self.interval, 1.0)
+        while True:
+            await asyncio.sleep(delay)
+            delay = self.interval
+            try:
+                sample = await asyncio.to_thread(_collect, self._process, self.disk_path)
+            except Exception as e:
+                logger.warning(f"System sampling failed: {e}")
+                continue
+            self.samples.append(sample)
+            self._snapshot = self._summarize(sample)
+
+    def _summarize(self, latest: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the snapshot served to readers from the latest sample and the window"""
+        history = {}
+        for name in HISTORY_METRICS:
+            values = [sample[name] for sample in self.samples]
+            history[name] = {
+                "min": min(values),
+                "avg": round(sum(values) / len(values), 2),
+                "max": max(values)
+            }
+        uptime = latest["timestamp"] - self.boot_time
+        return {
+            "cpu_usage": f"{latest['cpu_percent']}%",
+            "memory_usage": f"{latest['memory_percent']}%",
+            "memory_available": f"{latest['memory_available'] / (1024 * 1024 * 1024):.2f} GB",
+            "disk_usage": f"{latest['disk_percent']}%",
+            "disk_free": f"{latest['disk_free'] / (1024 * 1024 * 1024):.2f} GB",
+            "uptime_seconds": int(uptime),
+            "uptime_formatted": f"{int(uptime // 3600)}h {int((uptime % 3600) // 60)}m {int(uptime % 60)}s",
+            "process": {
+                "pid": self._process.pid,
+                "cpu_percent": latest["process_cpu_percent"],
+                "rss_mb": latest["process_rss_mb"],
+                "threads": latest["process_threads"],
+                "fds": latest.get("process_fds")
+            },
+            "history": history,
+            "samples": len(self.samples),
+            "interval_seconds": self.interval,
+            "sampled_at": latest["timestamp"]
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latest summarized sample; O(1)"""
+        if self._snapshot is None:
+            return {
+                "error": "No system sample collected yet",
+                "samples": 0,
+                "interval_seconds": self.interval
+            }
+        return self._snapshot
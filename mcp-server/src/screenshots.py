@@ -0,0 +1,359 @@
+"""Screenshot processing and a content-addressed store for the results.
+
+A takeScreenshot result carries the capture as a transfer (a PNG streamed in
+0x02 blob chunks, see streams.py) plus the part of the viewport to keep.
+Decoding and encoding are CPU-bound, so the module-level functions below run
+in a worker pool (ImageWorkers), off the event loop:
+
+    process_capture   decode, crop to the element, bound the size, hash, re-encode
+    derive            thumbnail or region crop of a stored screenshot
+
+Screenshots are stored under the SHA-256 of their encoded bytes, so a page
+that did not change is stored once. Thumbnails and crops are stored the same
+way, under a key made from their source and parameters, so asking for one
+twice decodes once. The least recently used files are evicted once the store
+grows past its byte budget.
+
+The perceptual hash is a 64-bit difference hash (dHash). Screenshots whose
+hashes differ in only a few bits look alike, which lets a caller tell that a
+capture shows nothing new without looking at it.
+
+Pillow is optional (``pip install mcp-server[images]``). Without it captures
+are stored as received (PNG), and element crops, thumbnails and region crops
+are unavailable.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import io
+import logging
+import multiprocessing
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HAVE_PILLOW = importlib.util.find_spec("PIL") is not None
+
+# Output formats and their file extensions
+IMAGE_FORMATS = {"webp": "webp", "png": "png", "jpeg": "jpg"}
+_EXTENSION_FORMATS = {ext: fmt for fmt, ext in IMAGE_FORMATS.items()}
+
+_KEY = re.compile(r"[0-9a-f]{64}")
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class ScreenshotError(ValueError):
+    """A capture or image request could not be processed"""
+
+
+def _pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ScreenshotError("Image processing needs Pillow: pip install mcp-server[images]") from None
+    return Image
+
+
+def _open(data: bytes):
+    Image = _pillow()
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ScreenshotError(f"Cannot decode image: {e}") from None
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    return image
+
+
+def _encode(image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        image.convert("RGB").save(buffer, "JPEG", quality=quality, optimize=True)
+    elif fmt == "webp":
+        image.save(buffer, "WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, "PNG", compress_level=6)
+    return buffer.getvalue()
+
+
+def _bound(image, max_side: int):
+    if max_side and max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side), _pillow().Resampling.LANCZOS)
+    return image
+
+
+def _crop(image, box: Tuple[float, float, float, float]):
+    """Crop to (x, y, width, height), clamped to the image"""
+    x, y, width, height = box
+    left, top = max(0, round(x)), max(0, round(y))
+    right, bottom = min(image.width, round(x + width)), min(image.height, round(y + height))
+    if right <= left or bottom <= top:
+        raise ScreenshotError(f"Region {list(box)} is outside the {image.width}x{image.height} image")
+    return image.crop((left, top, right, bottom))
+
+
+def dhash(image) -> str:
+    """64-bit difference hash of an image, as 16 hex digits"""
+    Image = _pillow()
+    pixels = image.resize((9, 8), Image.Resampling.BOX).convert("L").tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def hash_distance(first: str, second: str) -> int:
+    """Number of differing bits between two dHashes"""
+    return bin(int(first, 16) ^ int(second, 16)).count("1")
+
+
+def png_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Width and height from a PNG header, or None if ``data`` is not a PNG"""
+    if len(data) < 24 or not data.startswith(_PNG_SIGNATURE):
+        return None
+    return struct.unpack(">II", data[16:24])
+
+
+def process_capture(data: bytes, clip: Optional[Dict[str, float]], viewport: Optional[Dict[str, float]],
+                    device_pixel_ratio: float, max_side: int, fmt: str, quality: int) -> Dict[str, Any]:
+    """Turn a captured viewport into the stored screenshot; runs in a worker process
+
+    Args:
+        data: Encoded capture (PNG from chrome.tabs.captureVisibleTab)
+        clip: Element rectangle in CSS pixels relative to the viewport, or None for the whole viewport
+        viewport: Viewport size in CSS pixels, used to map CSS pixels to capture pixels
+        device_pixel_ratio: Fallback scale when the viewport size is unknown
+        max_side: Longest side of the stored image (0: keep the capture's size)
+        fmt: Output format (see IMAGE_FORMATS)
+        quality: Lossy encoding quality, 1-100
+
+    Returns:
+        Dict containing the encoded image, its format, width, height and dHash
+    """
+    image = _open(data)
+    if clip:
+        scale = image.width / viewport["width"] if viewport and viewport.get("width") else device_pixel_ratio or 1
+        image = _crop(image, tuple(clip[k] * scale for k in ("x", "y", "width", "height")))
+    image = _bound(image, max_side)
+    return {
+        "data": _encode(image, fmt, quality),
+        "format": fmt,
+        "width": image.width,
+        "height": image.height,
+        "phash": dhash(image)
+    }
+
+
+def derive(data: bytes, max_side: int, crop: Optional[List[int]], fmt: str, quality: int) -> Dict[str, Any]:
+    """Thumbnail and/or region crop of a stored screenshot; runs in a worker process
+
+    Args:
+        data: Encoded stored screenshot
+        max_side: Longest side of the result (0: no downscaling)
+        crop: Region [x, y, width, height] in the stored screenshot's pixels, applied before downscaling
+        fmt: Output format (see IMAGE_FORMATS)
+        quality: Lossy encoding quality, 1-100
+    """
+    image = _open(data)
+    if crop:
+        image = _crop(image, tuple(crop))
+    image = _bound(image, max_side)
+    return {"data": _encode(image, fmt, quality), "format": fmt, "width": image.width, "height": image.height}
+
+
+class ImageWorkers:
+    """Run the image functions above off the event loop
+
+    Pillow releases the GIL while it decodes, resamples and encodes, so a
+    thread pool already runs captures in parallel with each other and with
+    the event loop. Worker processes also keep a crashing decoder out of the
+    server, but they are spawned and re-import ``__main__``: only enable them
+    when the server runs from the ``mcp-server`` entry point, never as
+    ``python server.py``, whose top-level setup would run again in every worker.
+
+    Args:
+        workers: Size of the pool, started on first use
+        processes: Use worker processes instead of threads
+    """
+    def __init__(self, workers: int, processes: bool = False):
+        self.workers = max(1, workers)
+        self.processes = processes
+        self._pool: Optional[Executor] = None
+        self.jobs = 0
+        self.crashes = 0
+
+    def _executor(self) -> Executor:
+        if self._pool is None:
+            if self.processes:
+                # Spawned, not forked: the server has threads running (asyncio.to_thread, the sampler)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image")
+        return self._pool
+
+    async def run(self, func: Callable[..., Dict[str, Any]], *args) -> Dict[str, Any]:
+        self.jobs += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor(), func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); the next call starts a fresh pool
+            self.crashes += 1
+            self._pool = None
+            raise ScreenshotError("Image worker process crashed") from None
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "processes": self.processes,
+            "running": self._pool is not None,
+            "jobs": self.jobs,
+            "crashes": self.crashes
+        }
+
+
+def is_key(value: Any) -> bool:
+    return isinstance(value, str) and _KEY.fullmatch(value) is not None
+
+
+def derived_key(source: str, *params: Any) -> str:
+    """Store key of an image derived from ``source`` with ``params``"""
+    return hashlib.sha256(":".join(map(str, (source, *params))).encode()).hexdigest()
+
+
+class ScreenshotStore:
+    """Content-addressed image files under ``directory``, bounded by total size
+
+    Files live at ``<directory>/<key[:2]>/<key>.<ext>``. The index is built by
+    scanning the directory (load(), or on first use), oldest modification time
+    first, and reading a file refreshes its modification time, so recency
+    survives a restart. Methods other than stats() touch the disk; call them
+    from a worker thread.
+    """
+    def __init__(self, directory: Path, budget_bytes: int):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        # key -> (path, size), least recently used first
+        self._files: "OrderedDict[str, Tuple[Path, int]]" = OrderedDict()
+        self._bytes = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """Index the files already in the directory (once)"""
+        with self._lock:
+            self._load()
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        found = []
+        for path in self.directory.glob("??/*.*"):
+            if not is_key(path.stem) or path.suffix[1:] not in _EXTENSION_FORMATS:
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            found.append((stat.st_mtime, path.stem, path, stat.st_size))
+        for _, key, path, size in sorted(found):
+            self._files[key] = (path, size)
+            self._bytes += size
+        if found:
+            logger.info(f"Screenshot store {self.directory}: {len(found)} files, {self._bytes} bytes")
+        self._evict()
+
+    def put(self, data: bytes, fmt: str, key: Optional[str] = None) -> str:
+        """Store an encoded image (under the SHA-256 of ``data`` unless ``key`` is given); returns its key"""
+        key = key or hashlib.sha256(data).hexdigest()
+        path = self.directory / key[:2] / f"{key}.{IMAGE_FORMATS[fmt]}"
+        with self._lock:
+            self._load()
+            if key in self._files:
+                self._files.move_to_end(key)
+                _touch(path)
+                return key
+            path.parent.mkdir(parents=True, exist_ok=True)
+            partial = path.with_suffix(".part")
+            partial.write_bytes(data)
+            os.replace(partial, path)
+            self._files[key] = (path, len(data))
+            self._bytes += len(data)
+            self._evict()
+        return key
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Encoded image and its format, or None if unknown or evicted"""
+        if not is_key(key):
+            return None
+        with self._lock:
+            self._load()
+            entry = self._files.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._files.move_to_end(key)
+        path = entry[0]
+        try:
+            data = path.read_bytes()
+        except OSError:
+            with self._lock:
+                self._forget(key)
+            self.misses += 1
+            return None
+        _touch(path)
+        self.hits += 1
+        return data, _EXTENSION_FORMATS[path.suffix[1:]]
+
+    def _forget(self, key: str) -> None:
+        entry = self._files.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _evict(self) -> None:
+        # The newest file is kept even if it alone exceeds the budget
+        while self._bytes > self.budget_bytes and len(self._files) > 1:
+            key, (path, _) = next(iter(self._files.items()))
+            self._forget(key)
+            path.unlink(missing_ok=True)
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters kept in memory; read without the lock, so safe to call on the event loop"""
+        return {
+            "directory": str(self.directory),
+            "loaded": self._loaded,
+            "files": len(self._files),
+            "bytes": self._bytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted
+        }
+
+
+def _touch(path: Path) -> None:
+    try:
+        os.utime(path)
+    except OSError:
+        pass
@@ -1,22 +1,49 @@
 import asyncio
-import json
+import base64
 import logging
 import os
 import sys
 import socket
 import time
 
-import psutil
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Set, Tuple
+from urllib.parse import unquote
 
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from mcp.server import FastMCP
+from mcp.server.fastmcp import Image
+from mcp.server.fastmcp.exceptions import ToolError
 
-from managers import ConnectionManager
-from models import MessageModel
+from admission import ConcurrencyLimiter, RateLimiter, Throttled, parse_rate_limits
+from codec import MessageError, loads, validate_inbound
+from dom import DomIndex, describe, extract_text, outer_html
+from framing import (
+    ENCODING_JSON, ENCODINGS, FRAME_BLOB, FRAME_DEFLATE, FrameError, decode_binary, decode_channel_frame,
+    split_channel_frame
+)
+from heartbeat import Heartbeats
+from macros import MacroError, MacroRunner, validate as validate_macro
+from managers import SLOW_CONSUMER_POLICIES, CommandCancelled, ConnectionManager
+from metrics import SIZE_BUCKETS, Metrics, TraceLog
+from models import Message
+from mux import MuxChannel, MuxConnection
+from recorder import DIRECTION_IN, KIND_BINARY, KIND_CLOSE, KIND_OPEN, KIND_TEXT, SessionRecorder
+from registry import RedisTabRegistry, TabRegistry, TabRouter
+from sampler import SystemSampler
+from screenshots import (
+    HAVE_PILLOW, IMAGE_FORMATS, ImageWorkers, ScreenshotError, ScreenshotStore, derive, derived_key, hash_distance,
+    png_size, process_capture
+)
+from startup import DrainingServer, bind_with_handoff, find_previous_instance, pid_file_path
+from store import TabStateStore
+from streams import KIND_STATE, StreamAssembler, StreamError, Transfer, TransferStore
+from tables import EXPORT_FORMATS, Table, TableError, TableStore, iter_jsonl_rows
+from views import ViewCache
+from watchers import CONDITIONS, CONDITION_SELECTOR_APPEARED, CONDITION_SELECTOR_GONE, PageWatchers
 
 # Load environment variables
 load_dotenv()
@@ -30,11 +57,180 @@ logger = logging.getLogger(__name__)
 
 # Get server configuration from environment variables
 WEBSOCKET_PORT = int(os.getenv('WEBSOCKET_PORT', '8012'))
+# Seconds to wait for the extension to answer a command
+COMMAND_TIMEOUT = float(os.getenv('COMMAND_TIMEOUT', '30'))
+# Outgoing messages at least this long are compressed for tabs using ?encoding=deflate
+COMPRESS_THRESHOLD = int(os.getenv('COMPRESS_THRESHOLD', '16384'))
+# Upper bound on a decompressed inbound message
+MAX_MESSAGE_BYTES = int(os.getenv('MAX_MESSAGE_BYTES', str(64 * 1024 * 1024)))
+# Per-connection outgoing queue: capacity, overflow policy and stalled-send limit
+SEND_QUEUE_SIZE = int(os.getenv('SEND_QUEUE_SIZE', '256'))
+SLOW_CONSUMER_POLICY = os.getenv('SLOW_CONSUMER_POLICY', 'drop_oldest')
+SEND_TIMEOUT = float(os.getenv('SEND_TIMEOUT', '10'))
+# Page content held in memory across all tabs before LRU compression/spilling kicks in
+TAB_MEMORY_BUDGET_MB = float(os.getenv('TAB_MEMORY_BUDGET_MB', '256'))
+TAB_COMPRESS = os.getenv('TAB_COMPRESS', '1') == '1'
+# Memory for views derived from page content (parsed DOM indexes, text, selections), on top of the budget above
+VIEW_CACHE_MB = float(os.getenv('VIEW_CACHE_MB', '128'))
+# Directory for spilled page content; empty disables spilling
+TAB_SPILL_DIR = os.getenv('TAB_SPILL_DIR', str(Path.home() / ".mcp-server" / "cache"))
+# Characters per page for resource://{tab_id}/page|text|readable/{page}
+RESOURCE_PAGE_SIZE = int(os.getenv('RESOURCE_PAGE_SIZE', '50000'))
+# Maximum elements returned by resource://{tab_id}/select/{selector}
+SELECT_LIMIT = int(os.getenv('SELECT_LIMIT', '50'))
+# Parse and index each snapshot as it arrives rather than on first query
+DOM_INDEX_EAGER = os.getenv('DOM_INDEX_EAGER', '1') == '1'
+# Maximum operations tool_batch runs at once
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '32'))
+# Seconds between system stat samples, and how many samples resource://system_info summarizes
+SYSTEM_SAMPLE_INTERVAL = float(os.getenv('SYSTEM_SAMPLE_INTERVAL', '5'))
+SYSTEM_SAMPLE_WINDOW = int(os.getenv('SYSTEM_SAMPLE_WINDOW', '60'))
+# Commands awaiting replies at once per tab, and commands that run alone (see CommandQueue)
+MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT', '4'))
+BARRIER_COMMANDS = tuple(c.strip() for c in os.getenv('BARRIER_COMMANDS', 'navigateTo,reload').split(',') if c.strip())
+# Tool calls per second each tab accepts (0: unlimited), and how many it accepts at once after a pause;
+# tool_pipeline, tool_run_macro and tool_batch count once per tab, not once per step
+TAB_RATE_LIMIT = float(os.getenv('TAB_RATE_LIMIT', '20'))
+TAB_RATE_BURST = float(os.getenv('TAB_RATE_BURST', '40'))
+# Tighter per-tab limits for some commands, as command=rate/burst (rate per second);
+# these apply to every command sent, including each step of a pipeline, macro or batch
+COMMAND_RATE_LIMITS = parse_rate_limits(os.getenv('COMMAND_RATE_LIMITS', 'navigateTo=1/5,reload=1/5,takeScreenshot=2/5'))
+# Commands awaiting replies at once across all tabs (0: unlimited); more wait in a queue of
+# COMMAND_QUEUE_LIMIT for up to COMMAND_QUEUE_TIMEOUT seconds and are throttled beyond that
+MAX_CONCURRENT_COMMANDS = int(os.getenv('MAX_CONCURRENT_COMMANDS', '64'))
+COMMAND_QUEUE_LIMIT = int(os.getenv('COMMAND_QUEUE_LIMIT', '256'))
+COMMAND_QUEUE_TIMEOUT = float(os.getenv('COMMAND_QUEUE_TIMEOUT', '10'))
+# Identity of this worker and the shared tab registry (empty: single worker, in-process)
+WORKER_ID = os.getenv('WORKER_ID', f"{socket.gethostname()}-{os.getpid()}")
+TAB_REGISTRY_URL = os.getenv('TAB_REGISTRY_URL', '')
+# Serve MCP over stdio; extra websocket-only workers set this to 0
+MCP_STDIO = os.getenv('MCP_STDIO', '1') == '1'
+# Optional JSON-lines trace of tool calls, commands and inbound messages
+MCP_TRACE_LOG = os.getenv('MCP_TRACE_LOG', '')
+# Quiet period after a page update before subscribers and waiters are notified
+SUBSCRIPTION_DEBOUNCE_MS = float(os.getenv('SUBSCRIPTION_DEBOUNCE_MS', '250'))
+# Chunked streams: largest assembled payload, bytes per stream held in memory before
+# spooling to STREAM_SPOOL_DIR (empty: system temp dir), and seconds to complete
+STREAM_MAX_BYTES = int(os.getenv('STREAM_MAX_BYTES', str(512 * 1024 * 1024)))
+STREAM_SPOOL_MEMORY = int(os.getenv('STREAM_SPOOL_MEMORY', str(1024 * 1024)))
+STREAM_SPOOL_DIR = os.getenv('STREAM_SPOOL_DIR', '')
+STREAM_TIMEOUT = float(os.getenv('STREAM_TIMEOUT', '60'))
+# Completed transfers (screenshots etc.) kept for ranged reads: total size and lifetime
+TRANSFER_BUDGET_MB = float(os.getenv('TRANSFER_BUDGET_MB', '256'))
+TRANSFER_TTL = float(os.getenv('TRANSFER_TTL', '600'))
+# Largest range tool_read_transfer returns at once
+TRANSFER_READ_LIMIT = int(os.getenv('TRANSFER_READ_LIMIT', str(1024 * 1024)))
+# Record all tab traffic under this directory for replay (empty: off), with segment size and retention
+MCP_RECORD_DIR = os.getenv('MCP_RECORD_DIR', '')
+MCP_RECORD_SEGMENT_MB = float(os.getenv('MCP_RECORD_SEGMENT_MB', '64'))
+MCP_RECORD_MAX_SEGMENTS = int(os.getenv('MCP_RECORD_MAX_SEGMENTS', '0'))
+# Bind with SO_REUSEPORT and hand over from the previous instance in the PID file instead of
+# scanning for and killing whatever process holds the port (0: the old port-kill startup).
+# Workers with TAB_REGISTRY_URL share the port and never hand off or kill (see startup.py)
+FAST_STARTUP = os.getenv('FAST_STARTUP', '1') == '1'
+# Seconds a previous instance gets to release the port when it cannot be shared
+HANDOFF_TIMEOUT = float(os.getenv('HANDOFF_TIMEOUT', '10'))
+# Seconds in-flight commands get to finish on shutdown before tabs are told to reconnect
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', '5'))
+# Ping a tab after this many seconds of silence (0: off); disconnect it after HEARTBEAT_TIMEOUT
+HEARTBEAT_INTERVAL = float(os.getenv('HEARTBEAT_INTERVAL', '15'))
+HEARTBEAT_TIMEOUT = float(os.getenv('HEARTBEAT_TIMEOUT', '45'))
+# Extracted tables: rows per columnar batch, memory kept across tables, and lifetime
+TABLE_BATCH_ROWS = int(os.getenv('TABLE_BATCH_ROWS', '4096'))
+TABLE_BUDGET_MB = float(os.getenv('TABLE_BUDGET_MB', '128'))
+TABLE_TTL = float(os.getenv('TABLE_TTL', '1800'))
+# Largest page tool_table_page returns, and where tool_table_export writes files
+TABLE_PAGE_LIMIT = int(os.getenv('TABLE_PAGE_LIMIT', '500'))
+TABLE_EXPORT_DIR = Path(os.getenv('TABLE_EXPORT_DIR', str(Path.home() / ".mcp-server" / "exports")))
+# Screenshot store directory and size, and image workers (threads, or processes with
+# SCREENSHOT_PROCESSES=1 when started as mcp-server; see ImageWorkers)
+SCREENSHOT_DIR = Path(os.getenv('SCREENSHOT_DIR', str(Path.home() / ".mcp-server" / "screenshots")))
+SCREENSHOT_BUDGET_MB = float(os.getenv('SCREENSHOT_BUDGET_MB', '512'))
+SCREENSHOT_WORKERS = int(os.getenv('SCREENSHOT_WORKERS', '2'))
+SCREENSHOT_PROCESSES = os.getenv('SCREENSHOT_PROCESSES', '0') == '1'
+# Stored screenshots: format (webp, png or jpeg), lossy quality and longest side in pixels (0: capture size)
+SCREENSHOT_FORMAT = os.getenv('SCREENSHOT_FORMAT', 'webp')
+SCREENSHOT_QUALITY = int(os.getenv('SCREENSHOT_QUALITY', '85'))
+SCREENSHOT_MAX_SIDE = int(os.getenv('SCREENSHOT_MAX_SIDE', '2560'))
+# Perceptual hash bits two captures of a tab may differ by and still count as unchanged
+SCREENSHOT_SIMILAR_BITS = int(os.getenv('SCREENSHOT_SIMILAR_BITS', '4'))
+if SLOW_CONSUMER_POLICY not in SLOW_CONSUMER_POLICIES:
+    raise ValueError(f"SLOW_CONSUMER_POLICY must be one of {', '.join(SLOW_CONSUMER_POLICIES)}")
+if SCREENSHOT_FORMAT not in IMAGE_FORMATS:
+    raise ValueError(f"SCREENSHOT_FORMAT must be one of {', '.join(IMAGE_FORMATS)}")
 
 # Initialize FastAPI app and managers
 app = FastAPI()
-manager = ConnectionManager()
+metrics = Metrics(trace_log=TraceLog(Path(MCP_TRACE_LOG)) if MCP_TRACE_LOG else None)
+recorder = SessionRecorder(
+    Path(MCP_RECORD_DIR),
+    segment_bytes=int(MCP_RECORD_SEGMENT_MB * 1024 * 1024),
+    max_segments=MCP_RECORD_MAX_SEGMENTS
+) if MCP_RECORD_DIR else None
+manager = ConnectionManager(
+    compress_threshold=COMPRESS_THRESHOLD,
+    send_queue_size=SEND_QUEUE_SIZE,
+    slow_consumer_policy=SLOW_CONSUMER_POLICY,
+    send_timeout=SEND_TIMEOUT,
+    state_store=TabStateStore(
+        memory_budget=int(TAB_MEMORY_BUDGET_MB * 1024 * 1024),
+        compress=TAB_COMPRESS,
+        spill_dir=Path(TAB_SPILL_DIR) if TAB_SPILL_DIR else None
+    ),
+    metrics=metrics,
+    max_in_flight=MAX_IN_FLIGHT,
+    barrier_commands=BARRIER_COMMANDS,
+    recorder=recorder,
+    concurrency=ConcurrencyLimiter(MAX_CONCURRENT_COMMANDS, COMMAND_QUEUE_LIMIT, COMMAND_QUEUE_TIMEOUT),
+    views=ViewCache(max_bytes=int(VIEW_CACHE_MB * 1024 * 1024))
+)
+rate_limits = RateLimiter(TAB_RATE_LIMIT, TAB_RATE_BURST, COMMAND_RATE_LIMITS)
+# Routes commands to whichever worker holds a tab's websocket
+router = TabRouter(
+    manager,
+    RedisTabRegistry(WORKER_ID, TAB_REGISTRY_URL) if TAB_REGISTRY_URL else TabRegistry(WORKER_ID)
+)
+streams = StreamAssembler(
+    max_bytes=STREAM_MAX_BYTES,
+    spool_memory=STREAM_SPOOL_MEMORY,
+    spool_dir=Path(STREAM_SPOOL_DIR) if STREAM_SPOOL_DIR else None,
+    timeout=STREAM_TIMEOUT
+)
+transfers = TransferStore(budget_bytes=int(TRANSFER_BUDGET_MB * 1024 * 1024), ttl=TRANSFER_TTL)
+tables = TableStore(budget_bytes=int(TABLE_BUDGET_MB * 1024 * 1024), ttl=TABLE_TTL)
+screenshots = ScreenshotStore(SCREENSHOT_DIR, budget_bytes=int(SCREENSHOT_BUDGET_MB * 1024 * 1024))
+if SCREENSHOT_PROCESSES and __name__ == "__main__":
+    # Spawned workers would re-run this whole file as __mp_main__
+    logger.warning("SCREENSHOT_PROCESSES needs the mcp-server entry point; using image worker threads")
+image_workers = ImageWorkers(SCREENSHOT_WORKERS, processes=SCREENSHOT_PROCESSES and __name__ != "__main__")
+# Each tab's latest screenshot (ID, perceptual hash) per selector, to tell whether a new capture shows anything new
+last_screenshots: Dict[str, Dict[Any, Tuple[str, str]]] = {}
+heartbeats = Heartbeats(
+    send=lambda tab_id, frame: manager.send_personal_message(frame, tab_id),
+    on_dead=lambda tab_id: _reap_tab(tab_id),
+    interval=HEARTBEAT_INTERVAL,
+    timeout=HEARTBEAT_TIMEOUT
+)
 mcp = FastMCP()
+sampler = SystemSampler(interval=SYSTEM_SAMPLE_INTERVAL, window=SYSTEM_SAMPLE_WINDOW)
+
+# Commands implemented by content.js
+BROWSER_COMMANDS = (
+    "status", "reload", "changeBackground", "navigateTo", "clickElement", "typeText",
+    "getElementInfo", "waitForElement", "fillForm", "extractTable", "takeScreenshot"
+)
+
+# Message types received from the extension; anything else is counted as "other"
+INBOUND_TYPES = ("updateState", "patchState", "commandResult", "streamStart", "streamChunk", "streamEnd", "pong")
+
+# Sent when a patchState does not apply to the stored snapshot
+RESYNC_MESSAGE = Message(type="resyncState", args=[], sender_id="server").to_json()
+# Sent when a tab's frame cannot be decoded or does not match its type's schema
+FORMAT_ERROR_MESSAGE = Message(
+    type="error",
+    args=["Invalid message format. Please send valid JSON."],
+    sender_id="server"
+).to_json()
 
 @mcp.prompt()
 def get_prompt() -> str:
@@ -98,9 +294,50 @@ def get_prompt() -> str:
     
     6. Extract table data:
        tool_extract_table(selector=".data-table", tab_id="your_tab_id")
+       Its result holds a table_id with column types and a preview, not the rows, as in
+       batch, pipeline and macro steps; then
+       tool_table_page(table_id="...", offset=0, limit=100) or
+       tool_table_export(table_id="...", format="csv")  # or "jsonl", "parquet"
     
     7. Monitor page status:
        resource://{tab_id} - Returns current URL and HTML content of the page
+       resource://{tab_id}/meta, /text/{page}, /select/{selector} - Smaller views of the same page
+    
+    8. Query the page without a browser round trip:
+       tool_query_dom(selector="a[href]", tab_id="your_tab_id", fields=["text", "href"])
+
+    9. Run a command on many tabs at once:
+       tool_batch(operations=[{"tab_id": "1", "command": "extractTable", "args": [".data-table"]},
+                              {"tab_id": "2", "command": "navigateTo", "args": ["https://example.com"]}])
+       tool_batch(command="reload", group="scrapers")
+
+    10. Run a whole plan against one tab in one call:
+       tool_pipeline(tab_id="1", steps=[{"command": "navigateTo", "args": ["https://example.com"]},
+                                        {"command": "waitForElement", "args": ["#login", 5000]},
+                                        {"command": "typeText", "args": ["#user", "me"]},
+                                        {"command": "clickElement", "args": ["#login"]}])
+       Commands to a tab always run in the order they were issued; navigateTo and
+       reload wait for earlier commands and hold back later ones.
+       tool_cancel_commands(tab_id="1") cancels whatever is still queued.
+
+    11. Run a flow with waits, conditions and captures in one call:
+       tool_run_macro(tab_id="1", steps=[
+           {"command": "navigateTo", "args": ["https://example.com/search"]},
+           {"wait": "selector_appeared", "selector": "#q"},
+           {"command": "typeText", "args": ["#q", "laptops"]},
+           {"command": "clickElement", "args": ["#go"]},
+           {"wait": "selector_appeared", "selector": "table.results"},
+           {"command": "extractTable", "args": ["table.results"], "capture": "table"},
+           {"query": "a.next", "fields": ["href"], "capture": "next", "pick": "0.href",
+            "when": {"selector": "a.next"}}])
+       Only the captured values are returned.
+
+    12. Look at a page:
+       tool_take_screenshot(tab_id="your_tab_id", selector="#chart")  # selector is optional
+       Its result holds a screenshot_id, the size and whether it looks unchanged from
+       the tab's previous screenshot; only then fetch pixels, as small as will do:
+       tool_screenshot_image(screenshot_id="...", max_side=512)
+       tool_screenshot_image(screenshot_id="...", crop=[0, 0, 400, 300], max_side=0)
     
     Important Notes:
     1. Chrome Security Restrictions:
@@ -113,81 +350,304 @@ def get_prompt() -> str:
        - Always provide tab_id for operations
        - Use tool_tab_list() to get available tabs
        - Check tab state before operations
-       - Use resource://{tab_id} to monitor page status in real-time
+       - Subscribe to resource://{tab_id}/meta (url or content changed) or
+         resource://{tab_id}/select/{selector} (match count changed) instead of polling
+       - Use tool_wait_for_change() to block until the URL or content changes, or a
+         selector appears or disappears
     
     3. Error Handling:
+       - Every tool waits for the browser and returns {"success": true, "result": ...}
+         or {"success": false, "error": ...}
+       - {"success": false, "throttled": true, "retry_after": seconds} means the tab or
+         the server is over its limits; wait that long before retrying, do not loop
        - Check return values for success/error status
        - Handle timeouts for wait operations
        - Consider website's loading state
     """
     return get_prompt.__doc__
 
+async def _open_tab(websocket, tab_id: str, encoding: str, accept: bool = True) -> None:
+    """Register a tab's connection (a socket or a mux channel) and greet it"""
+    await manager.connect(websocket, tab_id, encoding, accept=accept)
+    await router.register(tab_id)
+    heartbeats.start()
+    heartbeats.add(tab_id)
+    if recorder is not None:
+        recorder.record(DIRECTION_IN, tab_id, encoding, KIND_OPEN)
+
+    # Send connection confirmation
+    welcome_msg = Message(
+        type="system",
+        args=[f"Connected successfully. Tab ID: {tab_id}"],
+        sender_id="server"
+    )
+    await manager.send_personal_message(welcome_msg.to_json(), tab_id)
+
+    # Update tab information
+    manager.update_tab_info(tab_id, {
+        "url": None,
+        "content": None,
+        "version": None
+    })
+
+async def _close_tab(tab_id: str, websocket) -> None:
+    """Forget a tab's connection unless it was already replaced by a newer one"""
+    await manager.disconnect(tab_id, websocket)
+    if tab_id not in manager.connections:
+        heartbeats.remove(tab_id)
+        streams.abort(tab_id)
+        last_screenshots.pop(tab_id, None)
+        rate_limits.forget(tab_id)
+        await router.unregister(tab_id)
+        if recorder is not None:
+            recorder.record(DIRECTION_IN, tab_id, None, KIND_CLOSE)
+
+async def _reap_tab(tab_id: str) -> None:
+    """Disconnect a tab that stopped answering heartbeats"""
+    connection = manager.connections.get(tab_id)
+    if connection is None:
+        return
+    # Forget the tab first; closing a half-open socket can take until the send times out
+    await _close_tab(tab_id, connection)
+    try:
+        await asyncio.wait_for(connection.close(1001), SEND_TIMEOUT)
+    except Exception:
+        pass
+
+async def _handle_tab_message(tab_id: str, message: Dict[str, Any]) -> None:
+    """Handle one decoded message from a tab"""
+    heartbeats.touch(tab_id)
+    # Handle different message types
+    if message['type'] == "updateState":
+        # Handle full state snapshot
+        if (message['args'] and isinstance(message['args'], list) and len(message['args']) > 0):
+            changed = manager.update_tab_info(tab_id, {
+                "url": message['args'][0],
+                "content": message['args'][1],
+                "version": message.get('version')
+            })
+            # Identical snapshots are stored once and not re-indexed
+            if changed and DOM_INDEX_EAGER:
+                _spawn(_warm_dom_index(tab_id))
+    elif message['type'] == "patchState":
+        # Handle incremental update against the last snapshot
+        args = message.get('args') or [None]
+        if not await manager.apply_state_patch(
+            tab_id,
+            args[0],
+            message.get('base_version'),
+            message.get('version'),
+            message.get('patch') or []
+        ):
+            # Versions diverged; ask the extension for a full snapshot
+            await manager.send_personal_message(RESYNC_MESSAGE, tab_id)
+        elif DOM_INDEX_EAGER:
+            _spawn(_warm_dom_index(tab_id))
+    elif message['type'] == "commandResult":
+        # Complete the tool call waiting on this request
+        if not manager.resolve_request(message):
+            logger.debug(f"Dropping unmatched result from {tab_id}: {message.get('request_id')}")
+    elif message['type'] in ("streamStart", "streamChunk", "streamEnd"):
+        await _handle_stream_message(tab_id, message)
+    elif message['type'] == "pong":
+        heartbeats.pong(tab_id, message['ping_id'])
+
+async def _handle_stream_message(tab_id: str, message: Dict[str, Any]) -> None:
+    """Assemble a chunked stream (see streams.py) and deliver it once complete"""
+    try:
+        if message['type'] == "streamStart":
+            streams.start(tab_id, message)
+            return
+        if message['type'] == "streamChunk":
+            streams.chunk(tab_id, message)
+            return
+        transfer = streams.finish(tab_id, message)
+    except StreamError as e:
+        logger.warning(f"Dropped stream from {tab_id}: {e}")
+        if e.kind == KIND_STATE:
+            # The snapshot never arrived; ask for a fresh one
+            await manager.send_personal_message(RESYNC_MESSAGE, tab_id)
+        return
+
+    if transfer.kind == KIND_STATE:
+        try:
+            content = await asyncio.to_thread(transfer.text)
+        finally:
+            transfer.close()
+        args = transfer.header.get("args") or [None]
+        await _handle_tab_message(tab_id, {
+            "type": "updateState",
+            "args": [args[0], content],
+            "version": transfer.header.get("version")
+        })
+    else:
+        transfers.add(transfer)
+
+async def _send_format_error(tab_id: str, reason: Exception) -> None:
+    logger.warning(f"Invalid message format from {tab_id}: {reason}")
+    await manager.send_personal_message(FORMAT_ERROR_MESSAGE, tab_id)
+
 @app.websocket("/mcp/{tab_id}")
-async def websocket_endpoint(websocket: WebSocket, tab_id: str):
-    """WebSocket endpoint handler with tab_id as path variable"""
+async def websocket_endpoint(websocket: WebSocket, tab_id: str, encoding: str = ENCODING_JSON):
+    """WebSocket endpoint handler with tab_id as path variable
+
+    The optional ``encoding`` query parameter negotiates the wire format
+    (``json`` or ``deflate``, see framing.py).
+    """
+    if encoding not in ENCODINGS:
+        encoding = ENCODING_JSON
     try:
         # Connect to the WebSocket
-        await manager.connect(websocket, tab_id)
-        
-        # Send connection confirmation
-        welcome_msg = MessageModel(
-            type="system",
-            args=[f"Connected successfully. Tab ID: {tab_id}"],
-            sender_id="server"
-        )
-        await manager.send_personal_message(welcome_msg.model_dump_json(), tab_id)
-        
-        # Update tab information
-        manager.update_tab_info(tab_id, {
-            "url": None,
-            "content": None
-        })
-        
+        await _open_tab(websocket, tab_id, encoding)
+
         # Keep the connection alive
         while True:
+            # Receive and parse message (text JSON or binary frame)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            received = time.perf_counter()
+            if recorder is not None:
+                recorder.record(DIRECTION_IN, tab_id, frame.get("bytes") or frame.get("text"))
             try:
-                # Receive and parse message
-                data = await websocket.receive_text()
-                # json string to dict
-                message = json.loads(data)
-                # Handle different message types
-                if message['type'] == "updateState":
-                    # Handle state update
-                    if (message['args'] and isinstance(message['args'], list) and len(message['args']) > 0):
-                        manager.update_tab_info(tab_id, {
-                            "url": message['args'][0],
-                            "content": message['args'][1]
-                        })
-
-            except json.JSONDecodeError:
-                logger.warning(f"Invalid message format from {tab_id}")
-                error_msg = MessageModel(
-                    type="error",
-                    args=["Invalid message format. Please send valid JSON."],
-                    sender_id="server"
-                )
-                await manager.send_personal_message(error_msg.model_dump_json(), tab_id)
+                if frame.get("bytes") is not None:
+                    size = len(frame["bytes"])
+                    message = decode_binary(frame["bytes"], MAX_MESSAGE_BYTES)
+                else:
+                    # json string to dict
+                    size = len(frame["text"])
+                    message = loads(frame["text"])
+                validate_inbound(message)
+            except (ValueError, FrameError) as e:
+                # JSONDecodeError and MessageError are ValueErrors
+                await _send_format_error(tab_id, e)
                 continue
+            await _handle_tab_message(tab_id, message)
+            _record_inbound(tab_id, message['type'], size, time.perf_counter() - received)
 
     except WebSocketDisconnect:
-        await manager.disconnect(tab_id)
+        pass
     except Exception as e:
         print(f"Error in WebSocket connection: {e}")
-        await manager.disconnect(tab_id)
+    await _close_tab(tab_id, websocket)
+
+@app.websocket("/mcp-mux")
+async def websocket_mux_endpoint(websocket: WebSocket, encoding: str = ENCODING_JSON):
+    """Multiplexed endpoint carrying many tabs over one extension websocket
+
+    Every frame is a channel frame (see framing.py) whose channel is the tab
+    ID. A tab joins with {"type": "open"} and leaves with {"type": "close"} on
+    its channel; everything else is handled exactly like /mcp/{tab_id}.
+    """
+    if encoding not in ENCODINGS:
+        encoding = ENCODING_JSON
+    await websocket.accept()
+
+    def channel_closed(channel: MuxChannel) -> None:
+        _spawn(_close_tab(channel.tab_id, channel))
+
+    mux = MuxConnection(websocket, channel_closed)
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            received = time.perf_counter()
+            data = frame.get("bytes")
+            if data is None:
+                logger.warning("Ignoring text frame on multiplexed connection")
+                continue
+            try:
+                tab_id, message = decode_channel_frame(data, MAX_MESSAGE_BYTES)
+            except (ValueError, FrameError) as e:
+                logger.warning(f"Invalid channel frame: {e}")
+                continue
+
+            message_type = message.get("type")
+            if message_type == "open":
+                await _open_tab(mux.open(tab_id), tab_id, encoding, accept=False)
+            elif message_type == "close":
+                channel = mux.get(tab_id)
+                if channel is not None:
+                    mux.discard(channel)
+                    await _close_tab(tab_id, channel)
+            elif mux.get(tab_id) is not None:
+                if recorder is not None:
+                    _record_channel_frame(tab_id, data)
+                try:
+                    validate_inbound(message)
+                except MessageError as e:
+                    await _send_format_error(tab_id, e)
+                    continue
+                await _handle_tab_message(tab_id, message)
+                _record_inbound(tab_id, message_type, len(data), time.perf_counter() - received)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error in multiplexed connection: {e}")
+    for channel in list(mux.channels.values()):
+        mux.discard(channel)
+        await _close_tab(channel.tab_id, channel)
+
+
+def _record_channel_frame(tab_id: str, data: bytes) -> None:
+    """Record a multiplexed frame as the frame the tab would send on /mcp/{tab_id}"""
+    _, inner = split_channel_frame(data)
+    kind = KIND_BINARY if inner[0] in (FRAME_DEFLATE, FRAME_BLOB) else KIND_TEXT
+    recorder.record(DIRECTION_IN, tab_id, inner, kind)
 
+def _record_inbound(tab_id: str, message_type: Any, size: int, elapsed: float) -> None:
+    """Count and time one message received from a tab"""
+    message_type = message_type if message_type in INBOUND_TYPES else "other"
+    metrics.inc("mcp_inbound_messages_total", "Messages received from tabs",
+                {"tab_id": tab_id, "type": message_type})
+    metrics.observe("mcp_inbound_message_bytes", "Size of messages received from tabs, as sent on the wire",
+                    size, {"type": message_type}, buckets=SIZE_BUCKETS)
+    metrics.observe("mcp_inbound_handle_seconds", "Time spent handling a received message",
+                    elapsed, {"type": message_type})
+    metrics.trace("inbound", tab_id=tab_id, type=message_type, bytes=size, duration=round(elapsed, 6))
+
+@app.get("/metrics")
+def metrics_endpoint() -> PlainTextResponse:
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+metrics.gauge("mcp_active_connections", "Connected tabs", (),
+              lambda: {(): len(manager.connections)})
+metrics.gauge("mcp_pending_requests", "Commands waiting for a reply", (),
+              lambda: {(): len(manager.pending_requests)})
+metrics.gauge("mcp_outbound_queue_depth", "Frames waiting in each tab's send queue", ("tab_id",),
+              lambda: {(tab_id,): stats["queue_depth"] for tab_id, stats in manager.get_queue_stats().items()})
+metrics.gauge("mcp_outbound_queue_high_water", "Deepest each tab's send queue has been", ("tab_id",),
+              lambda: {(tab_id,): stats["queue_high_water"] for tab_id, stats in manager.get_queue_stats().items()})
+metrics.gauge("mcp_state_store_bytes", "Page content held in memory", (),
+              lambda: {(): manager.state_store.stats()["memory_bytes"]})
 
 @mcp.tool()
-def tool_tab_list() -> Dict[str, Any]:
+@metrics.instrument_tool
+async def tool_tab_list() -> Dict[str, Any]:
     """Get a list of all connected tabs
 
+    Tabs that stop answering heartbeats are disconnected and drop out of the
+    list (see HEARTBEAT_INTERVAL / HEARTBEAT_TIMEOUT).
+
     Returns:
-        Dict containing a list of active tabs
+        Dict containing a list of active tabs on every worker, the worker
+        holding each tab, and for tabs on this worker their liveness: seconds
+        since last heard from, last ping round trip and unanswered pings
     """
-    return {"tabs": list(manager.get_active_tabs())}
+    tabs = await router.tabs()
+    liveness = {}
+    for tab_id in tabs:
+        # Only tabs connected to this worker are tracked
+        described = heartbeats.describe(tab_id)
+        if described is not None:
+            liveness[tab_id] = described
+    return {"tabs": list(tabs), "workers": tabs, "liveness": liveness}
 
 
 @mcp.resource("resource://{tab_id}")
-def mcp_status(tab_id) -> Dict[str, Any]:
+async def mcp_status(tab_id) -> Dict[str, Any]:
     """Get the current state of a specific tab including URL and HTML content.
     
     This resource provides real-time access to the current state of a browser tab,
@@ -201,6 +661,7 @@ def mcp_status(tab_id) -> Dict[str, Any]:
         Dict containing:
             - url: Current URL of the page (or None if not available)
             - content: Current HTML content of the page (or None if not available)
+            - version: Snapshot version reported by the extension
             - error: Error message if the tab is not found or not connected
     
     Example Usage:
@@ -222,14 +683,19 @@ def mcp_status(tab_id) -> Dict[str, Any]:
     
     Notes:
         - This resource updates in real-time as the page changes
-        - The HTML content may be large for complex pages
+        - The HTML content may be large for complex pages; prefer the narrower views:
+            resource://{tab_id}/meta               url, version, length and content hash only
+            resource://{tab_id}/page/{page}        raw HTML in fixed-size pages
+            resource://{tab_id}/text/{page}        visible text only
+            resource://{tab_id}/readable/{page}    main article text only
+            resource://{tab_id}/select/{selector}  HTML of matching elements
         - Use this resource to detect navigation events and page updates
         - Combine with other tools to build automated workflows
     """
     if not tab_id:
         return {"error": "Tab ID is required"}
     
-    tab_info = manager.get_tab_info(tab_id)
+    tab_info = await manager.get_tab_info(tab_id)
     
     # 탭 정보가 없는 경우 처리
     if tab_info is None:
@@ -243,118 +709,424 @@ def mcp_status(tab_id) -> Dict[str, Any]:
     return {
         "url": tab_info.get("url"),
         "content": tab_info.get("content"),
+        "version": tab_info.get("version"),
+    }
+
+async def _snapshot_view(tab_id: str, key: Any, compute) -> Tuple[str, Any]:
+    """Compute a view of a tab's stored snapshot off the event loop, cached by content hash.
+
+    ``compute`` receives the page content and runs in a worker thread.
+
+    Returns:
+        The snapshot's hash and the view
+
+    Raises:
+        LookupError: If the tab is unknown or has no content yet
+    """
+    info = manager.tab_info.get(tab_id)
+    if info is None:
+        raise LookupError(f"Tab with ID {tab_id} not found or not connected")
+    digest = info.get("hash")
+    if digest is None:
+        raise LookupError(f"No page content available for tab {tab_id}")
+    found, value = manager.views.lookup(digest, key)
+    if found:
+        return digest, value
+
+    # load picks the tab's body before its first await, so the content is the snapshot the hash names
+    content = await manager.state_store.load(tab_id)
+    if content is None:
+        raise LookupError(f"No page content available for tab {tab_id}")
+    value = await asyncio.to_thread(compute, content)
+    manager.views.store(digest, key, value)
+    return digest, value
+
+async def _tab_view(tab_id: str, key: Any, compute) -> Any:
+    """Like _snapshot_view, returning only the view"""
+    return (await _snapshot_view(tab_id, key, compute))[1]
+
+async def _dom_index(tab_id: str) -> DomIndex:
+    """Parsed and indexed DOM of a tab's current snapshot"""
+    return await _tab_view(tab_id, "dom", DomIndex.from_html)
+
+async def _dom_view(tab_id: str, key: Any, compute) -> Any:
+    """Compute a view from a tab's DomIndex off the event loop, cached by content hash.
+
+    The view is cached under the hash of the snapshot the index was built
+    from, which may be older than the tab's hash by the time the index is
+    ready; keying on the latter would store an old page's view for a new one.
+    ``compute`` receives the DomIndex and runs in a worker thread.
+
+    Raises:
+        LookupError: If the tab is unknown or has no content yet
+    """
+    digest, index = await _snapshot_view(tab_id, "dom", DomIndex.from_html)
+    found, value = manager.views.lookup(digest, key)
+    if found:
+        return value
+    value = await asyncio.to_thread(compute, index)
+    manager.views.store(digest, key, value)
+    return value
+
+# Tabs with a background index build in progress
+_indexing: Set[str] = set()
+# Strong references to fire-and-forget tasks so they are not garbage collected
+_background_tasks: Set[asyncio.Task] = set()
+
+def _spawn(coro) -> asyncio.Task:
+    """Run a coroutine in the background, keeping a reference until it finishes"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def _warm_dom_index(tab_id: str) -> None:
+    """Index a tab's latest snapshot in the background so queries find it ready.
+
+    At most one build runs per tab; when updates arrive during a build the
+    loop picks up the newest revision afterwards instead of queueing one
+    build per update. Pages already indexed for another tab are reused.
+    """
+    if tab_id in _indexing:
+        return
+    _indexing.add(tab_id)
+    try:
+        while tab_id in manager.tab_info:
+            digest = manager.tab_info[tab_id].get("hash")
+            try:
+                await _dom_index(tab_id)
+            except LookupError:
+                return
+            info = manager.tab_info.get(tab_id)
+            if info is None or info.get("hash") == digest:
+                return
+    except Exception as e:
+        logger.warning(f"Failed to index DOM for tab {tab_id}: {e}")
+    finally:
+        _indexing.discard(tab_id)
+
+def _paginate(text: str, page: str) -> Dict[str, Any]:
+    """Slice text into RESOURCE_PAGE_SIZE-character pages"""
+    try:
+        page_number = int(page)
+    except ValueError:
+        return {"error": f"Invalid page number: {page}"}
+    pages = max(1, -(-len(text) // RESOURCE_PAGE_SIZE))
+    if page_number < 0 or page_number >= pages:
+        return {"error": f"Page {page_number} out of range (0-{pages - 1})"}
+    start = page_number * RESOURCE_PAGE_SIZE
+    return {
+        "page": page_number,
+        "pages": pages,
+        "page_size": RESOURCE_PAGE_SIZE,
+        "total_length": len(text),
+        "content": text[start:start + RESOURCE_PAGE_SIZE]
+    }
+
+@mcp.resource("resource://{tab_id}/meta")
+async def mcp_status_meta(tab_id: str) -> Dict[str, Any]:
+    """Get only the metadata of a tab's current page, without the HTML.
+
+    Returns:
+        Dict containing url, version, length (characters), the content hash
+        and the number of resource://{tab_id}/page/{page} pages
+    """
+    info = manager.tab_info.get(tab_id)
+    if info is None:
+        return {"error": f"Tab with ID {tab_id} not found or not connected"}
+    try:
+        length = await _tab_view(tab_id, "length", len)
+    except LookupError:
+        length = 0
+    return {
+        "url": info.get("url"),
+        "version": info.get("version"),
+        "length": length,
+        "hash": info.get("hash"),
+        "pages": max(1, -(-length // RESOURCE_PAGE_SIZE))
+    }
+
+@mcp.resource("resource://{tab_id}/page/{page}")
+async def mcp_status_page(tab_id: str, page: str) -> Dict[str, Any]:
+    """Get one page (RESOURCE_PAGE_SIZE characters) of a tab's raw HTML.
+
+    Args:
+        tab_id: ID of the target tab
+        page: Zero-based page number
+
+    Returns:
+        Dict containing page, pages, page_size, total_length and content
+    """
+    content = await manager.state_store.load(tab_id)
+    if content is None:
+        return {"error": f"No page content available for tab {tab_id}"}
+    return _paginate(content, page)
+
+@mcp.resource("resource://{tab_id}/text/{page}")
+async def mcp_status_text(tab_id: str, page: str) -> Dict[str, Any]:
+    """Get the visible text of a tab's page (no markup, scripts or styles), paginated.
+
+    Args:
+        tab_id: ID of the target tab
+        page: Zero-based page number
+
+    Returns:
+        Dict containing page, pages, page_size, total_length and content
+    """
+    try:
+        text = await _dom_view(tab_id, "text", lambda index: extract_text(index.root))
+    except LookupError as e:
+        return {"error": str(e)}
+    return _paginate(text, page)
+
+@mcp.resource("resource://{tab_id}/readable/{page}")
+async def mcp_status_readable(tab_id: str, page: str) -> Dict[str, Any]:
+    """Get the main article text of a tab's page, skipping navigation and page chrome.
+
+    Args:
+        tab_id: ID of the target tab
+        page: Zero-based page number
+
+    Returns:
+        Dict containing page, pages, page_size, total_length and content
+    """
+    try:
+        text = await _dom_view(tab_id, "readable", lambda index: extract_text(index.root, readable=True))
+    except LookupError as e:
+        return {"error": str(e)}
+    return _paginate(text, page)
+
+@mcp.resource("resource://{tab_id}/select/{selector}")
+async def mcp_status_select(tab_id: str, selector: str) -> Dict[str, Any]:
+    """Get the HTML of the elements matching a CSS selector in a tab's page.
+
+    Args:
+        tab_id: ID of the target tab
+        selector: URL-encoded CSS selector, e.g. table.data%20tr
+
+    Returns:
+        Dict containing the selector, total match count and the outer HTML of
+        up to SELECT_LIMIT matches
+    """
+    selector = unquote(selector)
+    try:
+        nodes = await _dom_view(tab_id, ("select", selector), lambda index: index.select(selector))
+    except LookupError as e:
+        return {"error": str(e)}
+    except ValueError as e:
+        return {"error": f"Invalid selector: {e}"}
+    return {
+        "selector": selector,
+        "count": len(nodes),
+        "matches": [outer_html(node) for node in nodes[:SELECT_LIMIT]]
+    }
+
+async def _count_matches(tab_id: str, selector: str) -> int:
+    """Number of elements matching a (possibly URL-encoded) selector in a tab's snapshot"""
+    selector = unquote(selector)
+    nodes = await _dom_view(tab_id, ("select", selector), lambda index: index.select(selector))
+    return len(nodes)
+
+watchers = PageWatchers(manager.tab_info.get, _count_matches, debounce=SUBSCRIPTION_DEBOUNCE_MS / 1000)
+manager.state_listeners.append(watchers.notify)
+
+@mcp._mcp_server.subscribe_resource()
+async def subscribe_resource(uri) -> None:
+    """resources/subscribe: notify the calling session when the resource changes"""
+    await watchers.subscribe(str(uri), mcp._mcp_server.request_context.session)
+
+@mcp._mcp_server.unsubscribe_resource()
+async def unsubscribe_resource(uri) -> None:
+    """resources/unsubscribe"""
+    watchers.unsubscribe(str(uri), mcp._mcp_server.request_context.session)
+
+_get_capabilities = mcp._mcp_server.get_capabilities
+
+def _get_capabilities_with_subscribe(*args, **kwargs):
+    # The lowlevel server always reports subscribe=False, even with handlers registered
+    capabilities = _get_capabilities(*args, **kwargs)
+    if capabilities.resources is not None:
+        capabilities.resources.subscribe = True
+    return capabilities
+
+mcp._mcp_server.get_capabilities = _get_capabilities_with_subscribe
+
+@mcp.resource("resource://connections")
+def connections_resource() -> Dict[str, Any]:
+    """Get outgoing queue metrics for every connected tab.
+
+    Returns:
+        Dict containing:
+            - connections: tab IDs mapped to queue depth, high-water mark,
+              capacity, sent and dropped frame counts
+            - commands: tab IDs mapped to queued and in-flight command counts
+            - state_store: page content memory use, tier counts and evictions
+            - views: cached DOM indexes, text and selections, their approximate
+              size, hits, misses and evictions
+            - streams: incomplete chunked streams and completed transfers
+            - recording: session recording progress, or None if MCP_RECORD_DIR is unset
+            - heartbeats: ping settings, tracked tabs, pings sent and tabs reaped
+            - tables: extracted tables kept for paging and export
+            - screenshots: screenshot store size, hits and evictions, and image workers
+            - admission: rate limits and throttled counts, and global command slots in use,
+              queued and shed
+    """
+    return {
+        "connections": manager.get_queue_stats(),
+        "commands": manager.get_command_stats(),
+        "state_store": manager.state_store.stats(),
+        "views": manager.views.stats(),
+        "streams": {**streams.stats(), **transfers.stats()},
+        "recording": recorder.stats() if recorder is not None else None,
+        "heartbeats": heartbeats.stats(),
+        "tables": tables.stats(),
+        "screenshots": {**screenshots.stats(), "workers": image_workers.stats()},
+        "admission": {"rate_limits": rate_limits.stats(), "concurrency": manager.concurrency.stats()}
     }
 
 @mcp.resource("resource://system_info")
 def system_info_resource() -> Dict[str, Any]:
     """Get system information about the server.
-    
+
+    Served from the background sampler (SYSTEM_SAMPLE_INTERVAL), so reading
+    it never blocks tab traffic.
+
     Returns:
-        Dict containing system information including CPU usage, memory usage, and uptime
+        Dict containing the latest CPU, memory and disk usage, uptime, the
+        server process' CPU, RSS, threads and file descriptors, and min/avg/max
+        of each over the last SYSTEM_SAMPLE_WINDOW samples
     """
-    cpu_percent = psutil.cpu_percent(interval=0.1)
-    memory = psutil.virtual_memory()
-    disk = psutil.disk_usage('/')
-    boot_time = psutil.boot_time()
-    uptime = time.time() - boot_time
-    
-    return {
-        "cpu_usage": f"{cpu_percent}%",
-        "memory_usage": f"{memory.percent}%",
-        "memory_available": f"{memory.available / (1024 * 1024 * 1024):.2f} GB",
-        "disk_usage": f"{disk.percent}%",
-        "disk_free": f"{disk.free / (1024 * 1024 * 1024):.2f} GB",
-        "uptime_seconds": int(uptime),
-        "uptime_formatted": f"{int(uptime // 3600)}h {int((uptime % 3600) // 60)}m {int(uptime % 60)}s"
-    }
+    sampler.start()
+    return sampler.snapshot()
+
+def _throttled(e: Throttled) -> Dict[str, Any]:
+    return {"success": False, "error": str(e), "throttled": True, "reason": e.reason,
+            "retry_after": round(e.retry_after, 3)}
+
+async def _admit(tab_id: str, command: str = None) -> None:
+    """Charge one tool call to the tab's rate limit, and ``command`` to its own (see RateLimiter.check)
+
+    Multi-step tools call this once without a command; their steps are then
+    sent with charge_tab=False, which charges only the command type buckets.
+
+    Raises:
+        ConnectionError: If no worker holds the tab; no buckets are made for it
+        Throttled: If the tab or the command type is over its limit
+    """
+    if tab_id not in manager.connections and await router.registry.lookup(tab_id) is None:
+        raise ConnectionError(f"Tab with ID {tab_id} not found or not connected")
+    rate_limits.check(tab_id, command)
+
+async def send_command(tab_id: str, command: str, args: list, timeout: float = None,
+                       request_id: str = None, charge_tab: bool = True) -> Dict[str, Any]:
+    """Send a command to a tab and wait for the extension's result.
+
+    Commands to the same tab run in submission order through its CommandQueue.
+    Commands over a rate limit or shed at the global concurrency cap (see
+    admission.py) fail right away with "throttled" and "retry_after".
+
+    Args:
+        tab_id: ID of the target tab
+        command: Command name understood by content.js (e.g. "clickElement")
+        args: Positional arguments for the command
+        timeout: Seconds to wait for the reply (default: COMMAND_TIMEOUT)
+        request_id: ID to send the command under, so it can be cancelled
+        charge_tab: Also charge the tab's rate limit; False for the steps of a
+            tool that was already charged once per tab (see _admit). The
+            command type's own limit is charged either way
+
+    Returns:
+        Dict containing success flag and either result or error
+    """
+    timeout = COMMAND_TIMEOUT if timeout is None else timeout
+    message = Message(
+        type=command,
+        args=args,
+        sender_id="server",
+        request_id=request_id
+    )
+    started = time.perf_counter()
+    try:
+        if charge_tab:
+            await _admit(tab_id, command)
+        else:
+            rate_limits.check(tab_id, command, tab=False)
+        reply = await router.send_request(message, tab_id, timeout)
+    except Throttled as e:
+        result, outcome = _throttled(e), "throttled"
+    except ConnectionError as e:
+        result, outcome = {"success": False, "error": str(e)}, "disconnected"
+    except asyncio.TimeoutError:
+        result = {"success": False, "error": f"Timed out after {timeout}s waiting for {command} in tab {tab_id}"}
+        outcome = "timeout"
+    except CommandCancelled as e:
+        result, outcome = {"success": False, "error": str(e), "cancelled": True}, "cancelled"
+    else:
+        if reply.get("success"):
+            result, outcome = {"success": True, "result": reply.get("result")}, "ok"
+        else:
+            result, outcome = {"success": False, "error": reply.get("error", "Unknown error")}, "error"
+
+    elapsed = time.perf_counter() - started
+    metrics.observe("mcp_command_duration_seconds", "Browser command round-trip latency",
+                    elapsed, {"command": command})
+    metrics.inc("mcp_commands_total", "Browser commands by outcome", {"command": command, "outcome": outcome})
+    metrics.trace("command", tab_id=tab_id, command=command, outcome=outcome, duration=round(elapsed, 6))
+    return result
 
 @mcp.tool()
-async def tool_change_background(color: str = "lightblue", tab_id: str = None) -> str:
+@metrics.instrument_tool
+async def tool_change_background(color: str = "lightblue", tab_id: str = None) -> Dict[str, Any]:
     """Change the background color of the page for a specific tab"""
     if not tab_id:
-        return "Error: Tab ID is required"
-    
-    await manager.send_personal_message(
-        MessageModel(
-            type="changeBackground",
-            args=[color],
-            sender_id="server"
-        ).model_dump_json(),
-        tab_id
-    )
-    return f"Background color change request sent to tab {tab_id}: {color}"
+        return {"error": "Tab ID is required"}
+
+    return await send_command(tab_id, "changeBackground", [color])
 
 @mcp.tool()
-async def tool_reload(tab_id: str = None) -> str:
+@metrics.instrument_tool
+async def tool_reload(tab_id: str = None) -> Dict[str, Any]:
     """Reload the page for a specific tab"""
     if not tab_id:
-        return "Error: Tab ID is required"
-
-    await manager.send_personal_message(
-        MessageModel(
-            type="reload",
-            args=[],
-            sender_id="server"
-        ).model_dump_json(),
-        tab_id
-    )
-    return f"Reload request sent to tab {tab_id}"
+        return {"error": "Tab ID is required"}
+
+    return await send_command(tab_id, "reload", [])
 
 @mcp.tool()
-async def tool_navigate_to(url: str, tab_id: str = None) -> str:
+@metrics.instrument_tool
+async def tool_navigate_to(url: str, tab_id: str = None) -> Dict[str, Any]:
     """Navigate to a specified URL for a specific tab"""
     if not url:
-        return "Error: URL is required"
+        return {"error": "URL is required"}
     if not tab_id:
-        return "Error: Tab ID is required"
-    
-    await manager.send_personal_message(
-        MessageModel(
-            type="navigateTo",
-            args=[url],
-            sender_id="server"
-        ).model_dump_json(),
-        tab_id
-    )
-    return f"Navigation request sent to tab {tab_id}: {url}"
+        return {"error": "Tab ID is required"}
+
+    return await send_command(tab_id, "navigateTo", [url])
 
 @mcp.tool()
-async def tool_click_element(selector: str, tab_id: str = None) -> str:
+@metrics.instrument_tool
+async def tool_click_element(selector: str, tab_id: str = None) -> Dict[str, Any]:
     """Click an element on the page for a specific tab"""
     if not selector:
-        return "Error: Selector is required"
+        return {"error": "Selector is required"}
     if not tab_id:
-        return "Error: Tab ID is required"
-    
-    await manager.send_personal_message(
-        MessageModel(
-            type="clickElement",
-            args=[selector],
-            sender_id="server"
-        ).model_dump_json(),
-        tab_id
-    )
-    return f"Click request sent to tab {tab_id} for selector: {selector}"
+        return {"error": "Tab ID is required"}
+
+    return await send_command(tab_id, "clickElement", [selector])
 
 @mcp.tool()
-async def tool_type_text(selector: str, text: str, tab_id: str = None) -> str:
+@metrics.instrument_tool
+async def tool_type_text(selector: str, text: str, tab_id: str = None) -> Dict[str, Any]:
     """Type text into an input element for a specific tab"""
     if not selector or not text:
-        return "Error: Both selector and text are required"
+        return {"error": "Both selector and text are required"}
     if not tab_id:
-        return "Error: Tab ID is required"
-    
-    await manager.send_personal_message(
-        MessageModel(
-            type="typeText",
-            args=[selector, text],
-            sender_id="server"
-        ).model_dump_json(),
-        tab_id
-    )
-    return f"Type text request sent to tab {tab_id}: {text} into {selector}"
+        return {"error": "Tab ID is required"}
+
+    return await send_command(tab_id, "typeText", [selector, text])
 
 @mcp.tool()
+@metrics.instrument_tool
 async def tool_wait_for_element(selector: str, timeout: int = 5000, tab_id: str = None) -> Dict[str, Any]:
     """Wait for an element to appear on the page for a specific tab.
     
@@ -368,18 +1140,13 @@ async def tool_wait_for_element(selector: str, timeout: int = 5000, tab_id: str
     """
     if not tab_id:
         return {"error": "Tab ID is required"}
-    
-    await manager.send_personal_message(
-        MessageModel(
-            type="waitForElement",
-            args=[selector, timeout],
-            sender_id="server"
-        ).model_dump_json(),
-        tab_id
-    )
-    return {"message": f"Waiting for element: {selector} in tab {tab_id} (timeout: {timeout}ms)"}
+
+    # 브라우저 쪽 대기 시간에 응답 여유 시간을 더함
+    return await send_command(tab_id, "waitForElement", [selector, timeout],
+                              timeout=timeout / 1000 + COMMAND_TIMEOUT)
 
 @mcp.tool()
+@metrics.instrument_tool
 async def tool_fill_form(form_data: Dict[str, Any], tab_id: str = None) -> Dict[str, Any]:
     """Fill a form with provided data for a specific tab.
     
@@ -392,89 +1159,726 @@ async def tool_fill_form(form_data: Dict[str, Any], tab_id: str = None) -> Dict[
     """
     if not tab_id:
         return {"error": "Tab ID is required"}
-    
-    await manager.send_personal_message(
-        MessageModel(
-            type="fillForm",
-            args=[form_data],
-            sender_id="server"
-        ).model_dump_json(),
-        tab_id
-    )
-    return {"message": f"Form fill request sent to tab {tab_id}"}
+
+    return await send_command(tab_id, "fillForm", [form_data])
+
+def _build_table(result: Dict[str, Any], rows: Optional[Transfer], tab_id: str, selector: str) -> Table:
+    """Build a Table from an extractTable result; blocking, run in a worker thread"""
+    table = Table(result.get("headers") or [], tab_id=tab_id, selector=selector, batch_rows=TABLE_BATCH_ROWS)
+    if rows is not None:
+        table.append(iter_jsonl_rows(rows.read, rows.size))
+    else:
+        table.append(result.get("rows") or [])
+    return table.finish()
+
+async def _load_table(result: Dict[str, Any], tab_id: str, selector: str) -> Table:
+    """Build a Table from an extractTable result off the event loop
+
+    Raises:
+        TableError: If the streamed rows are missing or malformed
+        OSError: If the streamed rows cannot be read
+    """
+    streamed = result.get("rows_transfer")
+    if not isinstance(streamed, dict):
+        return await asyncio.to_thread(_build_table, result, None, tab_id, selector)
+    # Large tables arrive as a JSONL transfer (one row per line) ahead of the result;
+    # the store is only touched here on the loop, the thread just reads the transfer
+    transfer = transfers.get(streamed.get("transfer_id"))
+    if transfer is None:
+        raise TableError("Streamed rows not found; the transfer expired or is held by another worker")
+    try:
+        # Pinned so eviction cannot close the file under the thread
+        with transfer.pin():
+            return await asyncio.to_thread(_build_table, result, transfer, tab_id, selector)
+    except StreamError as e:
+        raise TableError(f"Streamed rows not readable: {e}") from e
+    finally:
+        transfers.discard(transfer.transfer_id)
+
+async def _finish_extract_table(tab_id: str, args: list, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep a successful extractTable reply as a server-side table; the result is its summary"""
+    selector = args[0] if args else None
+    try:
+        table = await _load_table(result.get("result") or {}, tab_id, selector)
+    except (OSError, ValueError) as e:
+        return {"success": False, "error": str(e)}
+    tables.add(table)
+    return {"success": True, "result": table.summary()}
 
 @mcp.tool()
+@metrics.instrument_tool
 async def tool_extract_table(selector: str, tab_id: str = None) -> Dict[str, Any]:
-    """Extract data from a table element for a specific tab.
-    
+    """Extract a table element for a specific tab into a server-side typed table.
+
+    The rows are not returned. Column types (int, float, bool, date, string)
+    are inferred and the table is kept on the server: page through it with
+    tool_table_page or write it to a file with tool_table_export.
+
     Args:
         selector: CSS selector for the table
         tab_id: ID of the target tab
-        
+
     Returns:
-        Dict containing table headers and rows
+        Dict containing success and result: table_id, the row count, each
+        column's name, type, null count and min/max/mean or sample values,
+        and the first rows (the same result an extractTable step of
+        tool_batch, tool_pipeline or tool_run_macro gets)
     """
     if not tab_id:
         return {"error": "Tab ID is required"}
-    
-    await manager.send_personal_message(
-        MessageModel(
-            type="extractTable",
-            args=[selector],
-            sender_id="server"
-        ).model_dump_json(),
-        tab_id
-    )
-    return {"message": f"Extracting table data from selector: {selector} in tab {tab_id}"}
+
+    return await _run_command(tab_id, "extractTable", [selector])
+
+def _table_page(table_id: str, offset: int, limit: int) -> Dict[str, Any]:
+    table = tables.get(table_id)
+    if table is None:
+        return {"error": f"Table {table_id} not found or expired"}
+    if offset < 0 or limit <= 0:
+        return {"error": "offset must be >= 0 and limit > 0"}
+    return table.page(offset, min(limit, TABLE_PAGE_LIMIT))
 
 @mcp.tool()
+@metrics.instrument_tool
+def tool_table_page(table_id: str, offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+    """Read rows of a table extracted with tool_extract_table.
+
+    Args:
+        table_id: ID returned by tool_extract_table
+        offset: First row to return (default: 0)
+        limit: Rows to return (default: 100, at most TABLE_PAGE_LIMIT)
+
+    Returns:
+        Dict containing column names, typed rows (null for empty cells),
+        next_offset (null at the end) and total_rows
+    """
+    return _table_page(table_id, offset, limit)
+
+@mcp.resource("resource://table/{table_id}/{offset}/{limit}")
+def table_resource(table_id: str, offset: str, limit: str) -> Dict[str, Any]:
+    """Page of an extracted table (see tool_table_page)"""
+    try:
+        return _table_page(table_id, int(offset), int(limit))
+    except ValueError:
+        return {"error": "offset and limit must be integers"}
+
+@mcp.tool()
+@metrics.instrument_tool
+async def tool_table_export(table_id: str, format: str = "csv", name: str = None) -> Dict[str, Any]:
+    """Write a table extracted with tool_extract_table to a file on the server.
+
+    Args:
+        table_id: ID returned by tool_extract_table
+        format: "csv", "jsonl" or "parquet" (parquet needs pyarrow installed)
+        name: File name inside TABLE_EXPORT_DIR (default: <table_id>.<format>)
+
+    Returns:
+        Dict containing the file path, format, size in bytes and row count
+    """
+    table = tables.get(table_id)
+    if table is None:
+        return {"error": f"Table {table_id} not found or expired"}
+    if format not in EXPORT_FORMATS:
+        return {"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}
+    name = name or f"{table_id}.{format}"
+    if Path(name).name != name or name in (".", ".."):
+        return {"error": "name must be a plain file name"}
+    path = TABLE_EXPORT_DIR / name
+    try:
+        size = await asyncio.to_thread(table.export, path, format)
+    except (TableError, OSError) as e:
+        return {"error": str(e)}
+    return {"table_id": table_id, "path": str(path), "format": format, "bytes": size, "rows": table.rows}
+
+_CLIP_FIELDS = ("x", "y", "width", "height")
+
+async def _store_capture(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Process a takeScreenshot result's captured image in the image workers and store it"""
+    reference = result.get("transfer")
+    if not isinstance(reference, dict):
+        raise ScreenshotError("The extension returned no image")
+    transfer = transfers.get(reference.get("transfer_id"))
+    if transfer is None:
+        raise ScreenshotError("Captured image not found; the transfer expired or is held by another worker")
+    try:
+        with transfer.pin():
+            data = await asyncio.to_thread(transfer.read)
+    except StreamError as e:
+        raise ScreenshotError(f"Captured image not readable: {e}") from e
+    finally:
+        transfers.discard(transfer.transfer_id)
+
+    clip = result.get("clip")
+    if clip is not None and not (isinstance(clip, dict) and
+                                 all(isinstance(clip.get(k), (int, float)) for k in _CLIP_FIELDS)):
+        raise ScreenshotError("Invalid element rectangle from the extension")
+    if HAVE_PILLOW:
+        processed = await image_workers.run(
+            process_capture, data, clip, result.get("viewport"), result.get("devicePixelRatio") or 1,
+            SCREENSHOT_MAX_SIDE, SCREENSHOT_FORMAT, SCREENSHOT_QUALITY
+        )
+    elif clip is not None:
+        raise ScreenshotError("Element screenshots need Pillow: pip install mcp-server[images]")
+    else:
+        # Stored as captured; no hash, so change detection is off
+        size = png_size(data)
+        if size is None:
+            raise ScreenshotError("Only PNG captures can be stored without Pillow")
+        processed = {"data": data, "format": "png", "width": size[0], "height": size[1], "phash": None}
+    screenshot_id = await asyncio.to_thread(screenshots.put, processed["data"], processed["format"])
+    return {
+        "screenshot_id": screenshot_id,
+        "format": processed["format"],
+        "width": processed["width"],
+        "height": processed["height"],
+        "bytes": len(processed["data"]),
+        "phash": processed["phash"]
+    }
+
+async def _finish_take_screenshot(tab_id: str, args: list, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Store a successful takeScreenshot reply's capture; the result describes the stored screenshot"""
+    selector = args[0] if args else None
+    try:
+        info = await _store_capture(result.get("result") or {})
+    except ScreenshotError as e:
+        return {"success": False, "error": str(e)}
+
+    if info["phash"] is not None:
+        latest = last_screenshots.setdefault(tab_id, {})
+        previous = latest.get(selector)
+        if previous is not None:
+            distance = hash_distance(previous[1], info["phash"])
+            info.update(previous_id=previous[0], distance=distance, unchanged=distance <= SCREENSHOT_SIMILAR_BITS)
+        latest[selector] = (info["screenshot_id"], info["phash"])
+    return {"success": True, "result": {"tab_id": tab_id, "selector": selector, **info}}
+
+@mcp.tool()
+@metrics.instrument_tool
 async def tool_take_screenshot(selector: str = None, tab_id: str = None) -> Dict[str, Any]:
     """Take a screenshot of the page or specific element for a specific tab.
+
+    The tab must be the active tab of its window. The image is stored on the
+    server, not returned: fetch a thumbnail or crop with tool_screenshot_image.
     
     Args:
         selector: Optional CSS selector for specific element
         tab_id: ID of the target tab
         
     Returns:
-        Dict containing screenshot information
+        Dict containing success and result: screenshot_id, format, width,
+        height, size in bytes, perceptual hash, and whether it looks
+        unchanged from the previous screenshot of the same tab and selector
+        (previous_id, distance in hash bits, unchanged)
     """
     if not tab_id:
         return {"error": "Tab ID is required"}
-    
-    await manager.send_personal_message(
-        MessageModel(
-            type="takeScreenshot",
-            args=[selector] if selector else [],
-            sender_id="server"
-        ).model_dump_json(),
-        tab_id
-    )
-    return {"message": f"Taking screenshot{' of element: ' + selector if selector else ''} in tab {tab_id}"}
 
-def write_pid_file() -> Path:
+    return await _run_command(tab_id, "takeScreenshot", [selector] if selector else [])
+
+@mcp.tool()
+@metrics.instrument_tool
+async def tool_screenshot_image(screenshot_id: str, max_side: int = 768, crop: List[int] = None,
+                                format: str = "webp", quality: int = 80) -> Image:
+    """Get a screenshot taken with tool_take_screenshot as an image, downscaled and/or cropped.
+
+    Smaller images cost fewer tokens: start with a thumbnail and crop into the
+    region of interest at full resolution (max_side=0) if more detail is needed.
+
+    Args:
+        screenshot_id: ID returned by tool_take_screenshot
+        max_side: Longest side of the returned image in pixels (0: no downscaling)
+        crop: Optional region [x, y, width, height] in the screenshot's pixels
+        format: "webp", "png" or "jpeg"
+        quality: Lossy encoding quality, 1-100
+
+    Returns:
+        The image
+
+    Raises:
+        ToolError: If the arguments are invalid, the screenshot is unknown or
+            was evicted, or Pillow is not installed
     """
-    현재 프로세스의 PID를 파일에 저장합니다.
-    
+    if not HAVE_PILLOW:
+        raise ToolError("Thumbnails and crops need Pillow: pip install mcp-server[images]")
+    if format not in IMAGE_FORMATS:
+        raise ToolError(f"format must be one of {', '.join(IMAGE_FORMATS)}")
+    if max_side < 0 or not 1 <= quality <= 100:
+        raise ToolError("max_side must be >= 0 and quality between 1 and 100")
+    if crop is not None and (len(crop) != 4 or min(crop) < 0 or min(crop[2:]) <= 0):
+        raise ToolError("crop must be [x, y, width, height] with x, y >= 0 and width, height > 0")
+
+    key = derived_key(screenshot_id, max_side, crop, format, quality)
+    cached = await asyncio.to_thread(screenshots.get, key)
+    if cached is not None:
+        return Image(data=cached[0], format=format)
+    source = await asyncio.to_thread(screenshots.get, screenshot_id)
+    if source is None:
+        raise ToolError(f"Screenshot {screenshot_id} not found or evicted")
+    try:
+        derived = await image_workers.run(derive, source[0], max_side, crop, format, quality)
+    except ScreenshotError as e:
+        raise ToolError(str(e)) from None
+    await asyncio.to_thread(screenshots.put, derived["data"], format, key)
+    return Image(data=derived["data"], format=format)
+
+@mcp.tool()
+@metrics.instrument_tool
+async def tool_query_dom(selector: str, tab_id: str = None, fields: List[str] = None,
+                         limit: int = 100) -> Dict[str, Any]:
+    """Query the server's copy of a tab's DOM with a CSS selector, without a browser round trip.
+
+    Answers come from the last page snapshot the extension sent, parsed and
+    indexed by id, class and tag. Use it for repeated lookups such as links,
+    meta tags, forms and tables.
+
+    Args:
+        selector: CSS selector (type, #id, .class, [attr], [attr^=v] etc. with
+            descendant, >, + and ~ combinators; no pseudo-classes)
+        tab_id: ID of the target tab
+        fields: Fields to return per element: tag, id, class, text, html, attrs,
+            or any attribute name such as href, src, content (default: tag, text, attrs)
+        limit: Maximum number of elements to return (default: 100)
+
+    Returns:
+        Dict containing the total match count and the requested fields of each element
+    """
+    if not selector:
+        return {"error": "Selector is required"}
+    if not tab_id:
+        return {"error": "Tab ID is required"}
+
+    return await _query_dom(tab_id, selector, fields, limit)
+
+async def _query_dom(tab_id: str, selector: str, fields: List[str] = None, limit: int = 100) -> Dict[str, Any]:
+    fields = fields or ["tag", "text", "attrs"]
+    try:
+        # Same cache entry as resource://{tab_id}/select/{selector}
+        nodes = await _dom_view(tab_id, ("select", selector), lambda index: index.select(selector))
+    except LookupError as e:
+        return {"error": str(e)}
+    except ValueError as e:
+        return {"error": f"Invalid selector: {e}"}
+
+    # Text of large subtrees takes a while to collect
+    elements = await asyncio.to_thread(lambda: [describe(node, fields) for node in nodes[:limit]])
+    return {
+        "selector": selector,
+        "count": len(nodes),
+        "elements": elements
+    }
+
+@mcp.tool()
+@metrics.instrument_tool
+async def tool_wait_for_change(tab_id: str = None, condition: str = "changed", selector: str = None,
+                               timeout: float = 30, debounce_ms: float = None) -> Dict[str, Any]:
+    """Wait until a tab's page changes, driven by the extension's state updates (no polling).
+
+    Bursts of updates are debounced and the condition is checked once the
+    page settles.
+
+    Args:
+        tab_id: ID of the target tab
+        condition: changed (URL or content), url_changed, hash_changed (content),
+            selector_appeared or selector_gone
+        selector: CSS selector for selector_appeared / selector_gone
+        timeout: Maximum seconds to wait (default: 30)
+        debounce_ms: Quiet period before checking (default: SUBSCRIPTION_DEBOUNCE_MS)
+
+    Returns:
+        Dict containing matched, the condition, the page url and hash when it
+        matched, and the seconds waited
+    """
+    if not tab_id:
+        return {"error": "Tab ID is required"}
+    if condition not in CONDITIONS:
+        return {"error": f"Unknown condition: {condition}. Use one of {', '.join(CONDITIONS)}"}
+    if condition in (CONDITION_SELECTOR_APPEARED, CONDITION_SELECTOR_GONE) and not selector:
+        return {"error": "Selector is required"}
+    return await _wait_for_change(tab_id, condition, selector, timeout,
+                                  debounce_ms / 1000 if debounce_ms is not None else None)
+
+async def _wait_for_change(tab_id: str, condition: str, selector: str, timeout: float,
+                           debounce: float = None, initial: dict = None) -> Dict[str, Any]:
+    current = manager.tab_info.get(tab_id)
+    if current is None:
+        return {"error": f"Tab with ID {tab_id} not found or not connected"}
+    initial = initial or current
+
+    try:
+        return await watchers.wait_for(tab_id, initial, condition, selector, timeout, debounce)
+    except ValueError as e:
+        return {"error": f"Invalid selector: {e}"}
+
+@mcp.tool()
+@metrics.instrument_tool
+def tool_group_add(group: str, tab_ids: List[str]) -> Dict[str, Any]:
+    """Add tabs to a named group so they can be targeted together.
+
+    Args:
+        group: Name of the group
+        tab_ids: IDs of the tabs to add
+
+    Returns:
+        Dict containing the group's current members
+    """
+    if not group:
+        return {"error": "Group name is required"}
+    for tab_id in tab_ids:
+        manager.add_to_group(group, tab_id)
+    return {"group": group, "tabs": sorted(manager.connection_groups.get(group, set()))}
+
+@mcp.tool()
+@metrics.instrument_tool
+def tool_group_remove(group: str, tab_ids: List[str]) -> Dict[str, Any]:
+    """Remove tabs from a named group.
+
+    Args:
+        group: Name of the group
+        tab_ids: IDs of the tabs to remove
+
+    Returns:
+        Dict containing the group's remaining members
+    """
+    if not group:
+        return {"error": "Group name is required"}
+    for tab_id in tab_ids:
+        manager.remove_from_group(group, tab_id)
+    return {"group": group, "tabs": sorted(manager.connection_groups.get(group, set()))}
+
+# Commands whose replies only point at data streamed ahead of them (transfers).
+# Their results are finished on the server as by the dedicated tools, including
+# when sent as steps of tool_batch, tool_pipeline and tool_run_macro.
+RESULT_HANDLERS = {
+    "extractTable": _finish_extract_table,
+    "takeScreenshot": _finish_take_screenshot,
+}
+
+async def _run_command(tab_id: str, command: str, args: list, timeout: float = None,
+                       request_id: str = None, charge_tab: bool = True) -> Dict[str, Any]:
+    """send_command, then finish the reply with the command's RESULT_HANDLERS entry if any"""
+    result = await send_command(tab_id, command, args, timeout, request_id, charge_tab)
+    handler = RESULT_HANDLERS.get(command)
+    if handler is None or not result.get("success"):
+        return result
+    return await handler(tab_id, args, result)
+
+@mcp.tool()
+@metrics.instrument_tool
+async def tool_batch(operations: List[Dict[str, Any]] = None, command: str = None,
+                     args: List[Any] = None, group: str = None,
+                     timeout: float = None) -> Dict[str, Any]:
+    """Run many browser commands across tabs concurrently in one call.
+
+    Either pass explicit operations, or one command plus a group name to run
+    it on every tab in that group (see tool_group_add).
+
+    Args:
+        operations: List of {"tab_id": ..., "command": ..., "args": [...]} entries.
+            command is an extension command name, e.g. "navigateTo", "clickElement",
+            "typeText", "waitForElement", "fillForm", "extractTable", "getElementInfo".
+            extractTable and takeScreenshot results are kept on the server, as with
+            tool_extract_table and tool_take_screenshot
+        command: Command to run on every tab of ``group``
+        args: Arguments for ``command``
+        group: Name of the tab group to target with ``command``
+        timeout: Seconds to wait for each operation (default: COMMAND_TIMEOUT)
+
+    Returns:
+        Dict containing per-operation results in request order plus
+        succeeded/failed counts
+    """
+    if operations is None:
+        if not command or not group:
+            return {"error": "Provide operations, or command together with group"}
+        if group not in manager.connection_groups:
+            return {"error": f"Group {group} not found"}
+        operations = [
+            {"tab_id": tab_id, "command": command, "args": args or []}
+            for tab_id in sorted(manager.connection_groups[group])
+        ]
+
+    # The batch is charged once per tab; each operation is charged to its command type when sent
+    tab_ids = list(dict.fromkeys(
+        operation["tab_id"] for operation in operations
+        if isinstance(operation, dict) and operation.get("tab_id") and operation.get("command") in BROWSER_COMMANDS
+    ))
+
+    async def admit(tab_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            await _admit(tab_id)
+        except Throttled as e:
+            return _throttled(e)
+        except ConnectionError as e:
+            return {"success": False, "error": str(e)}
+        return None
+
+    refusals = dict(zip(tab_ids, await asyncio.gather(*(admit(tab_id) for tab_id in tab_ids))))
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(operation: Dict[str, Any]) -> Dict[str, Any]:
+        if not isinstance(operation, dict):
+            return {"tab_id": None, "command": None, "success": False,
+                    "error": f"Expected an object with tab_id, command and args, got {type(operation).__name__}"}
+        tab_id = operation.get("tab_id")
+        op_command = operation.get("command")
+        if not tab_id or not op_command:
+            result = {"success": False, "error": "Each operation needs tab_id and command"}
+        elif op_command not in BROWSER_COMMANDS:
+            result = {"success": False, "error": f"Unknown command: {op_command}"}
+        elif refusals.get(tab_id) is not None:
+            result = refusals[tab_id]
+        else:
+            async with semaphore:
+                result = await _run_command(tab_id, op_command, operation.get("args") or [], timeout,
+                                            charge_tab=False)
+        return {"tab_id": tab_id, "command": op_command, **result}
+
+    results = await asyncio.gather(*(run(operation) for operation in operations))
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded
+    }
+
+@mcp.tool()
+@metrics.instrument_tool
+async def tool_pipeline(tab_id: str, steps: List[Dict[str, Any]], stop_on_error: bool = True,
+                        timeout: float = None) -> Dict[str, Any]:
+    """Run a list of browser commands against one tab in a single call.
+
+    All steps are queued at once and sent in order without waiting for a tool
+    call per step. Independent steps are pipelined (up to MAX_IN_FLIGHT awaiting
+    replies); navigateTo and reload run alone, after everything before them.
+
+    Args:
+        tab_id: ID of the target tab
+        steps: List of {"command": ..., "args": [...]} entries, optionally with a
+            per-step "timeout" in seconds. command is an extension command name,
+            e.g. "navigateTo", "waitForElement", "typeText", "clickElement".
+            extractTable and takeScreenshot results are kept on the server, as with
+            tool_extract_table and tool_take_screenshot
+        stop_on_error: Cancel the remaining steps after the first failure (default: True)
+        timeout: Seconds to wait for each step's reply (default: COMMAND_TIMEOUT)
+
+    Returns:
+        Dict containing per-step results in order plus succeeded/failed/cancelled counts
+    """
+    if not tab_id:
+        return {"error": "Tab ID is required"}
+    if not steps:
+        return {"error": "At least one step is required"}
+    for index, step in enumerate(steps):
+        if not isinstance(step, dict):
+            return {"error": f"Step {index}: expected an object with command and args, got {type(step).__name__}"}
+        if step.get("command") not in BROWSER_COMMANDS:
+            return {"error": f"Step {index}: unknown command {step.get('command')}"}
+
+    try:
+        await _admit(tab_id)
+    except Throttled as e:
+        return _throttled(e)
+    except ConnectionError as e:
+        return {"success": False, "error": str(e)}
+
+    request_ids = [manager._generate_request_id() for _ in steps]
+
+    async def run(index: int, step: Dict[str, Any]) -> Dict[str, Any]:
+        result = await _run_command(tab_id, step["command"], step.get("args") or [],
+                                    step.get("timeout", timeout), request_ids[index], charge_tab=False)
+        if stop_on_error and not result["success"] and not result.get("cancelled"):
+            manager.cancel_requests(tab_id, request_ids[index + 1:])
+        return {"step": index, "command": step["command"], **result}
+
+    if tab_id in manager.connections:
+        # Tasks start in list order, so steps enter the tab's queue in order
+        results = await asyncio.gather(*(run(index, step) for index, step in enumerate(steps)))
+    else:
+        # Tabs on another worker: keep the order by running one step at a time
+        results = []
+        for index, step in enumerate(steps):
+            result = await run(index, step)
+            results.append(result)
+            if stop_on_error and not result["success"]:
+                results.extend(
+                    {"step": later, "command": steps[later]["command"], "success": False,
+                     "error": "Cancelled after an earlier step failed", "cancelled": True}
+                    for later in range(index + 1, len(steps))
+                )
+                break
+
+    cancelled = sum(1 for result in results if result.get("cancelled"))
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded - cancelled,
+        "cancelled": cancelled
+    }
+
+@mcp.tool()
+@metrics.instrument_tool
+def tool_cancel_commands(tab_id: str, request_ids: List[str] = None) -> Dict[str, Any]:
+    """Cancel a tab's queued and in-flight commands.
+
+    Cancelled calls return {"success": false, "cancelled": true}. A command
+    already sent to the browser stops being waited for but may still run.
+
+    Args:
+        tab_id: ID of the target tab
+        request_ids: Only cancel these requests (default: all of the tab's commands)
+
+    Returns:
+        Dict containing the number of commands cancelled
+    """
+    if not tab_id:
+        return {"error": "Tab ID is required"}
+    return {"tab_id": tab_id, "cancelled": manager.cancel_requests(tab_id, request_ids)}
+
+async def _read_transfer(transfer_id: str, offset: int, length: int) -> Dict[str, Any]:
+    transfer = transfers.get(transfer_id)
+    if transfer is None:
+        return {"error": f"Transfer {transfer_id} not found or expired"}
+    if offset < 0 or length <= 0:
+        return {"error": "offset must be >= 0 and length > 0"}
+    length = min(length, TRANSFER_READ_LIMIT)
+    try:
+        with transfer.pin():
+            data = await asyncio.to_thread(transfer.read, offset, length)
+    except StreamError:
+        return {"error": f"Transfer {transfer_id} not found or expired"}
+    end = offset + len(data)
+    return {
+        **transfer.describe(),
+        "offset": offset,
+        "length": len(data),
+        "next_offset": end if end < transfer.size else None,
+        "data": base64.b64encode(data).decode("ascii")
+    }
+
+@mcp.tool()
+@metrics.instrument_tool
+async def tool_read_transfer(transfer_id: str, offset: int = 0, length: int = None) -> Dict[str, Any]:
+    """Read a byte range of a streamed transfer, e.g. a screenshot.
+
+    Large results are streamed from the browser in chunks and returned by
+    commands as {"transfer": {"transfer_id", "size", "media_type"}}. Read
+    them piece by piece until next_offset is null.
+
+    Args:
+        transfer_id: ID from the command result
+        offset: First byte to read (default: 0)
+        length: Bytes to read (default and maximum: TRANSFER_READ_LIMIT)
+
+    Returns:
+        Dict containing the transfer's media type and size, the range read,
+        next_offset (null at the end) and the bytes as base64 in data
+    """
+    return await _read_transfer(transfer_id, offset, length or TRANSFER_READ_LIMIT)
+
+@mcp.resource("resource://transfer/{transfer_id}/{offset}/{length}")
+async def transfer_resource(transfer_id: str, offset: str, length: str) -> Dict[str, Any]:
+    """Byte range of a streamed transfer, base64 encoded (see tool_read_transfer)"""
+    try:
+        return await _read_transfer(transfer_id, int(offset), int(length))
+    except ValueError:
+        return {"error": "offset and length must be integers"}
+
+async def _macro_command(tab_id: str, command: str, args: list, timeout: float = None) -> Dict[str, Any]:
+    if timeout is None and command == "waitForElement" and len(args) > 1 and isinstance(args[1], (int, float)):
+        # 브라우저 쪽 대기 시간에 응답 여유 시간을 더함
+        timeout = args[1] / 1000 + COMMAND_TIMEOUT
+    # The tab was charged once for the whole macro in tool_run_macro
+    return await _run_command(tab_id, command, args, timeout, charge_tab=False)
+
+async def _macro_wait(tab_id: str, initial: dict, condition: str, selector: str, timeout: float) -> Dict[str, Any]:
+    return await _wait_for_change(tab_id, condition, selector, timeout, initial=initial)
+
+macros = MacroRunner(_macro_command, _macro_wait, _query_dom, _count_matches, manager.tab_info.get)
+
+@mcp.tool()
+@metrics.instrument_tool
+async def tool_run_macro(tab_id: str, steps: List[Dict[str, Any]], variables: Dict[str, Any] = None,
+                         timeout: float = 120) -> Dict[str, Any]:
+    """Run a scripted flow against one tab server-side and return only its captured values.
+
+    Steps run in order. Each step has exactly one of:
+        {"command": name, "args": [...]}   browser command (navigateTo, typeText, clickElement,
+                                           fillForm, extractTable, waitForElement ...)
+        {"wait": condition, "selector": css, "timeout": s}
+                                           changed, url_changed, hash_changed,
+                                           selector_appeared or selector_gone
+        {"query": css, "fields": [...], "limit": n}
+                                           server-side DOM query, like tool_query_dom
+        {"sleep": seconds}
+        {"assert": condition, "message": text}
+    and optionally "when" (condition to run the step), "capture" (name to store
+    the step's value under), "pick" (dotted path into that value, e.g. "rows.0"),
+    "retry" (extra attempts) and "optional" (continue if the step fails).
+
+    Conditions: {"var": name} or {"var": name, "equals"|"not_equals"|"contains"|"matches": value},
+    {"url_contains": text}, {"selector": css}, {"not": c}, {"all": [...]}, {"any": [...]}.
+    Strings may reference captures and variables as "${name}" or "${name.path}".
+
+    Args:
+        tab_id: ID of the target tab
+        steps: The steps to run
+        variables: Initial values available to "${name}" references and conditions
+        timeout: Maximum seconds for the whole macro (default: 120)
+
+    Returns:
+        Dict containing success, the captures, steps run and skipped, and on
+        failure the index and error of the failing step
+    """
+    if not tab_id:
+        return {"error": "Tab ID is required"}
+    try:
+        validate_macro(steps, BROWSER_COMMANDS)
+    except MacroError as e:
+        return {"error": str(e)}
+    try:
+        await _admit(tab_id)
+    except Throttled as e:
+        return _throttled(e)
+    except ConnectionError as e:
+        return {"success": False, "error": str(e)}
+
+    try:
+        return await asyncio.wait_for(macros.run(tab_id, steps, variables), timeout)
+    except asyncio.TimeoutError:
+        return {"success": False, "error": f"Macro timed out after {timeout}s"}
+
+PID_DIR = Path.home() / ".mcp-server"
+# Written by versions that kept one PID file for every port
+LEGACY_PID_FILE = PID_DIR / "server.pid"
+# Registered workers share the port; each keeps its own PID file (see startup.py)
+PID_FILE = pid_file_path(PID_DIR, WEBSOCKET_PORT, WORKER_ID if TAB_REGISTRY_URL else None)
+
+def write_pid_file(port: int) -> Path:
+    """
+    현재 프로세스의 PID와 포트를 파일에 저장합니다.
+    다음 인스턴스는 이 파일로 이전 인스턴스를 찾아 핸드오프합니다 (startup.py).
+
+    Args:
+        port: 이 인스턴스가 사용하는 포트 번호
+
     Returns:
         Path: PID 파일의 경로
     """
-    pid_dir = Path.home() / ".mcp-server"
-    pid_dir.mkdir(exist_ok=True)
-    
-    pid_file = pid_dir / "server.pid"
-    pid_file.write_text(str(os.getpid()))
-    logger.info(f"PID file written to {pid_file}")
-    return pid_file
+    PID_FILE.parent.mkdir(exist_ok=True)
+    PID_FILE.write_text(f"{os.getpid()}\n{port}\n")
+    logger.info(f"PID file written to {PID_FILE}")
+    return PID_FILE
 
 def cleanup_pid_file(pid_file: Path) -> None:
     """
     PID 파일을 정리합니다.
-    
+    다음 인스턴스가 이미 덮어쓴 파일은 지우지 않습니다.
+
     Args:
         pid_file: 정리할 PID 파일의 경로
     """
     try:
-        if pid_file.exists():
+        if pid_file.exists() and pid_file.read_text().split()[:1] == [str(os.getpid())]:
             pid_file.unlink()
             logger.info(f"PID file removed: {pid_file}")
     except Exception as e:
@@ -491,6 +1895,7 @@ def kill_process_on_port(port: int) -> bool:
     Returns:
         bool: 프로세스 종료 성공 여부
     """
+    import psutil
     try:
         for proc in psutil.process_iter(['pid', 'name']):
             try:
@@ -530,21 +1935,60 @@ def is_port_in_use(port: int) -> bool:
         except socket.error:
             return True
 
+async def _flush_recording() -> None:
+    """Flush recorded traffic on time even when no further messages arrive to trigger it"""
+    while True:
+        await asyncio.sleep(recorder.flush_interval / 2)
+        recorder.flush_due()
+
+async def _drain_tabs() -> None:
+    """Shutdown: let in-flight commands finish, then ask every tab to reconnect (1012, service restart)"""
+    if not await manager.drain(DRAIN_TIMEOUT):
+        logger.warning(f"Commands still outstanding after {DRAIN_TIMEOUT}s; closing tabs anyway")
+    # A multiplexed extension is told once, on its shared socket
+    transports = {}
+    for connection in manager.connections.values():
+        transport = connection.mux.websocket if isinstance(connection, MuxChannel) else connection
+        transports[id(transport)] = transport
+
+    async def close(transport) -> None:
+        try:
+            await transport.close(1012)
+        except Exception:
+            pass
+
+    await asyncio.gather(*(close(transport) for transport in transports.values()))
+    logger.info(f"Drained {len(transports)} connection(s)")
+
 def main():
+    # Look up the previous instance before our PID replaces it; registered workers
+    # share the port with their siblings and have no previous instance to replace
+    previous_pid = None
+    if FAST_STARTUP and not TAB_REGISTRY_URL:
+        previous_pid = (find_previous_instance(PID_FILE, WEBSOCKET_PORT)
+                        or find_previous_instance(LEGACY_PID_FILE, WEBSOCKET_PORT))
     # Write PID file
-    pid_file = write_pid_file()
+    pid_file = write_pid_file(WEBSOCKET_PORT)
     
     try:
+        sockets = None
+        if FAST_STARTUP or TAB_REGISTRY_URL:
+            try:
+                sockets = bind_with_handoff("localhost", WEBSOCKET_PORT, previous_pid, HANDOFF_TIMEOUT)
+            except OSError as e:
+                logger.error(f"Could not bind port {WEBSOCKET_PORT}: {e}")
+                sys.exit(1)
+            logger.info(f"Listening on localhost:{WEBSOCKET_PORT}")
         # Check and kill any process using the port
-        if is_port_in_use(WEBSOCKET_PORT):
+        elif is_port_in_use(WEBSOCKET_PORT):
             logger.info(f"Port {WEBSOCKET_PORT} is in use. Attempting to kill the process...")
             if kill_process_on_port(WEBSOCKET_PORT):
                 logger.info(f"Successfully killed process using port {WEBSOCKET_PORT}")
                 # 잠시 대기하여 포트가 해제될 때까지 기다림
-                for _ in range(5):
+                for _ in range(50):
                     if not is_port_in_use(WEBSOCKET_PORT):
                         break
-                    asyncio.sleep(1)
+                    time.sleep(0.1)
             else:
                 logger.error(f"Failed to kill process using port {WEBSOCKET_PORT}")
                 sys.exit(1)
@@ -555,16 +1999,39 @@ def main():
                 host="localhost",
                 port=WEBSOCKET_PORT,
                 log_level="info",
-                loop="asyncio"
+                loop="asyncio",
+                # Let browsers negotiate transport compression for text frames
+                ws_per_message_deflate=True
             )
-            server = uvicorn.Server(config)
-            await server.serve()
+            server = DrainingServer(config, _drain_tabs)
+            await server.serve(sockets=sockets)
 
         async def run_mcp():
             await mcp.run_stdio_async()
 
         async def run_all():
-            await asyncio.gather(run_server(), run_mcp())
+            sampler.start()
+            await router.start()
+            # Index stored screenshots now rather than on the first capture
+            _spawn(asyncio.to_thread(screenshots.load))
+            stdio = asyncio.create_task(run_mcp()) if MCP_STDIO else None
+            flusher = _spawn(_flush_recording()) if recorder is not None else None
+            try:
+                await run_server()
+            finally:
+                # The process ends with the websocket server (e.g. after a handoff), even if stdio is still open
+                if stdio is not None:
+                    stdio.cancel()
+                    await asyncio.gather(stdio, return_exceptions=True)
+                await sampler.stop()
+                await heartbeats.stop()
+                await router.close()
+                image_workers.close()
+                manager.state_store.close()
+                if flusher is not None:
+                    flusher.cancel()
+                if recorder is not None:
+                    recorder.close()
 
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
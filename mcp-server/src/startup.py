@@ -0,0 +1,211 @@
+"""Binding the websocket port and taking over from a previous server instance.
+
+With FAST_STARTUP (the default) a restart never scans the host's processes:
+
+    1. The previous instance is looked up in the PID file. It is only trusted
+       if it is still running, was started before the file was written (so a
+       reused PID is never signalled) and recorded the same port.
+    2. The listening sockets are bound with SO_REUSEADDR, and SO_REUSEPORT
+       where the platform has it, so the new instance listens while the old
+       one is still draining and never waits out TIME_WAIT.
+    3. The previous instance gets SIGTERM. It finishes in-flight commands and
+       closes its tabs with 1012 (service restart), and the extension
+       reconnects to the new instance right away.
+
+If the port cannot be shared (the previous instance did not bind with
+SO_REUSEPORT, or on Windows), the previous instance is signalled first and
+binding is retried until it has released the port.
+
+Each port has its own PID file, so servers on different ports never hand
+off to each other. Workers sharing a tab registry (TAB_REGISTRY_URL, see
+registry.py) are meant to serve one port side by side: each writes a PID
+file keyed by port and worker ID, and none of them looks up or signals a
+previous instance. Restarting one worker closes only its own tabs, which
+reconnect to whichever worker the kernel hands them to.
+
+SO_REUSEPORT lets any process of the same user bind the port as long as it
+sets the option too. A stray server that is not in the PID file (started by
+hand, or with another WORKER_ID) therefore keeps listening next to the new
+instance, and the kernel splits new connections between the two; stop it
+explicitly.
+"""
+import contextlib
+import errno
+import logging
+import os
+import re
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Interval between bind attempts while a previous instance releases the port
+BIND_RETRY_INTERVAL = 0.05
+
+
+def pid_file_path(directory: Path, port: int, worker_id: Optional[str] = None) -> Path:
+    """PID file of the server on ``port``, or of one registered worker on it"""
+    name = f"server-{port}"
+    if worker_id:
+        name += "-" + re.sub(r"[^\w.-]", "_", worker_id)
+    return directory / f"{name}.pid"
+
+
+def read_pid_file(pid_file: Path) -> Optional[Tuple[int, Optional[int]]]:
+    """PID and port recorded by write_pid_file, or None if the file is missing or unreadable
+
+    Files written before the port was recorded hold only the PID; the port is
+    then None.
+    """
+    try:
+        fields = pid_file.read_text().split()
+        return int(fields[0]), int(fields[1]) if len(fields) > 1 else None
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def find_previous_instance(pid_file: Path, port: int) -> Optional[int]:
+    """PID of our own previous server on ``port``, or None if there is none to hand off from"""
+    recorded = read_pid_file(pid_file)
+    if recorded is None:
+        return None
+    pid, recorded_port = recorded
+    if pid == os.getpid() or (recorded_port is not None and recorded_port != port):
+        return None
+    # psutil is only needed on this path; importing it costs more than the rest of startup
+    import psutil
+    try:
+        started = psutil.Process(pid).create_time()
+        written = pid_file.stat().st_mtime
+    except (psutil.Error, OSError):
+        return None
+    # A process started after the PID file was written has reused the PID
+    if started > written + 1:
+        logger.info(f"PID {pid} in {pid_file} now belongs to another process; not signalling it")
+        return None
+    return pid
+
+
+def signal_instance(pid: int) -> bool:
+    """Ask a previous instance to drain and exit (SIGTERM; on Windows this terminates it)"""
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError) as e:
+        logger.warning(f"Could not signal previous instance {pid}: {e}")
+        return False
+    logger.info(f"Asked previous instance {pid} to hand over")
+    return True
+
+
+def bind_sockets(host: str, port: int, backlog: int = 2048) -> List[socket.socket]:
+    """Listening sockets for every address of ``host``, bound with SO_REUSEADDR / SO_REUSEPORT
+
+    Raises:
+        OSError: If any address cannot be bound; sockets bound so far are closed
+    """
+    sockets: List[socket.socket] = []
+    seen = set()
+    try:
+        for family, kind, proto, _, address in socket.getaddrinfo(
+            host, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE
+        ):
+            if (family, address) in seen:
+                continue
+            seen.add((family, address))
+            try:
+                sock = socket.socket(family, kind, proto)
+            except OSError as e:
+                # e.g. "localhost" resolving to ::1 on a host without IPv6
+                if e.errno == errno.EAFNOSUPPORT:
+                    continue
+                raise
+            sockets.append(sock)
+            if os.name != "nt":
+                # On Windows SO_REUSEADDR lets another process steal a port that is in use
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            if family == socket.AF_INET6:
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+            sock.bind(address)
+            sock.listen(backlog)
+            sock.setblocking(False)
+    except OSError:
+        for sock in sockets:
+            sock.close()
+        raise
+    if not sockets:
+        raise OSError(errno.EADDRNOTAVAIL, f"No usable address for {host}:{port}")
+    return sockets
+
+
+def bind_with_handoff(host: str, port: int, previous_pid: Optional[int], timeout: float) -> List[socket.socket]:
+    """Bind the port and hand over from ``previous_pid`` (see module docstring)
+
+    Raises:
+        OSError: If the port is still taken after ``timeout`` seconds
+    """
+    try:
+        sockets = bind_sockets(host, port)
+    except OSError as e:
+        if e.errno != errno.EADDRINUSE or previous_pid is None:
+            raise
+        logger.info(f"Port {port} is not shareable; waiting for instance {previous_pid} to release it")
+        signal_instance(previous_pid)
+        deadline = time.monotonic() + timeout
+        while True:
+            time.sleep(BIND_RETRY_INTERVAL)
+            try:
+                return bind_sockets(host, port)
+            except OSError as retry_error:
+                if retry_error.errno != errno.EADDRINUSE or time.monotonic() >= deadline:
+                    raise
+    if previous_pid is not None:
+        signal_instance(previous_pid)
+    return sockets
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that runs ``drain`` after it stops accepting connections
+
+    Tabs are closed by ``drain`` (with a code the extension reconnects on)
+    before uvicorn shuts down the remaining connections. SIGTERM and SIGINT
+    only stop the server, so main() returns normally and runs its cleanup
+    instead of the signal being re-raised afterwards.
+
+    Draining cannot move to the lifespan shutdown hook: uvicorn runs that
+    only after it has closed every connection. Both overridden methods are
+    uvicorn internals, so pyproject.toml pins uvicorn below the next
+    untested release.
+    """
+    def __init__(self, config: uvicorn.Config, drain: Callable[[], Awaitable[None]]):
+        super().__init__(config)
+        self.drain = drain
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+        handled = (signal.SIGINT, signal.SIGTERM)
+        original = {sig: signal.signal(sig, self.handle_exit) for sig in handled}
+        try:
+            yield
+        finally:
+            for sig, handler in original.items():
+                signal.signal(sig, handler)
+
+    async def shutdown(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        for server in self.servers:
+            server.close()
+        try:
+            await self.drain()
+        except Exception as e:
+            logger.error(f"Error while draining connections: {e}")
+        await super().shutdown(sockets=sockets)
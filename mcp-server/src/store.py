@@ -0,0 +1,316 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _remove_stale_spill_dirs(spill_root: Path) -> None:
+    """Delete spill directories left behind by server processes that have exited"""
+    # Same check as startup.find_previous_instance; imported lazily for the same reason
+    import psutil
+    for path in spill_root.iterdir():
+        if not path.is_dir() or not path.name.isdigit() or int(path.name) == os.getpid():
+            continue
+        if not psutil.pid_exists(int(path.name)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def content_hash(content: str) -> str:
+    """Hex digest identifying a page body"""
+    return hashlib.blake2b(content.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+class _Entry:
+    """One distinct page body in exactly one tier: raw, compressed or on disk"""
+    __slots__ = ("raw", "packed", "path", "size", "refs")
+
+    def __init__(self, raw: str):
+        self.raw: Optional[str] = raw
+        self.packed: Optional[bytes] = None
+        self.path: Optional[Path] = None
+        # Bytes this entry holds in memory
+        self.size = sys.getsizeof(raw)
+        # Number of tabs currently showing this body
+        self.refs = 0
+
+
+class TabStateStore:
+    """Page content for every tab, content-addressed and bounded by a global memory budget
+
+    Bodies are stored once per content hash and shared by every tab showing
+    the same page. Storing a body identical to a tab's current one is a no-op.
+
+    Bodies are kept in LRU order. When the in-memory total exceeds the budget,
+    the least recently used bodies are compressed first (if enabled), then
+    spilled to the on-disk cache (if a spill directory is set), and only then
+    dropped. Compressed and spilled content is restored lazily on the next read.
+
+    Demotion runs on a background thread, so compression and spill writes
+    never block the caller; memory use may exceed the budget briefly until it
+    catches up. Use ``load`` from the event loop: it restores demoted bodies
+    in a worker thread, while ``get`` restores them in the calling thread.
+    """
+    def __init__(self, memory_budget: int, compress: bool = True, spill_dir: Optional[Path] = None,
+                 compress_level: int = 1):
+        self.memory_budget = memory_budget
+        self.compress = compress
+        self.compress_level = compress_level
+        # Each process spills into its own subdirectory so servers never share files
+        self.spill_dir = spill_dir / str(os.getpid()) if spill_dir is not None else None
+        self._blobs: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Content hash currently shown by each tab
+        self._tabs: Dict[str, str] = {}
+        self._memory = 0
+        self.evictions = {"compressed": 0, "spilled": 0, "dropped": 0}
+        self.unchanged_updates = 0
+        self.shared_hits = 0
+        # Guards the tables above; compression and file I/O run outside it
+        self._lock = threading.Lock()
+        self._demote_wanted = threading.Event()
+        self._demoter: Optional[threading.Thread] = None
+        self._closed = False
+
+        if spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            _remove_stale_spill_dirs(spill_dir)
+
+    def put(self, tab_id: str, content: Optional[str], digest: Optional[str] = None) -> bool:
+        """Store the latest content for a tab, replacing any previous value
+
+        Args:
+            tab_id: ID of the tab
+            content: Page body, or None to clear it
+            digest: Precomputed content_hash(content), if already known
+
+        Returns:
+            bool: False if the tab already had exactly this content
+        """
+        if content is None:
+            had_content = tab_id in self._tabs
+            self.discard(tab_id)
+            return had_content
+
+        digest = digest or content_hash(content)
+        with self._lock:
+            if self._tabs.get(tab_id) == digest:
+                self.unchanged_updates += 1
+                return False
+
+            self._discard(tab_id)
+            entry = self._blobs.get(digest)
+            if entry is None:
+                entry = _Entry(content)
+                self._blobs[digest] = entry
+                self._memory += entry.size
+            else:
+                self.shared_hits += 1
+                self._blobs.move_to_end(digest)
+            entry.refs += 1
+            self._tabs[tab_id] = digest
+        self._request_demotion()
+        return True
+
+    def digest(self, tab_id: str) -> Optional[str]:
+        """Content hash of a tab's current body"""
+        return self._tabs.get(tab_id)
+
+    def get(self, tab_id: str) -> Optional[str]:
+        """Return a tab's content, restoring it from compressed or spilled storage in this thread"""
+        digest = self._tabs.get(tab_id)
+        return self._restore(digest) if digest is not None else None
+
+    async def load(self, tab_id: str) -> Optional[str]:
+        """Return the content a tab shows when called, restoring it in a worker thread if demoted"""
+        with self._lock:
+            digest = self._tabs.get(tab_id)
+            entry = self._blobs.get(digest) if digest is not None else None
+            if entry is None:
+                return None
+            self._blobs.move_to_end(digest)
+            if entry.raw is not None:
+                return entry.raw
+        return await asyncio.to_thread(self._restore, digest)
+
+    def _restore(self, digest: str) -> Optional[str]:
+        with self._lock:
+            entry = self._blobs.get(digest)
+            if entry is None:
+                return None
+            self._blobs.move_to_end(digest)
+            if entry.raw is not None:
+                return entry.raw
+            packed, path = entry.packed, entry.path
+
+        try:
+            content = zlib.decompress(packed if packed is not None else path.read_bytes())
+            content = content.decode("utf-8", "surrogatepass")
+        except (OSError, zlib.error) as e:
+            with self._lock:
+                if self._blobs.get(digest) is not entry:
+                    # Freed while being read
+                    return None
+                logger.warning(f"Failed to reload spilled page body {digest}: {e}")
+                self._drop(digest)
+            return None
+
+        with self._lock:
+            if self._blobs.get(digest) is entry and entry.raw is None:
+                if entry.path is not None:
+                    entry.path.unlink(missing_ok=True)
+                self._memory -= entry.size
+                entry.raw, entry.packed, entry.path = content, None, None
+                entry.size = sys.getsizeof(content)
+                self._memory += entry.size
+        self._request_demotion()
+        return content
+
+    def discard(self, tab_id: str) -> None:
+        """Forget a tab's content, freeing the body once no tab shows it"""
+        with self._lock:
+            self._discard(tab_id)
+
+    def _discard(self, tab_id: str) -> None:
+        digest = self._tabs.pop(tab_id, None)
+        if digest is None:
+            return
+        entry = self._blobs[digest]
+        entry.refs -= 1
+        if entry.refs <= 0:
+            self._free(digest)
+
+    def __contains__(self, tab_id: str) -> bool:
+        return tab_id in self._tabs
+
+    def _free(self, digest: str) -> None:
+        entry = self._blobs.pop(digest)
+        self._memory -= entry.size
+        if entry.path is not None:
+            entry.path.unlink(missing_ok=True)
+
+    def _drop(self, digest: str) -> None:
+        """Forget a body and every tab referencing it"""
+        for tab_id in [tab_id for tab_id, tab_digest in self._tabs.items() if tab_digest == digest]:
+            del self._tabs[tab_id]
+        self._free(digest)
+
+    def _request_demotion(self) -> None:
+        """Wake the demotion thread if memory use is over budget, starting it on first use"""
+        if self._memory <= self.memory_budget or self._closed:
+            return
+        if self._demoter is None:
+            self._demoter = threading.Thread(target=self._demote_loop, name="state-store-demoter", daemon=True)
+            self._demoter.start()
+        self._demote_wanted.set()
+
+    def _demote_loop(self) -> None:
+        while True:
+            self._demote_wanted.wait()
+            self._demote_wanted.clear()
+            if self._closed:
+                return
+            try:
+                self._enforce_budget()
+            except Exception as e:
+                logger.error(f"Failed to demote page bodies: {e}")
+
+    def _enforce_budget(self) -> None:
+        """Demote least recently used bodies until memory use fits the budget
+
+        Each body is compressed first (if enabled), then spilled (if a spill
+        directory is set), and only then dropped.
+        """
+        while True:
+            with self._lock:
+                if self._memory <= self.memory_budget:
+                    return
+                victim = next(((digest, entry) for digest, entry in self._blobs.items()
+                               if entry.raw is not None or entry.path is None), None)
+                if victim is None:
+                    return
+                digest, entry = victim
+                raw, packed = entry.raw, entry.packed
+                if (raw is None or not self.compress) and self.spill_dir is None:
+                    logger.info(f"Dropping page body {digest} to stay within memory budget")
+                    self._drop(digest)
+                    self.evictions["dropped"] += 1
+                    continue
+
+            if raw is not None and self.compress:
+                self._pack(digest, entry, raw)
+            else:
+                self._spill(digest, entry, raw, packed)
+
+    def _pack(self, digest: str, entry: _Entry, raw: str) -> None:
+        packed = zlib.compress(raw.encode("utf-8", "surrogatepass"), self.compress_level)
+        with self._lock:
+            if self._blobs.get(digest) is not entry or entry.raw is not raw:
+                # Freed meanwhile
+                return
+            self._memory -= entry.size
+            entry.raw, entry.packed = None, packed
+            entry.size = sys.getsizeof(packed)
+            self._memory += entry.size
+            self.evictions["compressed"] += 1
+
+    def _spill(self, digest: str, entry: _Entry, raw: Optional[str], packed: Optional[bytes]) -> None:
+        data = packed if packed is not None else zlib.compress(raw.encode("utf-8", "surrogatepass"),
+                                                               self.compress_level)
+        path = self.spill_dir / f"{digest}.z"
+        try:
+            path.write_bytes(data)
+        except OSError as e:
+            logger.warning(f"Failed to spill page body {digest}, dropping it: {e}")
+            path.unlink(missing_ok=True)
+            with self._lock:
+                if self._blobs.get(digest) is entry:
+                    self._drop(digest)
+                    self.evictions["dropped"] += 1
+            return
+        with self._lock:
+            if self._blobs.get(digest) is entry and entry.raw is raw and entry.packed is packed:
+                self._memory -= entry.size
+                entry.raw = entry.packed = None
+                entry.path = path
+                entry.size = 0
+                self.evictions["spilled"] += 1
+            else:
+                # Freed or restored meanwhile
+                path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        """Stop the demotion thread"""
+        self._closed = True
+        self._demote_wanted.set()
+        if self._demoter is not None:
+            self._demoter.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Memory use, tier counts and deduplication counters for the store"""
+        tiers = {"raw": 0, "compressed": 0, "spilled": 0}
+        with self._lock:
+            entries = list(self._blobs.values())
+        for entry in entries:
+            if entry.raw is not None:
+                tiers["raw"] += 1
+            elif entry.packed is not None:
+                tiers["compressed"] += 1
+            else:
+                tiers["spilled"] += 1
+        return {
+            "memory_bytes": self._memory,
+            "memory_budget": self.memory_budget,
+            "tabs": len(self._tabs),
+            "bodies": tiers,
+            "evictions": dict(self.evictions),
+            "unchanged_updates": self.unchanged_updates,
+            "shared_hits": self.shared_hits
+        }
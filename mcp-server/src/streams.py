@@ -0,0 +1,331 @@
+"""Chunked streaming transfers from the extension.
+
+A large payload is sent as a sequence of messages instead of one frame:
+
+    {"type": "streamStart", "stream_id": id, "kind": "state" | "transfer",
+     "size": n, "encoding": "identity" | "deflate", ...}
+    0x02 blob frame, header {"type": "streamChunk", "stream_id": id, "seq": 0}, raw bytes
+    ...
+    {"type": "streamEnd", "stream_id": id, "chunks": n}
+
+Chunks are inflated as they arrive and written to a spooled file that stays
+in memory up to ``spool_memory`` bytes and then rolls over to disk, so the
+payload is never built as one JSON string, and on the multiplexed socket
+other tabs' frames interleave between chunks instead of queueing behind a
+single huge frame.
+
+``state`` streams complete into an updateState snapshot. ``transfer``
+streams (screenshots and other binary results) are kept in a TransferStore
+and read back by byte range.
+"""
+import contextlib
+import logging
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, ContextManager, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KIND_STATE = "state"
+KIND_TRANSFER = "transfer"
+STREAM_KINDS = (KIND_STATE, KIND_TRANSFER)
+
+STREAM_ENCODINGS = ("identity", "deflate")
+
+
+class StreamError(ValueError):
+    """A stream message was out of order, oversized or corrupt; the stream is dropped
+
+    ``kind`` is the kind of the dropped stream, or None if it was unknown.
+    """
+    def __init__(self, message: str, kind: Optional[str] = None):
+        super().__init__(message)
+        self.kind = kind
+
+
+class Transfer:
+    """A completed stream: its header fields and the assembled bytes in a spooled file
+
+    A transfer may be evicted (closed) on the event loop while a worker
+    thread reads it. Readers pin it: close() is deferred until the last
+    pinned reader is done, and reads after close raise StreamError.
+    """
+    def __init__(self, tab_id: str, header: Dict[str, Any], file, size: int):
+        self.transfer_id = header.get("stream_id") or uuid.uuid4().hex
+        self.tab_id = tab_id
+        self.kind = header.get("kind")
+        self.media_type = header.get("media_type") or "application/octet-stream"
+        self.header = header
+        self.size = size
+        self.created = time.monotonic()
+        self._file = file
+        # Reads may run in worker threads; seek + read must not interleave
+        self._lock = threading.Lock()
+        # Guards the reader count and close state; never held during I/O
+        self._guard = threading.Lock()
+        self._readers = 0
+        self._close_pending = False
+        self._closed = False
+
+    def pin(self) -> ContextManager["Transfer"]:
+        """Keep the transfer open for the reads inside the block
+
+        Raises:
+            StreamError: If the transfer was already closed or evicted
+        """
+        return self._pinned(evicted_ok=False)
+
+    @contextlib.contextmanager
+    def _pinned(self, evicted_ok: bool) -> Iterator["Transfer"]:
+        with self._guard:
+            if self._closed or (self._close_pending and not evicted_ok):
+                raise StreamError(f"Transfer {self.transfer_id} expired", self.kind)
+            self._readers += 1
+        try:
+            yield self
+        finally:
+            with self._guard:
+                self._readers -= 1
+                close = self._close_pending and not self._readers
+                if close:
+                    self._closed = True
+            if close:
+                self._file.close()
+
+    def read(self, offset: int = 0, length: Optional[int] = None) -> bytes:
+        """Bytes ``offset`` to ``offset + length`` (to the end if length is None)
+
+        Raises:
+            StreamError: If the transfer was closed
+        """
+        # An evicted transfer stays readable until its pinned readers are done
+        with self._pinned(evicted_ok=True), self._lock:
+            self._file.seek(max(0, offset))
+            return self._file.read(-1 if length is None else max(0, length))
+
+    def text(self) -> str:
+        return self.read().decode("utf-8", "surrogatepass")
+
+    def close(self) -> None:
+        """Close the spooled file, or once the last pinned reader is done"""
+        with self._guard:
+            if self._closed:
+                return
+            if self._readers:
+                self._close_pending = True
+                return
+            self._closed = True
+        self._file.close()
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "transfer_id": self.transfer_id,
+            "tab_id": self.tab_id,
+            "media_type": self.media_type,
+            "size": self.size
+        }
+
+
+class _Inbound:
+    """A stream still receiving chunks"""
+    __slots__ = ("header", "file", "inflater", "next_seq", "size", "started")
+
+    def __init__(self, header: Dict[str, Any], file, inflater):
+        self.header = header
+        self.file = file
+        self.inflater = inflater
+        self.next_seq = 0
+        # Assembled (inflated) bytes so far
+        self.size = 0
+        self.started = time.monotonic()
+
+
+class StreamAssembler:
+    """Reassemble chunked streams per tab
+
+    Args:
+        max_bytes: Largest assembled payload accepted
+        spool_memory: Bytes kept in memory per stream before spooling to disk
+        spool_dir: Directory for spooled files (default: the system temp dir)
+        timeout: Seconds a stream may stay incomplete before it is dropped
+    """
+    def __init__(self, max_bytes: int, spool_memory: int, spool_dir: Optional[Path] = None,
+                 timeout: float = 60.0):
+        self.max_bytes = max_bytes
+        self.spool_memory = spool_memory
+        self.spool_dir = spool_dir
+        self.timeout = timeout
+        self._streams: Dict[Tuple[str, str], _Inbound] = {}
+        self.completed = 0
+        self.aborted = 0
+        if spool_dir is not None:
+            spool_dir.mkdir(parents=True, exist_ok=True)
+
+    def start(self, tab_id: str, message: Dict[str, Any]) -> None:
+        """Begin a stream announced by a streamStart message"""
+        self._expire()
+        stream_id = message.get("stream_id")
+        kind = message.get("kind")
+        if not isinstance(stream_id, str) or not stream_id:
+            raise StreamError("streamStart without a stream_id", kind)
+        if kind not in STREAM_KINDS:
+            raise StreamError(f"Unknown stream kind: {kind}")
+        encoding = message.get("encoding", "identity")
+        if encoding not in STREAM_ENCODINGS:
+            raise StreamError(f"Unknown stream encoding: {encoding}", kind)
+        size = message.get("size")
+        if isinstance(size, int) and size > self.max_bytes:
+            raise StreamError(f"Stream of {size} bytes exceeds {self.max_bytes}", kind)
+
+        previous = self._streams.pop((tab_id, stream_id), None)
+        if previous is not None:
+            previous.file.close()
+        header = {key: value for key, value in message.items() if key != "type"}
+        file = tempfile.SpooledTemporaryFile(
+            max_size=self.spool_memory, dir=str(self.spool_dir) if self.spool_dir else None
+        )
+        inflater = zlib.decompressobj() if encoding == "deflate" else None
+        self._streams[(tab_id, stream_id)] = _Inbound(header, file, inflater)
+
+    def chunk(self, tab_id: str, message: Dict[str, Any]) -> None:
+        """Append a streamChunk (blob frame) to its stream"""
+        stream = self._get(tab_id, message)
+        if message.get("seq") != stream.next_seq:
+            self._drop(tab_id, message["stream_id"])
+            raise StreamError(f"Stream {message['stream_id']} expected chunk {stream.next_seq}, "
+                              f"got {message.get('seq')}", stream.header["kind"])
+        stream.next_seq += 1
+        data = message.get("blob") or b""
+        if stream.inflater is not None:
+            try:
+                # Bound the inflated output so a small chunk cannot expand without limit
+                data = stream.inflater.decompress(data, self.max_bytes - stream.size + 1)
+            except zlib.error as e:
+                self._drop(tab_id, message["stream_id"])
+                raise StreamError(f"Corrupt stream {message['stream_id']}: {e}", stream.header["kind"]) from e
+        self._write(tab_id, message["stream_id"], stream, data)
+
+    def finish(self, tab_id: str, message: Dict[str, Any]) -> Transfer:
+        """Complete a stream on streamEnd
+
+        Returns:
+            Transfer: The assembled payload, rewound to the start
+        """
+        stream = self._get(tab_id, message)
+        stream_id = message["stream_id"]
+        kind = stream.header["kind"]
+        chunks = message.get("chunks")
+        if chunks is not None and chunks != stream.next_seq:
+            self._drop(tab_id, stream_id)
+            raise StreamError(f"Stream {stream_id} ended after {stream.next_seq} of {chunks} chunks", kind)
+        if stream.inflater is not None:
+            try:
+                self._write(tab_id, stream_id, stream, stream.inflater.flush())
+            except zlib.error as e:
+                self._drop(tab_id, stream_id)
+                raise StreamError(f"Corrupt stream {stream_id}: {e}", kind) from e
+            if not stream.inflater.eof:
+                self._drop(tab_id, stream_id)
+                raise StreamError(f"Stream {stream_id} ended before its compressed data", kind)
+        expected = stream.header.get("size")
+        if isinstance(expected, int) and expected != stream.size:
+            self._drop(tab_id, stream_id)
+            raise StreamError(f"Stream {stream_id} has {stream.size} bytes, expected {expected}", kind)
+
+        del self._streams[(tab_id, stream_id)]
+        stream.file.seek(0)
+        self.completed += 1
+        return Transfer(tab_id, stream.header, stream.file, stream.size)
+
+    def abort(self, tab_id: str) -> int:
+        """Drop every incomplete stream of a tab, e.g. when it disconnects"""
+        keys = [key for key in self._streams if key[0] == tab_id]
+        for key in keys:
+            self._drop(*key)
+        return len(keys)
+
+    def _get(self, tab_id: str, message: Dict[str, Any]) -> _Inbound:
+        stream = self._streams.get((tab_id, message.get("stream_id")))
+        if stream is None:
+            raise StreamError(f"Unknown stream {message.get('stream_id')}")
+        return stream
+
+    def _write(self, tab_id: str, stream_id: str, stream: _Inbound, data: bytes) -> None:
+        stream.size += len(data)
+        if stream.size > self.max_bytes:
+            self._drop(tab_id, stream_id)
+            raise StreamError(f"Stream {stream_id} exceeds {self.max_bytes} bytes", stream.header["kind"])
+        stream.file.write(data)
+
+    def _drop(self, tab_id: str, stream_id: str) -> None:
+        stream = self._streams.pop((tab_id, stream_id), None)
+        if stream is not None:
+            stream.file.close()
+            self.aborted += 1
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.timeout
+        for key in [key for key, stream in self._streams.items() if stream.started < deadline]:
+            logger.warning(f"Dropping stream {key[1]} from tab {key[0]}: incomplete after {self.timeout}s")
+            self._drop(*key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": len(self._streams),
+            "buffered_bytes": sum(stream.size for stream in self._streams.values()),
+            "completed": self.completed,
+            "aborted": self.aborted
+        }
+
+
+class TransferStore:
+    """Completed transfers kept for ranged reads, bounded by total size and age"""
+    def __init__(self, budget_bytes: int, ttl: float):
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self._transfers: "OrderedDict[str, Transfer]" = OrderedDict()
+        self._bytes = 0
+        self.evicted = 0
+
+    def add(self, transfer: Transfer) -> None:
+        self.discard(transfer.transfer_id)
+        self._transfers[transfer.transfer_id] = transfer
+        self._bytes += transfer.size
+        self._evict()
+
+    def get(self, transfer_id: str) -> Optional[Transfer]:
+        self._evict()
+        transfer = self._transfers.get(transfer_id)
+        if transfer is not None:
+            self._transfers.move_to_end(transfer_id)
+        return transfer
+
+    def discard(self, transfer_id: str) -> bool:
+        transfer = self._transfers.pop(transfer_id, None)
+        if transfer is None:
+            return False
+        self._bytes -= transfer.size
+        transfer.close()
+        return True
+
+    def _evict(self) -> None:
+        expired = time.monotonic() - self.ttl
+        for transfer_id, transfer in list(self._transfers.items()):
+            # The newest transfer is kept even if it alone exceeds the budget
+            over_budget = self._bytes > self.budget_bytes and len(self._transfers) > 1
+            if over_budget or transfer.created < expired:
+                self.discard(transfer_id)
+                self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transfers": len(self._transfers),
+            "bytes": self._bytes,
+            "budget_bytes": self.budget_bytes,
+            "evicted": self.evicted
+        }
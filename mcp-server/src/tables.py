@@ -0,0 +1,411 @@
+"""Typed, columnar storage for tables extracted from pages.
+
+extractTable results (rows inline, or streamed as a JSONL transfer for large
+tables) are loaded into a Table instead of being handed to the model:
+
+    - rows arrive as strings and are buffered in batches of ``batch_rows``
+    - every column's type is inferred over all rows: int, float, bool,
+      date (ISO YYYY-MM-DD) or string; empty cells and N/A-style markers
+      are nulls
+    - on finish each batch is converted to array-backed columns (array('q'),
+      array('d'), bytearray or a list of str) plus a null mask, and the raw
+      strings are dropped
+
+Tables are read back by page or exported batch by batch to CSV, JSONL or
+Parquet (Parquet needs pyarrow: ``pip install mcp-server[parquet]``).
+"""
+import array
+import csv
+import datetime
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from codec import dumps, loads
+
+TYPE_INT = "int"
+TYPE_FLOAT = "float"
+TYPE_BOOL = "bool"
+TYPE_DATE = "date"
+TYPE_STRING = "string"
+# Most specific first; a column gets the first type every non-null value parses as
+INFERRED_TYPES = (TYPE_INT, TYPE_FLOAT, TYPE_BOOL, TYPE_DATE)
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+
+NULL_TOKENS = frozenset(("", "-", "–", "—", "n/a", "na", "null", "none"))
+_TRUE = frozenset(("true", "yes"))
+_FALSE = frozenset(("false", "no"))
+_INT = re.compile(r"[+-]?(?:\d+|\d{1,3}(?:,\d{3})+)")
+_FLOAT = re.compile(r"[+-]?(?:(?:\d+|\d{1,3}(?:,\d{3})+)(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?")
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+# Codes such as "007" or "01234" keep their leading zeros as strings
+_LEADING_ZERO = re.compile(r"[+-]?0\d")
+_INT64 = 1 << 63
+
+# Cells are truncated to this many characters for summaries' sample values
+_SAMPLE_CHARS = 80
+
+
+class TableError(ValueError):
+    """An extraction result or table request could not be handled"""
+
+
+def _parses(kind: str, value: str) -> bool:
+    if kind == TYPE_INT:
+        return (_INT.fullmatch(value) is not None and _LEADING_ZERO.match(value) is None
+                and (len(value) < 19 or -_INT64 <= int(value.replace(",", "")) < _INT64))
+    if kind == TYPE_FLOAT:
+        return _FLOAT.fullmatch(value) is not None and _LEADING_ZERO.match(value) is None
+    if kind == TYPE_BOOL:
+        return value.lower() in _TRUE or value.lower() in _FALSE
+    if kind == TYPE_DATE:
+        if _DATE.fullmatch(value) is None:
+            return False
+        try:
+            datetime.date.fromisoformat(value)
+        except ValueError:
+            return False
+        return True
+    return True
+
+
+def _convert(kind: str, values: List[Optional[str]]):
+    """Typed storage for one column of a batch"""
+    if kind == TYPE_INT:
+        return array.array("q", (int(v.replace(",", "")) if v is not None else 0 for v in values))
+    if kind == TYPE_FLOAT:
+        return array.array("d", (float(v.replace(",", "")) if v is not None else 0.0 for v in values))
+    if kind == TYPE_BOOL:
+        return bytearray(1 if v is not None and v.lower() in _TRUE else 0 for v in values)
+    return values
+
+
+def _unique_names(headers: List[str], width: int) -> List[str]:
+    names: List[str] = []
+    seen = set()
+    for index in range(width):
+        name = headers[index].strip() if index < len(headers) and isinstance(headers[index], str) else ""
+        name = name or f"column_{index + 1}"
+        candidate, suffix = name, 2
+        while candidate in seen:
+            candidate = f"{name}_{suffix}"
+            suffix += 1
+        seen.add(candidate)
+        names.append(candidate)
+    return names
+
+
+class _Batch:
+    """Up to ``batch_rows`` rows: raw strings while loading, typed columns afterwards"""
+    __slots__ = ("rows", "columns", "nulls", "length")
+
+    def __init__(self):
+        self.rows: List[List[Optional[str]]] = []
+        self.columns: List[Any] = []
+        # Per column: bytearray with 1 for null cells, or None if the column has none
+        self.nulls: List[Optional[bytearray]] = []
+        self.length = 0
+
+    def value(self, column: int, row: int) -> Any:
+        nulls = self.nulls[column]
+        if nulls is not None and nulls[row]:
+            return None
+        value = self.columns[column][row]
+        return bool(value) if isinstance(self.columns[column], bytearray) else value
+
+
+class Table:
+    """One extracted table; build with append() and finish(), then read or export
+
+    Args:
+        headers: Header cells from the page (may be empty or shorter than the rows)
+        tab_id: Tab the table came from
+        selector: CSS selector it was extracted with
+        batch_rows: Rows per batch
+    """
+    def __init__(self, headers: List[str], tab_id: Optional[str] = None, selector: Optional[str] = None,
+                 batch_rows: int = 4096):
+        self.table_id = uuid.uuid4().hex[:12]
+        self.tab_id = tab_id
+        self.selector = selector
+        self.batch_rows = max(1, batch_rows)
+        self.headers = [h for h in headers if isinstance(h, str)] if isinstance(headers, list) else []
+        self.names: List[str] = []
+        self.types: List[str] = []
+        self.rows = 0
+        self.nbytes = 0
+        self.created = time.monotonic()
+        self.finished = False
+        self._batches: List[_Batch] = []
+        self._width = len(self.headers)
+        # Per column: types every non-null value so far parses as
+        self._candidates: List[List[str]] = []
+        self._null_counts: List[int] = []
+
+    def append(self, rows: Iterable[Any]) -> None:
+        """Add rows of cells (lists of strings); non-list rows are skipped"""
+        if self.finished:
+            raise TableError("Table is already finished")
+        for row in rows:
+            if not isinstance(row, list):
+                continue
+            if not self._batches or len(self._batches[-1].rows) >= self.batch_rows:
+                self._batches.append(_Batch())
+            cells: List[Optional[str]] = []
+            for index, cell in enumerate(row):
+                if index >= len(self._candidates):
+                    self._candidates.append(list(INFERRED_TYPES))
+                    self._null_counts.append(self.rows)
+                text = (cell if isinstance(cell, str) else ("" if cell is None else str(cell))).strip()
+                if len(text) <= 4 and text.lower() in NULL_TOKENS:
+                    cells.append(None)
+                    self._null_counts[index] += 1
+                    continue
+                candidates = self._candidates[index]
+                if candidates:
+                    candidates[:] = [kind for kind in candidates if _parses(kind, text)]
+                cells.append(text)
+            # Columns this row is too short for are null
+            for index in range(len(row), len(self._candidates)):
+                self._null_counts[index] += 1
+            self._batches[-1].rows.append(cells)
+            self.rows += 1
+
+    def finish(self) -> "Table":
+        """Fix column names and types and convert every batch to typed columns"""
+        if self.finished:
+            return self
+        self._width = max(self._width, len(self._candidates))
+        while len(self._candidates) < self._width:
+            self._candidates.append([])
+            self._null_counts.append(self.rows)
+        self.names = _unique_names(self.headers, self._width)
+        self.types = [
+            candidates[0] if candidates and nulls < self.rows else TYPE_STRING
+            for candidates, nulls in zip(self._candidates, self._null_counts)
+        ]
+        for batch in self._batches:
+            self._seal(batch)
+        self.finished = True
+        return self
+
+    def _seal(self, batch: _Batch) -> None:
+        batch.length = len(batch.rows)
+        for column, kind in enumerate(self.types):
+            values = [row[column] if column < len(row) else None for row in batch.rows]
+            nulls = bytearray(value is None for value in values)
+            batch.nulls.append(nulls if any(nulls) else None)
+            typed = _convert(kind, values)
+            batch.columns.append(typed)
+            if isinstance(typed, list):
+                self.nbytes += sum(len(value) for value in typed if value is not None) + 8 * len(typed)
+            else:
+                self.nbytes += len(typed) * (typed.itemsize if isinstance(typed, array.array) else 1)
+            self.nbytes += len(nulls) if batch.nulls[-1] is not None else 0
+        batch.rows = []
+
+    def _require_finished(self) -> None:
+        if not self.finished:
+            raise TableError("Table is still loading")
+
+    def iter_rows(self, offset: int = 0, limit: Optional[int] = None) -> Iterator[List[Any]]:
+        """Rows as lists of typed values (None for nulls)"""
+        self._require_finished()
+        end = self.rows if limit is None else min(self.rows, offset + limit)
+        position = 0
+        for batch in self._batches:
+            if position + batch.length <= offset:
+                position += batch.length
+                continue
+            for row in range(max(0, offset - position), batch.length):
+                if position + row >= end:
+                    return
+                yield [batch.value(column, row) for column in range(self._width)]
+            position += batch.length
+
+    def page(self, offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+        rows = list(self.iter_rows(offset, limit))
+        end = offset + len(rows)
+        return {
+            "table_id": self.table_id,
+            "columns": self.names,
+            "offset": offset,
+            "rows": rows,
+            "next_offset": end if end < self.rows else None,
+            "total_rows": self.rows
+        }
+
+    def summary(self, preview: int = 5) -> Dict[str, Any]:
+        """Shape, column types with per-column stats, and the first rows"""
+        self._require_finished()
+        columns = []
+        for column, (name, kind) in enumerate(zip(self.names, self.types)):
+            info: Dict[str, Any] = {"name": name, "type": kind, "nulls": self._null_counts[column]}
+            if kind in (TYPE_INT, TYPE_FLOAT, TYPE_DATE):
+                values = [v for v in self._column_values(column) if v is not None]
+                if values:
+                    info["min"], info["max"] = min(values), max(values)
+                    if kind != TYPE_DATE:
+                        info["mean"] = round(sum(values) / len(values), 6)
+            elif kind == TYPE_STRING:
+                samples = []
+                for value in self._column_values(column):
+                    if value is not None and value not in samples:
+                        samples.append(value)
+                        if len(samples) == 3:
+                            break
+                info["samples"] = [value[:_SAMPLE_CHARS] for value in samples]
+            columns.append(info)
+        return {
+            "table_id": self.table_id,
+            "tab_id": self.tab_id,
+            "selector": self.selector,
+            "rows": self.rows,
+            "columns": columns,
+            "preview": list(self.iter_rows(0, preview)),
+            "memory_bytes": self.nbytes
+        }
+
+    def _column_values(self, column: int) -> Iterator[Any]:
+        for batch in self._batches:
+            for row in range(batch.length):
+                yield batch.value(column, row)
+
+    def export(self, path: Path, fmt: str) -> int:
+        """Write the table to ``path`` batch by batch; returns the file size
+
+        Blocking; run it in a worker thread.
+        """
+        self._require_finished()
+        if fmt not in EXPORT_FORMATS:
+            raise TableError(f"Unknown export format {fmt}; use one of {', '.join(EXPORT_FORMATS)}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if fmt == "csv":
+            with path.open("w", newline="", encoding="utf-8") as file:
+                writer = csv.writer(file)
+                writer.writerow(self.names)
+                for row in self.iter_rows():
+                    writer.writerow(["" if value is None else value for value in row])
+        elif fmt == "jsonl":
+            with path.open("w", encoding="utf-8") as file:
+                for row in self.iter_rows():
+                    file.write(dumps(dict(zip(self.names, row))))
+                    file.write("\n")
+        else:
+            self._export_parquet(path)
+        return path.stat().st_size
+
+    def _export_parquet(self, path: Path) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise TableError("Parquet export needs pyarrow: pip install mcp-server[parquet]") from e
+        arrow_types = {
+            TYPE_INT: pa.int64(), TYPE_FLOAT: pa.float64(), TYPE_BOOL: pa.bool_(),
+            TYPE_DATE: pa.date32(), TYPE_STRING: pa.string()
+        }
+        schema = pa.schema([(name, arrow_types[kind]) for name, kind in zip(self.names, self.types)])
+        with pq.ParquetWriter(str(path), schema) as writer:
+            # One row group per batch
+            for batch in self._batches:
+                arrays = []
+                for column, kind in enumerate(self.types):
+                    nulls = batch.nulls[column]
+                    values = batch.columns[column]
+                    if kind == TYPE_DATE:
+                        values = [datetime.date.fromisoformat(v) if v is not None else None for v in values]
+                    elif kind == TYPE_BOOL:
+                        values = [bool(v) for v in values]
+                    mask = pa.array([bool(n) for n in nulls], pa.bool_()) if nulls is not None else None
+                    arrays.append(pa.array(values, arrow_types[kind], mask=mask))
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def iter_jsonl_rows(read: Callable[[int, int], bytes], size: int, chunk: int = 1024 * 1024) -> Iterator[Any]:
+    """Rows of a JSONL transfer (one JSON array per line), read ``chunk`` bytes at a time
+
+    Raises:
+        TableError: If a line is not valid JSON
+    """
+    offset = 0
+    pending = b""
+    while offset < size:
+        data = read(offset, chunk)
+        if not data:
+            break
+        offset += len(data)
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield _load_line(line)
+    if pending.strip():
+        yield _load_line(pending)
+
+
+def _load_line(line: bytes) -> Any:
+    try:
+        return loads(line)
+    except ValueError as e:
+        raise TableError(f"Invalid row in streamed table: {e}") from e
+
+
+class TableStore:
+    """Loaded tables kept for paging and export, bounded by total size and age"""
+    def __init__(self, budget_bytes: int, ttl: float):
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self._tables: "OrderedDict[str, Table]" = OrderedDict()
+        self._bytes = 0
+        self.evicted = 0
+        # Exports run in worker threads while the loop adds and evicts tables
+        self._lock = threading.Lock()
+
+    def add(self, table: Table) -> None:
+        with self._lock:
+            self._tables[table.table_id] = table
+            self._bytes += table.nbytes
+            self._evict()
+
+    def get(self, table_id: str) -> Optional[Table]:
+        with self._lock:
+            self._evict()
+            table = self._tables.get(table_id)
+            if table is not None:
+                self._tables.move_to_end(table_id)
+            return table
+
+    def discard(self, table_id: str) -> bool:
+        with self._lock:
+            return self._discard(table_id)
+
+    def _discard(self, table_id: str) -> bool:
+        table = self._tables.pop(table_id, None)
+        if table is None:
+            return False
+        self._bytes -= table.nbytes
+        return True
+
+    def _evict(self) -> None:
+        expired = time.monotonic() - self.ttl
+        for table_id, table in list(self._tables.items()):
+            # The newest table is kept even if it alone exceeds the budget
+            over_budget = self._bytes > self.budget_bytes and len(self._tables) > 1
+            if over_budget or table.created < expired:
+                self._discard(table_id)
+                self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tables": len(self._tables),
+                "bytes": self._bytes,
+                "budget_bytes": self.budget_bytes,
+                "evicted": self.evicted
+            }
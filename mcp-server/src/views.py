@@ -0,0 +1,73 @@
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def value_size(value: Any) -> int:
+    """Approximate memory held by a cached view
+
+    Values may report their own footprint through ``approximate_size`` (see
+    DomIndex).
+    """
+    size = getattr(value, "approximate_size", None)
+    if size is not None:
+        return size
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    # Lists of nodes: only the list, the nodes belong to a cached index
+    return sys.getsizeof(value)
+
+
+class ViewCache:
+    """Values derived from page bodies (parsed trees, text, selections)
+
+    Entries are keyed by the body's content hash, so every tab showing the
+    same page shares one parse, and a changed page simply looks up a new key.
+    Entries are evicted in LRU order once they take more than ``max_bytes``
+    (by value_size) or number more than ``max_entries``; a value larger than
+    ``max_bytes`` on its own is not cached.
+    """
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024, max_entries: int = 256):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[Any, int]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, digest: str, key: Hashable) -> Tuple[bool, Any]:
+        """Return (True, value) if a view of this body is cached"""
+        entry_key = (digest, key)
+        if entry_key not in self._entries:
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(entry_key)
+        self.hits += 1
+        return True, self._entries[entry_key][0]
+
+    def store(self, digest: str, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        """Cache a view computed from the body with this hash
+
+        Args:
+            size: Approximate bytes the value holds (default: value_size(value))
+        """
+        size = value_size(value) if size is None else size
+        self._discard((digest, key))
+        if size > self.max_bytes:
+            return
+        self._entries[(digest, key)] = (value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def _discard(self, entry_key: Tuple[str, Hashable]) -> None:
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
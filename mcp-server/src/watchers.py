@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Conditions tool_wait_for_change can wait on
+CONDITION_CHANGED = "changed"
+CONDITION_URL_CHANGED = "url_changed"
+CONDITION_HASH_CHANGED = "hash_changed"
+CONDITION_SELECTOR_APPEARED = "selector_appeared"
+CONDITION_SELECTOR_GONE = "selector_gone"
+CONDITIONS = (
+    CONDITION_CHANGED, CONDITION_URL_CHANGED, CONDITION_HASH_CHANGED,
+    CONDITION_SELECTOR_APPEARED, CONDITION_SELECTOR_GONE
+)
+
+# Longest a notification is held back by continuous updates, in multiples of the debounce
+MAX_DEBOUNCE_FACTOR = 8
+
+# Returns the number of elements matching a selector in a tab's current snapshot
+MatchCounter = Callable[[str, str], Awaitable[int]]
+
+
+def parse_resource_uri(uri: str) -> Tuple[Optional[str], Optional[str]]:
+    """Split resource://{tab_id}[/view...] into (tab_id, selector or None)"""
+    if not uri.startswith("resource://"):
+        return None, None
+    path = uri[len("resource://"):]
+    tab_id, _, view = path.partition("/")
+    if view.startswith("select/"):
+        return tab_id, view[len("select/"):]
+    return tab_id, None
+
+
+class PageWatchers:
+    """Deliver page state changes to waiting tools and MCP resource subscribers
+
+    ``notify`` is registered as a ConnectionManager state listener and is
+    called on every state update. Waiters and subscriptions debounce bursts
+    of updates, then evaluate their condition once against the latest state.
+    """
+    def __init__(self, get_state: Callable[[str], Optional[dict]], count_matches: MatchCounter,
+                 debounce: float = 0.25):
+        self.get_state = get_state
+        self.count_matches = count_matches
+        self.debounce = debounce
+        # Queues of tools blocked in wait_for, per tab
+        self._waiters: Dict[str, Set[asyncio.Queue]] = {}
+        # Subscribed sessions per resource URI, and the last state each URI was notified for
+        self._subscriptions: Dict[str, Set[Any]] = {}
+        self._last_signature: Dict[str, Any] = {}
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+        self._last_update: Dict[str, float] = {}
+
+    def notify(self, tab_id: str, previous: Optional[dict], current: Optional[dict]) -> None:
+        """Record a state change for a tab; ``current`` is None when the tab disconnects"""
+        for queue in self._waiters.get(tab_id, ()):
+            queue.put_nowait(current)
+        now = time.monotonic()
+        for uri in self._subscriptions:
+            if parse_resource_uri(uri)[0] != tab_id:
+                continue
+            self._last_update[uri] = now
+            if uri not in self._flush_tasks:
+                self._flush_tasks[uri] = asyncio.create_task(self._flush(uri))
+
+    # --- Waiting from tools -----------------------------------------------------
+
+    async def wait_for(self, tab_id: str, initial: dict, condition: str, selector: Optional[str],
+                       timeout: float, debounce: Optional[float] = None) -> Dict[str, Any]:
+        """Block until a condition holds for a tab or the timeout expires
+
+        Args:
+            tab_id: ID of the tab to watch
+            initial: The tab's state when waiting started (baseline for *_changed)
+            condition: One of CONDITIONS
+            selector: CSS selector for selector_appeared / selector_gone
+            timeout: Seconds to wait
+            debounce: Seconds of quiet to wait for after an update before evaluating
+
+        Returns:
+            Dict with matched flag, the state that satisfied the condition and elapsed seconds
+        """
+        debounce = self.debounce if debounce is None else debounce
+        started = time.monotonic()
+        deadline = started + timeout
+        queue: asyncio.Queue = asyncio.Queue()
+        self._waiters.setdefault(tab_id, set()).add(queue)
+        try:
+            # Selector conditions may already hold
+            if await self._evaluate(tab_id, initial, initial, condition, selector):
+                return self._result(True, condition, initial, started)
+
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return self._result(False, condition, None, started)
+                try:
+                    state = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    return self._result(False, condition, None, started)
+                state = await self._settle(queue, state, debounce)
+                if state is None:
+                    return {"matched": False, "condition": condition, "error": f"Tab {tab_id} disconnected"}
+                if await self._evaluate(tab_id, initial, state, condition, selector):
+                    return self._result(True, condition, state, started)
+        finally:
+            waiters = self._waiters.get(tab_id)
+            if waiters is not None:
+                waiters.discard(queue)
+                if not waiters:
+                    del self._waiters[tab_id]
+
+    @staticmethod
+    async def _settle(queue: asyncio.Queue, state: Optional[dict], debounce: float) -> Optional[dict]:
+        """Coalesce a burst of updates into the last one"""
+        while state is not None:
+            try:
+                state = await asyncio.wait_for(queue.get(), debounce)
+            except asyncio.TimeoutError:
+                break
+        return state
+
+    async def _evaluate(self, tab_id: str, initial: dict, state: dict, condition: str,
+                        selector: Optional[str]) -> bool:
+        if condition == CONDITION_URL_CHANGED:
+            return state.get("url") != initial.get("url")
+        if condition == CONDITION_HASH_CHANGED:
+            return state.get("hash") != initial.get("hash")
+        if condition == CONDITION_CHANGED:
+            return state.get("url") != initial.get("url") or state.get("hash") != initial.get("hash")
+        try:
+            count = await self.count_matches(tab_id, selector)
+        except LookupError:
+            return False
+        if condition == CONDITION_SELECTOR_APPEARED:
+            return count > 0
+        return count == 0
+
+    @staticmethod
+    def _result(matched: bool, condition: str, state: Optional[dict], started: float) -> Dict[str, Any]:
+        result = {
+            "matched": matched,
+            "condition": condition,
+            "elapsed": round(time.monotonic() - started, 3)
+        }
+        if state is not None:
+            result["url"] = state.get("url")
+            result["hash"] = state.get("hash")
+        else:
+            result["error"] = "Timed out waiting for condition"
+        return result
+
+    # --- MCP resource subscriptions ----------------------------------------------
+
+    async def subscribe(self, uri: str, session: Any) -> None:
+        """Register a session for resources/updated notifications on a URI"""
+        if uri not in self._subscriptions:
+            # Baseline so the first notification reflects a real change
+            self._last_signature[uri] = await self._signature(uri, self.get_state(parse_resource_uri(uri)[0]))
+        self._subscriptions.setdefault(uri, set()).add(session)
+        logger.info(f"Subscribed to {uri}")
+
+    def unsubscribe(self, uri: str, session: Any) -> None:
+        sessions = self._subscriptions.get(uri)
+        if sessions is None:
+            return
+        sessions.discard(session)
+        if not sessions:
+            del self._subscriptions[uri]
+            self._last_signature.pop(uri, None)
+            self._last_update.pop(uri, None)
+        logger.info(f"Unsubscribed from {uri}")
+
+    async def _signature(self, uri: str, state: Optional[dict]) -> Any:
+        """The part of a tab's state a subscription to ``uri`` cares about"""
+        if state is None:
+            return None
+        tab_id, selector = parse_resource_uri(uri)
+        if selector is None:
+            return state.get("url"), state.get("hash")
+        try:
+            return await self.count_matches(tab_id, selector)
+        except (LookupError, ValueError):
+            return None
+
+    async def _flush(self, uri: str) -> None:
+        """Debounce updates for one URI, then notify its subscribers if it changed
+
+        Waits until no update arrived for ``debounce`` seconds, but no longer
+        than MAX_DEBOUNCE_FACTOR times that so constantly changing pages still notify.
+        """
+        started = time.monotonic()
+        try:
+            while True:
+                now = time.monotonic()
+                delay = min(self._last_update.get(uri, now) + self.debounce,
+                            started + self.debounce * MAX_DEBOUNCE_FACTOR) - now
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            self._flush_tasks.pop(uri, None)
+        sessions = self._subscriptions.get(uri)
+        if not sessions:
+            return
+        state = self.get_state(parse_resource_uri(uri)[0])
+        signature = await self._signature(uri, state)
+        if self._last_signature.get(uri) == signature:
+            return
+        self._last_signature[uri] = signature
+
+        for session in list(sessions):
+            try:
+                await session.send_resource_updated(uri)
+            except Exception as e:
+                logger.info(f"Dropping subscription to {uri}: {e}")
+                self.unsubscribe(uri, session)
@@ -0,0 +1,31 @@
+import asyncio
+import json
+from typing import List, Union
+
+
+class FakeSocket:
+    """Stands in for a FastAPI WebSocket: records sent frames, optionally stalls sends"""
+    def __init__(self, stall: bool = False):
+        self.sent: List[Union[str, bytes]] = []
+        self.closed_with = None
+        self.stall = stall
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame: str):
+        await self._send(frame)
+
+    async def send_bytes(self, frame: bytes):
+        await self._send(frame)
+
+    async def _send(self, frame):
+        if self.stall:
+            await asyncio.Event().wait()
+        self.sent.append(frame)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+    def messages(self) -> list:
+        return [json.loads(frame) for frame in self.sent if isinstance(frame, str)]
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import (
+    REASON_COMMAND_RATE, REASON_OVERLOADED, REASON_TAB_RATE, ConcurrencyLimiter, RateLimiter, Throttled,
+    TokenBucket, parse_rate_limits
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_refills_up_to_burst():
+    bucket = TokenBucket(rate=2, burst=3, now=0)
+    for _ in range(3):
+        assert bucket.wait_time(0) == 0
+        bucket.take()
+    assert bucket.wait_time(0) == pytest.approx(0.5)
+    assert bucket.wait_time(10) == 0 and bucket.tokens == 3
+    assert bucket.full(10)
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("navigateTo=1/5, reload=0.5,") == {"navigateTo": (1.0, 5.0), "reload": (0.5, 0.5)}
+    assert parse_rate_limits("") == {}
+    for spec in ("navigateTo", "=1", "reload=0", "reload=x"):
+        with pytest.raises(ValueError):
+            parse_rate_limits(spec)
+
+
+def test_tab_rate_limit(clock):
+    limiter = RateLimiter(tab_rate=1, tab_burst=2, command_limits={})
+    limiter.check("t", "clickElement")
+    limiter.check("t", "typeText")
+    with pytest.raises(Throttled) as error:
+        limiter.check("t", "clickElement")
+    assert error.value.reason == REASON_TAB_RATE and error.value.retry_after == pytest.approx(1)
+    # Other tabs have their own bucket
+    limiter.check("u", "clickElement")
+    clock.now += 1
+    limiter.check("t", "clickElement")
+    assert limiter.stats()["throttled"] == {REASON_TAB_RATE: 1, REASON_COMMAND_RATE: 0}
+
+
+def test_command_limit_does_not_charge_the_tab_when_throttled(clock):
+    limiter = RateLimiter(tab_rate=1, tab_burst=2, command_limits={"navigateTo": (0.1, 1)})
+    limiter.check("t", "navigateTo")
+    with pytest.raises(Throttled) as error:
+        limiter.check("t", "navigateTo")
+    assert error.value.reason == REASON_COMMAND_RATE
+    # The rejected navigateTo took no tab token
+    limiter.check("t", "clickElement")
+
+
+def test_steps_charge_command_buckets_without_the_tab(clock):
+    limiter = RateLimiter(tab_rate=1, tab_burst=1, command_limits={"navigateTo": (1, 2)})
+    # A multi-step tool: one tab token up front, then each step's command type
+    limiter.check("t")
+    limiter.check("t", "clickElement", tab=False)
+    limiter.check("t", "navigateTo", tab=False)
+    limiter.check("t", "navigateTo", tab=False)
+    with pytest.raises(Throttled) as error:
+        limiter.check("t", "navigateTo", tab=False)
+    assert error.value.reason == REASON_COMMAND_RATE
+    assert limiter._tabs["t"].tokens == 0
+    with pytest.raises(Throttled) as error:
+        limiter.check("t", "clickElement")
+    assert error.value.reason == REASON_TAB_RATE
+
+
+def test_forget_and_prune(clock, monkeypatch):
+    limiter = RateLimiter(tab_rate=10, tab_burst=1, command_limits={"reload": (1, 1)})
+    limiter.check("t", "reload")
+    limiter.forget("t")
+    assert limiter.stats()["buckets"] == 0
+
+    monkeypatch.setattr(admission, "PRUNE_BUCKETS", 4)
+    for tab in "abcd":
+        limiter.check(tab, "status")
+    clock.now += 1
+    limiter.check("e", "status")
+    # Refilled buckets are dropped; the one just charged stays
+    assert list(limiter._tabs) == ["e"]
+
+
+def test_concurrency_limiter_queues_in_order_and_sheds():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=2, queue_timeout=5)
+        await limiter.acquire()
+        order = []
+
+        async def wait(name):
+            await limiter.acquire()
+            order.append(name)
+
+        waiters = [asyncio.create_task(wait(name)) for name in ("first", "second")]
+        await asyncio.sleep(0)
+        with pytest.raises(Throttled) as error:
+            await limiter.acquire()
+        assert error.value.reason == REASON_OVERLOADED
+
+        limiter.release()
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*waiters)
+        limiter.release()
+        assert order == ["first", "second"]
+        assert limiter.stats()["active"] == 0 and limiter.stats()["shed"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_concurrency_limiter_times_out_waiters():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=5, queue_timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(Throttled, match="no command slot"):
+            await limiter.acquire()
+        assert limiter.stats()["queued"] == 0
+        limiter.release()
+        assert limiter.stats()["active"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=5, queue_timeout=5)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()
+        assert limiter.stats() | {"peak": 0, "queued_total": 0} == {
+            "max_concurrent": 1, "active": 0, "peak": 0, "queued": 0, "max_queue": 5, "queued_total": 0, "shed": 0
+        }
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+import pytest
+
+from codec import MessageError, dumps, loads, validate_inbound
+from models import Message
+
+
+def test_dumps_is_compact_and_round_trips():
+    value = {"type": "commandResult", "result": [1, "é", None]}
+    assert dumps(value) == '{"type":"commandResult","result":[1,"é",null]}'
+    assert loads(dumps(value)) == value
+    assert loads(memoryview(dumps(value).encode())) == value
+
+
+def test_validate_inbound_accepts_known_and_unknown_types():
+    message = {"type": "commandResult", "request_id": "r1", "success": True}
+    assert validate_inbound(message) is message
+    assert validate_inbound({"type": "somethingNew", "x": 1}) == {"type": "somethingNew", "x": 1}
+
+
+@pytest.mark.parametrize("message, error", [
+    ([], "JSON object"),
+    ({"args": []}, "string type"),
+    ({"type": "commandResult"}, "missing request_id"),
+    ({"type": "streamChunk", "stream_id": "s", "seq": "0", "blob": b""}, "seq has the wrong type"),
+    ({"type": "updateState", "args": ["https://a"]}, "[url, html]"),
+    ({"type": "updateState", "args": [None, 5]}, "[url, html]"),
+])
+def test_validate_inbound_rejects_malformed(message, error):
+    with pytest.raises(MessageError, match=error):
+        validate_inbound(message)
+
+
+def test_message_wire_layout():
+    message = loads(Message("clickElement", ["#a", {"x": 1}], "server", "r1").to_json())
+    assert list(message) == ["type", "sender_id", "args", "request_id", "timestamp"]
+    assert message | {"timestamp": None} == {
+        "type": "clickElement", "sender_id": "server", "args": ["#a", {"x": 1}], "request_id": "r1", "timestamp": None
+    }
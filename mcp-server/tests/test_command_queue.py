@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeSocket
+from managers import CommandCancelled, CommandQueue, ConnectionManager
+from models import Message
+
+
+def granted(tickets) -> list:
+    return [ticket.request_id for ticket in tickets if ticket.granted.done()]
+
+
+def test_independent_commands_pipeline_up_to_the_limit():
+    async def scenario():
+        queue = CommandQueue(max_in_flight=2)
+        tickets = [queue.submit(f"c{n}", barrier=False) for n in range(4)]
+        assert granted(tickets) == ["c0", "c1"]
+        queue.release(tickets[1])
+        assert granted(tickets) == ["c0", "c1", "c2"]
+        assert queue.stats() == {"queued": 1, "in_flight": 2, "max_in_flight": 2}
+
+    asyncio.run(scenario())
+
+
+def test_barrier_waits_for_earlier_commands_and_holds_back_later_ones():
+    async def scenario():
+        queue = CommandQueue(max_in_flight=4)
+        before = queue.submit("click", barrier=False)
+        barrier = queue.submit("navigate", barrier=True)
+        after = queue.submit("type", barrier=False)
+        assert granted([before, barrier, after]) == ["click"]
+        queue.release(before)
+        assert granted([barrier, after]) == ["navigate"]
+        queue.release(barrier)
+        assert granted([after]) == ["type"]
+
+    asyncio.run(scenario())
+
+
+def test_abandoned_and_failed_tickets():
+    async def scenario():
+        queue = CommandQueue(max_in_flight=1)
+        first = queue.submit("a", barrier=False)
+        second = queue.submit("b", barrier=False)
+        third = queue.submit("c", barrier=False)
+        # A caller giving up while queued leaves the order intact
+        queue.release(second)
+        queue.release(first)
+        assert granted([second, third]) == ["c"]
+        fourth = queue.submit("d", barrier=True)
+        queue.fail_all(ConnectionError("gone"))
+        with pytest.raises(ConnectionError):
+            await fourth.granted
+        assert queue.stats()["queued"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_navigation_is_sent_only_after_earlier_replies():
+    async def scenario():
+        manager = ConnectionManager(max_in_flight=4)
+        socket = FakeSocket()
+        await manager.connect(socket, "t")
+        click = asyncio.create_task(manager.send_request(Message("clickElement", [], request_id="c"), "t", 5))
+        navigate = asyncio.create_task(manager.send_request(Message("navigateTo", [], request_id="n"), "t", 5))
+        await asyncio.sleep(0.01)
+        assert [message["request_id"] for message in socket.messages()] == ["c"]
+        manager.resolve_request({"request_id": "c", "success": True})
+        await asyncio.sleep(0.01)
+        assert [message["request_id"] for message in socket.messages()] == ["c", "n"]
+        # Cancelling the queue releases the navigation's caller
+        assert manager.cancel_requests("t") == 1
+        await click
+        with pytest.raises(CommandCancelled):
+            await navigate
+
+    asyncio.run(scenario())
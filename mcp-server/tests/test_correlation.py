@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeSocket
+from managers import ConnectionManager
+from models import Message
+
+
+async def connected(tab_id: str = "t", **options):
+    manager = ConnectionManager(**options)
+    socket = FakeSocket()
+    await manager.connect(socket, tab_id)
+    return manager, socket
+
+
+async def sent_request_ids(socket: FakeSocket, count: int):
+    """Request IDs of the first ``count`` commands once the writer has sent them"""
+    for _ in range(100):
+        if len(socket.sent) >= count:
+            break
+        await asyncio.sleep(0)
+    return [message["request_id"] for message in socket.messages()[:count]]
+
+
+def test_replies_resolve_their_own_request_in_any_order():
+    async def scenario():
+        manager, socket = await connected(max_in_flight=4)
+        first = asyncio.create_task(manager.send_request(Message("status", []), "t", 5))
+        second = asyncio.create_task(manager.send_request(Message("getElementInfo", ["#a"]), "t", 5))
+        first_id, second_id = await sent_request_ids(socket, 2)
+        assert first_id != second_id
+
+        assert manager.resolve_request({"request_id": second_id, "success": True, "result": "second"})
+        assert manager.resolve_request({"request_id": first_id, "success": True, "result": "first"})
+        assert (await first)["result"] == "first"
+        assert (await second)["result"] == "second"
+        assert manager.pending_requests == {}
+
+    asyncio.run(scenario())
+
+
+def test_given_request_id_is_sent_unchanged():
+    async def scenario():
+        manager, socket = await connected()
+        task = asyncio.create_task(manager.send_request(Message("status", [], request_id="mine"), "t", 5))
+        assert await sent_request_ids(socket, 1) == ["mine"]
+        manager.resolve_request({"request_id": "mine", "success": True})
+        assert (await task)["success"]
+
+    asyncio.run(scenario())
+
+
+def test_timeout_is_per_call_and_late_replies_are_ignored():
+    async def scenario():
+        manager, socket = await connected(max_in_flight=4)
+        slow = asyncio.create_task(manager.send_request(Message("status", []), "t", 0.05))
+        patient = asyncio.create_task(manager.send_request(Message("status", []), "t", 5))
+        slow_id, patient_id = await sent_request_ids(socket, 2)
+        with pytest.raises(asyncio.TimeoutError):
+            await slow
+        assert slow_id not in manager.pending_requests
+        # The timed-out request's reply arrives late; the other call is unaffected
+        assert not manager.resolve_request({"request_id": slow_id, "success": True})
+        assert manager.resolve_request({"request_id": patient_id, "success": True, "result": 1})
+        assert (await patient)["result"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_unknown_replies_are_rejected():
+    async def scenario():
+        manager, _ = await connected()
+        assert not manager.resolve_request({"request_id": "nobody", "success": True})
+        assert not manager.resolve_request({"success": True})
+
+    asyncio.run(scenario())
+
+
+def test_disconnect_fails_pending_requests():
+    async def scenario():
+        manager, socket = await connected(max_in_flight=1)
+        sent = asyncio.create_task(manager.send_request(Message("status", []), "t", 5))
+        queued = asyncio.create_task(manager.send_request(Message("status", []), "t", 5))
+        await sent_request_ids(socket, 1)
+        await manager.disconnect("t")
+        for task in (sent, queued):
+            with pytest.raises(ConnectionError, match="disconnected"):
+                await task
+        assert manager.pending_requests == {}
+
+    asyncio.run(scenario())
+
+
+def test_unconnected_tab_is_rejected_without_sending():
+    async def scenario():
+        manager, socket = await connected()
+        with pytest.raises(ConnectionError, match="not found"):
+            await manager.send_request(Message("status", []), "other", 5)
+        assert socket.sent == [] and manager.pending_requests == {}
+
+    asyncio.run(scenario())
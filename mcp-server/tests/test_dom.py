@@ -0,0 +1,77 @@
+import pytest
+
+from dom import DomIndex, describe, extract_text, outer_html, parse_html, parse_selector, select
+
+PAGE = """<!doctype html>
+<html><head><title>T</title><style>p { color: red }</style></head>
+<body>
+  <nav><a href="/">Home</a></nav>
+  <main id="content">
+    <h1 class="title big">Results</h1>
+    <p>First <b>para</b><p>Second para
+    <ul class="list">
+      <li class="item"><a href="https://a.example/x" data-kind="ext">A</a></li>
+      <li class="item odd"><a href="/local">B</a></li>
+      <li class="item"><img src="c.png"><span lang="en-US">C</span></li>
+    </ul>
+    <script>var x = "<li>";</script>
+  </main>
+  <footer>Footer</footer>
+</body></html>"""
+
+
+@pytest.fixture(scope="module")
+def index():
+    return DomIndex.from_html(PAGE)
+
+
+@pytest.mark.parametrize("selector", [
+    "li", "li.item", ".odd", "#content li", "main > h1", "ul > li > a", "li + li", "li ~ li",
+    "a[href]", 'a[href^="https"]', "a[href$=local]", "a[data-kind=ext]", "span[lang|=en]",
+    "*", "h1.title.big", "li a, h1", "#content p", "nav a",
+])
+def test_index_matches_plain_select(index, selector):
+    root = parse_html(PAGE)
+    expected = [outer_html(node) for node in select(root, selector)]
+    assert [outer_html(node) for node in index.select(selector)] == expected
+
+
+@pytest.mark.parametrize("selector, count", [
+    ("li", 3), (".item", 3), ("li.odd a", 1), ("li + li", 2), ("ul > a", 0), ("a[href*=example]", 1),
+    ("li a, h1", 3), ("#missing li", 0), ("p", 2),
+])
+def test_selector_counts(index, selector, count):
+    assert len(index.select(selector)) == count
+
+
+def test_results_are_in_document_order_and_limited(index):
+    assert [node.tag for node in index.select("a, h1")] == ["a", "h1", "a", "a"]
+    assert len(index.select("li", limit=2)) == 2
+
+
+@pytest.mark.parametrize("selector", ["", "li:hover", "> li", "li >", "a,,b", "li::before"])
+def test_unsupported_selectors(selector):
+    with pytest.raises(ValueError):
+        parse_selector(selector)
+
+
+def test_implied_end_tags_and_void_elements(index):
+    first, second = index.select("p")
+    assert outer_html(first) == "<p>First <b>para</b></p>"
+    assert second.children[0].strip() == "Second para"
+    assert index.select("img")[0].children == []
+
+
+def test_extract_text(index):
+    text = extract_text(index.root)
+    assert "Home" in text and "Footer" in text and "color" not in text and "var x" not in text
+    readable = extract_text(index.root, readable=True)
+    assert readable.splitlines()[:3] == ["Results", "First para", "Second para"]
+    assert "Home" not in readable and "Footer" not in readable
+
+
+def test_describe(index):
+    link = index.select("a[data-kind]")[0]
+    assert describe(link, ["tag", "text", "href", "missing", "class"]) == {
+        "tag": "a", "text": "A", "href": "https://a.example/x", "missing": None, "class": []
+    }
@@ -0,0 +1,45 @@
+import json
+import zlib
+
+import pytest
+
+from framing import (
+    ENCODING_DEFLATE, ENCODING_JSON, FRAME_BLOB, FRAME_DEFLATE, FrameError, decode_binary, encode_blob,
+    encode_message
+)
+
+
+def test_encode_message_compresses_only_large_deflate_messages():
+    small = json.dumps({"type": "ping"})
+    large = json.dumps({"type": "updateState", "args": ["u", "x" * 5000]})
+    assert encode_message(large, ENCODING_JSON, 100) == large
+    assert encode_message(small, ENCODING_DEFLATE, 100) == small
+    frame = encode_message(large, ENCODING_DEFLATE, 100)
+    assert frame[0] == FRAME_DEFLATE and len(frame) < len(large)
+    assert decode_binary(frame, 1 << 20) == json.loads(large)
+
+
+def test_deflate_frame_over_max_size_is_rejected():
+    frame = bytes([FRAME_DEFLATE]) + zlib.compress(json.dumps({"data": "x" * 10000}).encode())
+    with pytest.raises(FrameError, match="exceeds"):
+        decode_binary(frame, 1000)
+
+
+def test_blob_frame_round_trip():
+    blob = bytes(range(256))
+    message = decode_binary(encode_blob({"type": "streamChunk", "stream_id": "s", "seq": 3}, blob), 1 << 20)
+    assert message == {"type": "streamChunk", "stream_id": "s", "seq": 3, "blob": blob}
+
+
+@pytest.mark.parametrize("frame, error", [
+    (b"", "Empty"),
+    (bytes([0x7f, 1, 2]), "Unknown frame type"),
+    (bytes([FRAME_DEFLATE]) + b"not zlib", "Invalid compressed frame"),
+    (bytes([FRAME_DEFLATE]) + zlib.compress(b"[1, 2]"), "JSON object"),
+    (bytes([FRAME_BLOB, 0, 0]), "Truncated blob frame"),
+    (bytes([FRAME_BLOB, 0, 0, 0, 50]) + b"{}", "Truncated blob header"),
+    (bytes([FRAME_BLOB, 0, 0, 0, 2]) + b"[]", "Blob header must be a JSON object"),
+])
+def test_decode_binary_rejects_malformed_frames(frame, error):
+    with pytest.raises(FrameError, match=error):
+        decode_binary(frame, 1 << 20)
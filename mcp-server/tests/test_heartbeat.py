@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+from heartbeat import Heartbeats
+
+
+class Tabs:
+    """Records pings sent to tabs and tabs reported dead"""
+    def __init__(self):
+        self.pings = []
+        self.dead = []
+
+    async def send(self, tab_id: str, frame: str) -> bool:
+        self.pings.append((tab_id, json.loads(frame)))
+        return True
+
+    async def on_dead(self, tab_id: str) -> None:
+        self.dead.append(tab_id)
+
+
+def test_idle_tab_is_pinged_and_pong_measures_round_trip():
+    async def scenario():
+        tabs = Tabs()
+        heartbeats = Heartbeats(tabs.send, tabs.on_dead, interval=0.05, timeout=5)
+        heartbeats.start()
+        heartbeats.add("t")
+        await asyncio.sleep(0.08)
+        assert len(tabs.pings) == 1
+        tab_id, ping = tabs.pings[0]
+        assert tab_id == "t" and ping["type"] == "ping" and ping["sender_id"] == "server"
+        assert heartbeats.describe("t")["missed_pings"] == 1
+
+        # A pong for another ping is ignored
+        heartbeats.pong("t", "stale")
+        assert heartbeats.describe("t")["rtt_ms"] is None
+        heartbeats.pong("t", ping["ping_id"])
+        info = heartbeats.describe("t")
+        assert info["rtt_ms"] is not None and info["missed_pings"] == 0
+        await heartbeats.stop()
+
+    asyncio.run(scenario())
+
+
+def test_active_tab_is_not_pinged():
+    async def scenario():
+        tabs = Tabs()
+        heartbeats = Heartbeats(tabs.send, tabs.on_dead, interval=0.05, timeout=5)
+        heartbeats.start()
+        heartbeats.add("t")
+        for _ in range(8):
+            await asyncio.sleep(0.02)
+            heartbeats.touch("t")
+        assert tabs.pings == [] and heartbeats.stats()["pings"] == 0
+        await heartbeats.stop()
+
+    asyncio.run(scenario())
+
+
+def test_silent_tab_is_reported_dead_once():
+    async def scenario():
+        tabs = Tabs()
+        heartbeats = Heartbeats(tabs.send, tabs.on_dead, interval=0.02, timeout=0.06)
+        heartbeats.start()
+        heartbeats.add("t")
+        heartbeats.add("gone")
+        heartbeats.remove("gone")
+        await asyncio.sleep(0.2)
+        assert tabs.dead == ["t"]
+        assert heartbeats.describe("t") is None
+        stats = heartbeats.stats()
+        assert stats["reaped"] == 1 and stats["tracked"] == 0 and stats["pings"] >= 1
+        await heartbeats.stop()
+
+    asyncio.run(scenario())
+
+
+def test_reconnected_tab_starts_a_fresh_deadline():
+    async def scenario():
+        tabs = Tabs()
+        heartbeats = Heartbeats(tabs.send, tabs.on_dead, interval=0.03, timeout=0.09)
+        heartbeats.start()
+        heartbeats.add("t")
+        await asyncio.sleep(0.06)
+        # Entries of the old connection must not reap the new one early
+        heartbeats.remove("t")
+        heartbeats.add("t")
+        await asyncio.sleep(0.06)
+        assert tabs.dead == []
+        await asyncio.sleep(0.1)
+        assert tabs.dead == ["t"]
+        await heartbeats.stop()
+
+    asyncio.run(scenario())
+
+
+def test_disabled_heartbeats_track_nothing():
+    async def scenario():
+        tabs = Tabs()
+        heartbeats = Heartbeats(tabs.send, tabs.on_dead, interval=0)
+        heartbeats.start()
+        heartbeats.add("t")
+        assert not heartbeats.enabled and heartbeats._task is None
+        assert heartbeats.describe("t") is None
+        await heartbeats.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,50 @@
+import pytest
+
+from macros import MAX_STEPS, MacroError, substitute, validate
+
+COMMANDS = ("navigateTo", "clickElement", "extractTable")
+
+
+def test_valid_macro():
+    validate([
+        {"command": "navigateTo", "args": ["https://example.com"]},
+        {"wait": "selector_appeared", "selector": "#q", "timeout": 5},
+        {"query": "a.next", "fields": ["href"], "capture": "next", "when": {"selector": "a.next"}},
+        {"sleep": 0.5},
+        {"assert": {"all": [{"var": "next", "matches": "^/page"}, {"not": {"url_contains": "error"}}]}},
+        {"command": "clickElement", "args": ["#go"], "retry": 2, "optional": True},
+    ], COMMANDS)
+
+
+@pytest.mark.parametrize("steps, error", [
+    ([], "At least one step"),
+    ([{"sleep": 0}] * (MAX_STEPS + 1), "limited to"),
+    (["navigateTo"], "must be an object"),
+    ([{"sleep": 1, "command": "navigateTo"}], "exactly one of"),
+    ([{"args": []}], "exactly one of"),
+    ([{"command": "rm -rf"}], "unknown command"),
+    ([{"wait": "forever"}], "unknown wait condition"),
+    ([{"wait": "selector_gone"}], "needs a selector"),
+    ([{"sleep": "1"}], "number of seconds"),
+    ([{"assert": {}}], "non-empty object"),
+    ([{"assert": {"any": []}}], "non-empty list"),
+    ([{"assert": {"var": "x", "equals": 1, "contains": 1}}], "only one of"),
+    ([{"assert": {"var": "x", "matches": "("}}], "invalid pattern"),
+    ([{"sleep": 1, "when": {"color": "red"}}], "unknown condition"),
+    ([{"sleep": 1, "retry": 9}], "retry must be"),
+])
+def test_invalid_macros(steps, error):
+    with pytest.raises(MacroError, match=error):
+        validate(steps, COMMANDS)
+
+
+def test_errors_name_the_step():
+    with pytest.raises(MacroError, match="Step 1:"):
+        validate([{"sleep": 1}, {"sleep": None}], COMMANDS)
+
+
+def test_substitute():
+    captures = {"user": {"name": "ann", "ids": [7, 8]}, "empty": None}
+    assert substitute("${user.ids}", captures) == [7, 8]
+    assert substitute("hi ${user.name} #${user.ids.-1}${empty}${missing}", captures) == "hi ann #8"
+    assert substitute({"args": ["${user.name}", 3]}, captures) == {"args": ["ann", 3]}
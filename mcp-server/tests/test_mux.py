@@ -0,0 +1,23 @@
+import pytest
+
+from codec import dumps
+from framing import FrameError, decode_channel_frame, encode_blob, encode_channel_frame, split_channel_frame
+
+
+def test_channel_frames_carry_text_and_binary():
+    text = encode_channel_frame("tab-1", dumps({"type": "pong", "ping_id": "p"}))
+    assert decode_channel_frame(text, 1 << 20) == ("tab-1", {"type": "pong", "ping_id": "p"})
+    blob = encode_channel_frame("tab-2", encode_blob({"type": "streamChunk"}, b"\x00\x01"))
+    assert decode_channel_frame(blob, 1 << 20) == ("tab-2", {"type": "streamChunk", "blob": b"\x00\x01"})
+    assert split_channel_frame(text)[1] == dumps({"type": "pong", "ping_id": "p"}).encode()
+
+
+def test_channel_frame_errors():
+    with pytest.raises(FrameError, match="too long"):
+        encode_channel_frame("x" * 256, "{}")
+    with pytest.raises(FrameError, match="Expected a channel frame"):
+        split_channel_frame(b"{}")
+    with pytest.raises(FrameError, match="Truncated"):
+        split_channel_frame(bytes([0x03, 5]) + b"tab")
+    with pytest.raises(FrameError, match="exceeds"):
+        decode_channel_frame(encode_channel_frame("t", dumps({"x": "y" * 100})), 10)
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeSocket
+from managers import (
+    POLICY_DISCONNECT, POLICY_DROP_NEWEST, POLICY_DROP_OLDEST, ConnectionManager, OutboundQueue
+)
+from models import Message
+
+
+def test_frames_are_sent_in_order():
+    async def scenario():
+        socket = FakeSocket()
+        outbound = OutboundQueue(socket, "t", max_size=8)
+        for frame in ("a", b"\x01b", "c"):
+            assert outbound.put(frame)
+        await asyncio.sleep(0.01)
+        assert socket.sent == ["a", b"\x01b", "c"]
+        assert outbound.stats()["sent"] == 3 and outbound.stats()["queue_high_water"] >= 1
+        outbound.close()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("policy, kept", [
+    (POLICY_DROP_OLDEST, ["1", "2"]),
+    (POLICY_DROP_NEWEST, ["0", "1"]),
+])
+def test_full_queue_drops_by_policy(policy, kept):
+    async def scenario():
+        outbound = OutboundQueue(FakeSocket(stall=True), "t", max_size=2, policy=policy)
+        # The writer takes the first frame and stalls sending it
+        outbound.put("stalled")
+        await asyncio.sleep(0)
+        results = [outbound.put(frame) for frame in ("0", "1", "2")]
+        assert results == [True, True, policy == POLICY_DROP_OLDEST]
+        assert [frame for frame, _ in list(outbound.queue._queue)] == kept
+        assert outbound.stats()["dropped"] == 1
+        outbound.close()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_disconnects_slow_consumer():
+    async def scenario():
+        socket = FakeSocket(stall=True)
+        outbound = OutboundQueue(socket, "t", max_size=1, policy=POLICY_DISCONNECT)
+        outbound.put("stalled")
+        await asyncio.sleep(0)
+        outbound.put("0")
+        assert not outbound.put("1") and outbound.closed
+        await asyncio.sleep(0)
+        assert socket.closed_with == 1013
+        assert not outbound.put("2")
+
+    asyncio.run(scenario())
+
+
+def test_stalled_send_closes_the_connection():
+    async def scenario():
+        socket = FakeSocket(stall=True)
+        outbound = OutboundQueue(socket, "t", max_size=4, send_timeout=0.01)
+        outbound.put("stalled")
+        await asyncio.sleep(0.05)
+        assert outbound.closed and socket.closed_with == 1011
+
+    asyncio.run(scenario())
+
+
+def test_dropped_command_fails_without_waiting_for_its_timeout():
+    async def scenario():
+        manager = ConnectionManager(send_queue_size=1, max_in_flight=4)
+        await manager.connect(FakeSocket(stall=True), "t")
+        first = asyncio.create_task(manager.send_request(Message("status", []), "t", 30))
+        await asyncio.sleep(0.01)
+        # The writer is stuck on the first command; the second waits in the queue
+        second = asyncio.create_task(manager.send_request(Message("status", [], request_id="r2"), "t", 30))
+        await asyncio.sleep(0.01)
+        # A later message pushes the queued command out
+        await manager.send_personal_message('{"type":"ping"}', "t")
+        with pytest.raises(ConnectionError, match="dropped: backpressure"):
+            await asyncio.wait_for(second, 1)
+        assert "r2" not in manager.pending_requests
+        first.cancel()
+        await manager.disconnect("t")
+
+    asyncio.run(scenario())
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from managers import ConnectionManager, apply_text_patch
+
+
+@pytest.mark.parametrize("base, patch, expected", [
+    ("hello world", [], "hello world"),
+    ("hello world", [[0, 5, "HELLO"]], "HELLO world"),
+    ("hello world", [[0, 0, ">"], [5, 6, ""], [11, 11, "!"]], ">helloworld!"),
+    ("abc", [[1, 2, "x"], [2, 2, "y"]], "axyc"),
+    # UTF-16 offsets: the emoji is two code units, é one
+    ("é😀 tail", [[3, 4, "_"]], "é😀_tail"),
+    ("😀😀", [[2, 4, "x"]], "😀x"),
+])
+def test_apply_text_patch(base, patch, expected):
+    assert apply_text_patch(base, patch) == expected
+
+
+@pytest.mark.parametrize("base, patch, error", [
+    ("abc", [[2, 1, "x"]], "out of order"),
+    ("abc", [[0, 4, "x"]], "outside"),
+    ("abc", [[-1, 1, "x"]], "out of order"),
+    ("abc", [[1, 2, "x"], [0, 1, "y"]], "out of order"),
+    ("abc", [[0, 2, "x"], [1, 3, "y"]], "out of order"),
+    ("😀", [[0, 3, "x"]], "outside"),
+    ("abc", [[0, 1]], r"\[start, end, text\]"),
+    ("abc", [[0, "1", "x"]], r"\[start, end, text\]"),
+    ("abc", [[0, 1, None]], r"\[start, end, text\]"),
+    ("abc", [[True, 1, "x"]], r"\[start, end, text\]"),
+    ("abc", ["0,1,x"], r"\[start, end, text\]"),
+])
+def test_invalid_patches_are_rejected(base, patch, error):
+    with pytest.raises(ValueError, match=error):
+        apply_text_patch(base, patch)
+
+
+def test_invalid_patch_asks_for_a_full_snapshot():
+    async def scenario():
+        manager = ConnectionManager()
+        manager.update_tab_info("t", {"url": "u", "content": "hello", "version": 1})
+        assert not await manager.apply_state_patch("t", None, 1, 2, [[3, 9, "x"]])
+        assert (await manager.get_tab_info("t"))["content"] == "hello"
+        # Version mismatch
+        assert not await manager.apply_state_patch("t", None, 5, 6, [[0, 1, "H"]])
+        assert await manager.apply_state_patch("t", "u2", 1, 2, [[0, 1, "H"]])
+        assert await manager.get_tab_info("t") | {"hash": None} == {
+            "url": "u2", "version": 2, "hash": None, "content": "Hello"
+        }
+
+    asyncio.run(scenario())
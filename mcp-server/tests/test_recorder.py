@@ -0,0 +1,51 @@
+import os
+import time
+
+from recorder import DIRECTION_IN, DIRECTION_OUT, KIND_CLOSE, KIND_OPEN, SessionReader, SessionRecorder
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_records_round_trip(tmp_path):
+    recorder = SessionRecorder(tmp_path, block_size=64)
+    recorder.record(DIRECTION_IN, "t", "json", KIND_OPEN)
+    for n in range(20):
+        recorder.record(DIRECTION_OUT if n % 2 else DIRECTION_IN, "t", f'{{"n":{n}}}')
+    recorder.record(DIRECTION_IN, "t", b"\x02blob")
+    recorder.record(DIRECTION_IN, "t", None, KIND_CLOSE)
+    recorder.close()
+
+    records = list(SessionReader(recorder.path).records())
+    assert len(records) == 23 == recorder.stats()["records"]
+    assert records[0].kind == KIND_OPEN and records[1].text() == '{"n":0}' and records[2].direction == DIRECTION_OUT
+    assert records[-2].payload == b"\x02blob" and records[-1].kind == KIND_CLOSE
+    assert len(list(recorder.path.glob("*.seg"))) == 1
+
+
+def test_idle_records_are_flushed_by_flush_due(tmp_path):
+    recorder = SessionRecorder(tmp_path, flush_interval=0.05)
+    recorder.record(DIRECTION_IN, "t", "first")
+    recorder.flush_due()
+    # Nothing is due yet: the record waits for more traffic or the interval
+    assert recorder.stats()["bytes_written"] == 0
+    time.sleep(0.06)
+    recorder.flush_due()
+    wait_for(lambda: recorder.stats()["bytes_written"] > 0)
+    assert [record.text() for record in SessionReader(recorder.path).records()] == ["first"]
+    recorder.close()
+
+
+def test_segments_rotate_and_old_ones_are_removed(tmp_path):
+    recorder = SessionRecorder(tmp_path, segment_bytes=100, max_segments=2, block_size=1)
+    for n in range(5):
+        recorder.record(DIRECTION_IN, "t", os.urandom(200))
+        wait_for(lambda: recorder.stats()["pending_blocks"] == 0)
+    recorder.close()
+    assert len(list(recorder.path.glob("*.seg"))) == 2
+    # The newest segment was opened after the last block and is empty
+    assert len(list(SessionReader(recorder.path).records())) == 1
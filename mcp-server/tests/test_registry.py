@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from admission import Throttled
+from conftest import FakeSocket
+from managers import ConnectionManager
+from models import Message
+from registry import TabRegistry, TabRouter
+
+
+class SharedRegistry(TabRegistry):
+    """In-process registry shared by several workers, delivering envelopes directly"""
+    def __init__(self, worker_id: str, tabs: dict, handlers: dict):
+        super().__init__(worker_id)
+        self._tabs = tabs
+        self._handlers = handlers
+
+    async def start(self, handler):
+        self._handlers[self.worker_id] = handler
+
+    async def close(self):
+        self._handlers.pop(self.worker_id, None)
+
+    async def unregister(self, tab_id):
+        if self._tabs.get(tab_id) == self.worker_id:
+            del self._tabs[tab_id]
+
+    async def publish(self, worker_id, envelope):
+        handler = self._handlers.get(worker_id)
+        if handler is None:
+            raise ConnectionError(f"Worker {worker_id} is not listening")
+        await handler(envelope)
+
+
+async def workers():
+    """Two routers sharing a registry; tab "t" is connected to worker "a" """
+    tabs, handlers = {}, {}
+    routers = []
+    for worker_id in ("a", "b"):
+        router = TabRouter(ConnectionManager(), SharedRegistry(worker_id, tabs, handlers))
+        await router.start()
+        routers.append(router)
+    owner, _ = routers
+    socket = FakeSocket()
+    await owner.manager.connect(socket, "t")
+    await owner.register("t")
+    return routers, socket
+
+
+async def sent_request_id(socket: FakeSocket) -> str:
+    for _ in range(100):
+        if socket.sent:
+            break
+        await asyncio.sleep(0)
+    return socket.messages()[-1]["request_id"]
+
+
+def test_in_process_registry_holds_its_own_tabs():
+    async def scenario():
+        registry = TabRegistry("a")
+        await registry.register("t")
+        assert await registry.lookup("t") == "a" and await registry.tabs() == {"t": "a"}
+        await registry.unregister("t")
+        assert await registry.lookup("t") is None
+        with pytest.raises(ConnectionError):
+            await registry.publish("b", {})
+
+    asyncio.run(scenario())
+
+
+def test_request_is_routed_to_the_owning_worker():
+    async def scenario():
+        (owner, router), socket = await workers()
+        assert await router.tabs() == {"t": "a"}
+        call = asyncio.create_task(router.send_request(Message("status", []), "t", 5))
+        request_id = await sent_request_id(socket)
+        owner.manager.resolve_request({"request_id": request_id, "success": True, "result": "ok"})
+        assert (await call)["result"] == "ok"
+        assert router._calls == {}
+
+    asyncio.run(scenario())
+
+
+def test_owner_errors_are_raised_on_the_routing_worker():
+    async def scenario():
+        (owner, router), socket = await workers()
+        call = asyncio.create_task(router.send_request(Message("status", []), "t", 0.05))
+        with pytest.raises(asyncio.TimeoutError):
+            await call
+
+        await owner.manager.disconnect("t")
+        with pytest.raises(ConnectionError, match="not found"):
+            await router.send_request(Message("status", []), "t", 5)
+
+    asyncio.run(scenario())
+
+
+def test_shed_commands_keep_their_retry_hint():
+    async def scenario():
+        (owner, router), _ = await workers()
+
+        async def shed(message, tab_id, timeout):
+            raise Throttled("Too busy", "overloaded", 1.5)
+
+        owner.manager.send_request = shed
+        with pytest.raises(Throttled) as raised:
+            await router.send_request(Message("status", []), "t", 5)
+        assert raised.value.reason == "overloaded" and raised.value.retry_after == 1.5
+
+    asyncio.run(scenario())
+
+
+def test_unknown_or_unreachable_tabs_are_rejected():
+    async def scenario():
+        (owner, router), _ = await workers()
+        with pytest.raises(ConnectionError, match="not found"):
+            await router.send_request(Message("status", []), "missing", 5)
+        await owner.close()
+        with pytest.raises(ConnectionError, match="not listening"):
+            await router.send_request(Message("status", []), "t", 5)
+        assert router._calls == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,26 @@
+import os
+import time
+
+from startup import find_previous_instance, pid_file_path, read_pid_file
+
+
+def test_pid_files_are_keyed_by_port_and_worker(tmp_path):
+    assert pid_file_path(tmp_path, 8012) == tmp_path / "server-8012.pid"
+    assert pid_file_path(tmp_path, 8012, "host/a:1") == tmp_path / "server-8012-host_a_1.pid"
+    assert pid_file_path(tmp_path, 8012, "w1") != pid_file_path(tmp_path, 8013, "w1")
+
+
+def test_previous_instance_must_match_the_port(tmp_path):
+    pid_file = tmp_path / "server-8012.pid"
+    parent = os.getppid()
+    pid_file.write_text(f"{parent}\n8012\n")
+    assert read_pid_file(pid_file) == (parent, 8012)
+    assert find_previous_instance(pid_file, 8012) == parent
+    assert find_previous_instance(pid_file, 9000) is None
+    # Never ourselves, and never a process started after the file was written
+    pid_file.write_text(f"{os.getpid()}\n8012\n")
+    assert find_previous_instance(pid_file, 8012) is None
+    pid_file.write_text(f"{parent}\n8012\n")
+    os.utime(pid_file, (time.time() - 3600 * 24 * 365 * 30,) * 2)
+    assert find_previous_instance(pid_file, 8012) is None
+    assert find_previous_instance(tmp_path / "missing.pid", 8012) is None
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from store import TabStateStore, content_hash
+
+PAGE = "<html>" + "<p>row</p>" * 2000 + "</html>"
+
+
+def settle(state_store: TabStateStore, timeout: float = 5) -> None:
+    """Wait for the demotion thread to bring memory use within budget"""
+    deadline = time.monotonic() + timeout
+    while state_store.stats()["memory_bytes"] > state_store.memory_budget:
+        assert time.monotonic() < deadline, state_store.stats()
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_store():
+    stores = []
+
+    def make(**options) -> TabStateStore:
+        state_store = TabStateStore(**options)
+        stores.append(state_store)
+        return state_store
+
+    yield make
+    for state_store in stores:
+        state_store.close()
+
+
+def test_bodies_are_shared_and_unchanged_updates_skipped(make_store):
+    state_store = make_store(memory_budget=1 << 20)
+    assert state_store.put("a", PAGE)
+    assert not state_store.put("a", PAGE)
+    assert state_store.put("b", PAGE, content_hash(PAGE))
+    stats = state_store.stats()
+    assert stats["bodies"]["raw"] == 1 and stats["unchanged_updates"] == 1 and stats["shared_hits"] == 1
+    state_store.discard("a")
+    assert state_store.get("b") == PAGE and state_store.digest("b") == content_hash(PAGE)
+    assert state_store.put("b", None) and "b" not in state_store
+    assert state_store.stats()["memory_bytes"] == 0
+
+
+def test_over_budget_bodies_are_compressed_and_restored(make_store):
+    state_store = make_store(memory_budget=len(PAGE) * 3 // 2)
+    state_store.put("a", PAGE)
+    state_store.put("b", PAGE + "b")
+    settle(state_store)
+    # The least recently used body is compressed first
+    assert state_store.stats()["bodies"] == {"raw": 1, "compressed": 1, "spilled": 0}
+    assert asyncio.run(state_store.load("a")) == PAGE
+    assert state_store.get("b") == PAGE + "b"
+
+
+def test_spilled_bodies_are_reloaded_from_disk(make_store, tmp_path):
+    state_store = make_store(memory_budget=len(PAGE) // 2, compress=False, spill_dir=tmp_path)
+    state_store.put("a", PAGE)
+    settle(state_store)
+    assert state_store.stats()["bodies"]["spilled"] == 1
+    assert len(list(state_store.spill_dir.iterdir())) == 1
+    assert asyncio.run(state_store.load("a")) == PAGE
+    settle(state_store)
+    # Reloading removed the old file; demoting again wrote a new one
+    assert state_store.stats()["evictions"]["spilled"] == 2
+    assert len(list(state_store.spill_dir.iterdir())) == 1
+    state_store.discard("a")
+    assert list(state_store.spill_dir.iterdir()) == []
+
+
+def test_bodies_are_dropped_without_compression_or_spilling(make_store):
+    state_store = make_store(memory_budget=len(PAGE) // 2, compress=False)
+    state_store.put("a", PAGE)
+    settle(state_store)
+    assert "a" not in state_store and state_store.get("a") is None
+    assert state_store.stats()["evictions"]["dropped"] == 1
+
+
+def test_stale_spill_dirs_are_removed(make_store, tmp_path, monkeypatch):
+    (tmp_path / "999999").mkdir()
+    (tmp_path / "999999" / "x.z").write_bytes(b"")
+    (tmp_path / "1").mkdir()
+    monkeypatch.setattr("psutil.pid_exists", lambda pid: pid == 1)
+    make_store(memory_budget=1, spill_dir=tmp_path)
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(["1", str(os.getpid())])
@@ -0,0 +1,127 @@
+import zlib
+
+import pytest
+
+from streams import KIND_TRANSFER, StreamAssembler, StreamError, TransferStore
+
+
+def send(assembler, tab_id, stream_id, data, chunk_size=4, encoding="identity", size=None):
+    """Stream ``data`` through ``assembler`` as the extension would and return the Transfer"""
+    payload = zlib.compress(data) if encoding == "deflate" else data
+    assembler.start(tab_id, {"type": "streamStart", "stream_id": stream_id, "kind": KIND_TRANSFER,
+                             "encoding": encoding, "size": len(data) if size is None else size})
+    chunks = [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)]
+    for seq, chunk in enumerate(chunks):
+        assembler.chunk(tab_id, {"stream_id": stream_id, "seq": seq, "blob": chunk})
+    return assembler.finish(tab_id, {"stream_id": stream_id, "chunks": len(chunks)})
+
+
+@pytest.mark.parametrize("encoding", ["identity", "deflate"])
+def test_assembles_chunks(encoding):
+    assembler = StreamAssembler(max_bytes=1 << 20, spool_memory=16)
+    data = b"".join(str(i).encode() for i in range(500))
+    transfer = send(assembler, "t", "s1", data, encoding=encoding)
+    assert transfer.size == len(data)
+    assert transfer.read() == data
+    assert transfer.read(10, 5) == data[10:15]
+    assert assembler.stats()["completed"] == 1 and assembler.stats()["active"] == 0
+
+
+def test_streams_of_different_tabs_do_not_mix():
+    assembler = StreamAssembler(max_bytes=1 << 20, spool_memory=1024)
+    for tab_id in ("a", "b"):
+        assembler.start(tab_id, {"stream_id": "s", "kind": KIND_TRANSFER})
+    assembler.chunk("a", {"stream_id": "s", "seq": 0, "blob": b"aaa"})
+    assembler.chunk("b", {"stream_id": "s", "seq": 0, "blob": b"bb"})
+    assert assembler.finish("b", {"stream_id": "s"}).read() == b"bb"
+    assert assembler.finish("a", {"stream_id": "s"}).read() == b"aaa"
+
+
+def test_out_of_order_chunk_drops_the_stream():
+    assembler = StreamAssembler(max_bytes=1 << 20, spool_memory=1024)
+    assembler.start("t", {"stream_id": "s", "kind": KIND_TRANSFER})
+    with pytest.raises(StreamError, match="expected chunk 0") as error:
+        assembler.chunk("t", {"stream_id": "s", "seq": 1, "blob": b"x"})
+    assert error.value.kind == KIND_TRANSFER
+    with pytest.raises(StreamError, match="Unknown stream"):
+        assembler.finish("t", {"stream_id": "s"})
+    assert assembler.stats()["aborted"] == 1
+
+
+def test_oversized_streams_are_rejected():
+    assembler = StreamAssembler(max_bytes=100, spool_memory=1024)
+    with pytest.raises(StreamError, match="exceeds"):
+        assembler.start("t", {"stream_id": "s", "kind": KIND_TRANSFER, "size": 101})
+    # A small compressed chunk may not inflate past the limit either
+    with pytest.raises(StreamError, match="exceeds"):
+        send(assembler, "t", "s", b"\0" * 1000, chunk_size=1000, encoding="deflate", size=0)
+
+
+@pytest.mark.parametrize("end, error", [
+    ({"chunks": 5}, "ended after"),
+    ({"size_mismatch": True}, "expected"),
+])
+def test_incomplete_streams_fail_on_end(end, error):
+    assembler = StreamAssembler(max_bytes=1 << 20, spool_memory=1024)
+    size = 10 if end.pop("size_mismatch", False) else None
+    assembler.start("t", {"stream_id": "s", "kind": KIND_TRANSFER, "size": size})
+    assembler.chunk("t", {"stream_id": "s", "seq": 0, "blob": b"abc"})
+    with pytest.raises(StreamError, match=error):
+        assembler.finish("t", {"stream_id": "s", **end})
+
+
+def test_truncated_deflate_stream_fails():
+    assembler = StreamAssembler(max_bytes=1 << 20, spool_memory=1024)
+    payload = zlib.compress(b"hello world" * 100)
+    assembler.start("t", {"stream_id": "s", "kind": KIND_TRANSFER, "encoding": "deflate"})
+    assembler.chunk("t", {"stream_id": "s", "seq": 0, "blob": payload[:len(payload) // 2]})
+    with pytest.raises(StreamError, match="before its compressed data"):
+        assembler.finish("t", {"stream_id": "s"})
+
+
+@pytest.mark.parametrize("start, error", [
+    ({"kind": KIND_TRANSFER}, "without a stream_id"),
+    ({"stream_id": "s", "kind": "video"}, "Unknown stream kind"),
+    ({"stream_id": "s", "kind": KIND_TRANSFER, "encoding": "gzip"}, "Unknown stream encoding"),
+])
+def test_invalid_stream_start(start, error):
+    with pytest.raises(StreamError, match=error):
+        StreamAssembler(max_bytes=100, spool_memory=100).start("t", start)
+
+
+def test_abort_drops_a_tabs_streams():
+    assembler = StreamAssembler(max_bytes=1 << 20, spool_memory=1024)
+    assembler.start("t", {"stream_id": "s1", "kind": KIND_TRANSFER})
+    assembler.start("t", {"stream_id": "s2", "kind": KIND_TRANSFER})
+    assembler.start("u", {"stream_id": "s1", "kind": KIND_TRANSFER})
+    assert assembler.abort("t") == 2
+    assert assembler.stats()["active"] == 1
+
+
+def test_transfer_store_evicts_oldest_over_budget():
+    assembler = StreamAssembler(max_bytes=1 << 20, spool_memory=1024)
+    store = TransferStore(budget_bytes=25, ttl=60)
+    for stream_id in ("a", "b", "c"):
+        store.add(send(assembler, "t", stream_id, b"x" * 10))
+    assert store.get("a") is None
+    assert store.get("b") is not None and store.get("c") is not None
+    assert store.discard("b") and store.get("b") is None
+
+
+def test_eviction_waits_for_pinned_readers():
+    assembler = StreamAssembler(max_bytes=1 << 20, spool_memory=1024)
+    store = TransferStore(budget_bytes=15, ttl=60)
+    first = send(assembler, "t", "a", b"0123456789")
+    store.add(first)
+    with first.pin():
+        # Evicted while a reader holds it: closing waits for the reader
+        store.add(send(assembler, "t", "b", b"x" * 10))
+        assert store.get("a") is None
+        assert first.read(2, 3) == b"234"
+        # No new readers once it is evicted
+        with pytest.raises(StreamError, match="expired"):
+            with first.pin():
+                pass
+    with pytest.raises(StreamError, match="expired"):
+        first.read()
+    assert store.stats()["evicted"] == 1
@@ -0,0 +1,108 @@
+import csv
+
+import pytest
+
+from tables import (
+    TYPE_BOOL, TYPE_DATE, TYPE_FLOAT, TYPE_INT, TYPE_STRING, Table, TableError, TableStore, iter_jsonl_rows
+)
+
+
+def build(headers, rows, batch_rows=2):
+    table = Table(headers, batch_rows=batch_rows)
+    table.append(rows)
+    return table.finish()
+
+
+def test_column_types_are_inferred_over_all_rows():
+    table = build(["id", "price", "flag", "day", "code", "name"], [
+        ["1", "1.50", "yes", "2024-01-31", "007", "a"],
+        ["2", "2", "No", "2024-02-01", "012", "b"],
+        ["1,000", "-3e2", "TRUE", "2024-02-29", "100", "c"],
+    ])
+    assert table.types == [TYPE_INT, TYPE_FLOAT, TYPE_BOOL, TYPE_DATE, TYPE_STRING, TYPE_STRING]
+    assert list(table.iter_rows()) == [
+        [1, 1.5, True, "2024-01-31", "007", "a"],
+        [2, 2.0, False, "2024-02-01", "012", "b"],
+        [1000, -300.0, True, "2024-02-29", "100", "c"],
+    ]
+
+
+@pytest.mark.parametrize("values, kind", [
+    (["1", "x"], TYPE_STRING),
+    (["2024-02-30"], TYPE_STRING),
+    (["99999999999999999999"], TYPE_FLOAT),
+    (["1", "2.5"], TYPE_FLOAT),
+    (["yes", "1"], TYPE_STRING),
+])
+def test_one_value_can_demote_a_column(values, kind):
+    assert build([], [[value] for value in values]).types == [kind]
+
+
+def test_nulls_and_short_rows():
+    table = build(["a", "b"], [["1", "N/A"], ["", "x"], ["3"], "not a row"])
+    assert table.rows == 3
+    assert table.types == [TYPE_INT, TYPE_STRING]
+    assert list(table.iter_rows()) == [[1, None], [None, "x"], [3, None]]
+    assert [column["nulls"] for column in table.summary()["columns"]] == [1, 2]
+
+
+def test_all_null_column_is_string():
+    assert build(["a"], [["-"], [""]]).types == [TYPE_STRING]
+
+
+def test_names_are_unique_and_filled_in():
+    table = build(["x", "x", " "], [["1", "2", "3", "4"]])
+    assert table.names == ["x", "x_2", "column_3", "column_4"]
+
+
+def test_page_crosses_batches():
+    table = build(["n"], [[str(i)] for i in range(7)], batch_rows=3)
+    page = table.page(2, 4)
+    assert page["rows"] == [[2], [3], [4], [5]]
+    assert page["next_offset"] == 6 and page["total_rows"] == 7
+    assert table.page(6, 10)["next_offset"] is None
+
+
+def test_summary_stats():
+    table = build(["n", "s"], [["1", "a"], ["3", "b"], ["2", "a"], ["4", "c"], ["5", "d"]])
+    n, s = table.summary()["columns"]
+    assert (n["min"], n["max"], n["mean"]) == (1, 5, 3.0)
+    assert s["samples"] == ["a", "b", "c"]
+
+
+def test_table_must_be_finished_to_read_and_unfinished_to_append():
+    table = Table(["a"])
+    table.append([["1"]])
+    with pytest.raises(TableError):
+        table.page()
+    table.finish()
+    with pytest.raises(TableError):
+        table.append([["2"]])
+
+
+def test_export_csv_and_jsonl(tmp_path):
+    table = build(["n", "flag"], [["1", "yes"], ["", "no"]])
+    table.export(tmp_path / "t.csv", "csv")
+    with (tmp_path / "t.csv").open(newline="") as file:
+        assert list(csv.reader(file)) == [["n", "flag"], ["1", "True"], ["", "False"]]
+    table.export(tmp_path / "t.jsonl", "jsonl")
+    assert (tmp_path / "t.jsonl").read_text().splitlines() == ['{"n":1,"flag":true}', '{"n":null,"flag":false}']
+    with pytest.raises(TableError):
+        table.export(tmp_path / "t.xml", "xml")
+
+
+def test_iter_jsonl_rows_handles_lines_split_across_reads():
+    data = b'["a", "1"]\n\n["b", "2"]\n["c", "3"]'
+    read = lambda offset, length: data[offset:offset + length]
+    assert list(iter_jsonl_rows(read, len(data), chunk=4)) == [["a", "1"], ["b", "2"], ["c", "3"]]
+    with pytest.raises(TableError, match="Invalid row"):
+        list(iter_jsonl_rows(lambda offset, length: b"[1,\n"[offset:offset + length], 4))
+
+
+def test_table_store_evicts_over_budget():
+    store = TableStore(budget_bytes=1, ttl=60)
+    first, second = build(["a"], [["1"]]), build(["a"], [["2"]])
+    store.add(first)
+    store.add(second)
+    assert store.get(first.table_id) is None
+    assert store.get(second.table_id) is second
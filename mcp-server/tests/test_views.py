@@ -0,0 +1,42 @@
+from dom import INDEX_BYTES_PER_CHAR, DomIndex
+from views import ViewCache, value_size
+
+
+def test_views_are_shared_by_digest_and_key():
+    cache = ViewCache()
+    assert cache.lookup("h1", "text") == (False, None)
+    cache.store("h1", "text", "hello")
+    assert cache.lookup("h1", "text") == (True, "hello")
+    assert cache.lookup("h2", "text") == (False, None)
+    assert cache.stats() | {"max_bytes": 0} == {
+        "entries": 1, "bytes": 5, "max_bytes": 0, "hits": 1, "misses": 2, "evictions": 0
+    }
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = ViewCache(max_bytes=10)
+    cache.store("a", "text", "x" * 4)
+    cache.store("b", "text", "x" * 4)
+    cache.lookup("a", "text")
+    cache.store("c", "text", "x" * 4)
+    assert cache.lookup("b", "text")[0] is False
+    assert cache.lookup("a", "text")[0] and cache.lookup("c", "text")[0]
+    assert cache.stats()["bytes"] == 8 and cache.stats()["evictions"] == 1
+
+
+def test_replacing_an_entry_and_oversized_values():
+    cache = ViewCache(max_bytes=10, max_entries=2)
+    cache.store("a", "text", "x" * 4)
+    cache.store("a", "text", "x" * 6)
+    assert cache.stats()["bytes"] == 6
+    # Too large to cache on its own; the old value for the key is dropped too
+    cache.store("a", "text", "x" * 11)
+    assert cache.lookup("a", "text") == (False, None) and cache.stats()["bytes"] == 0
+    for digest in "bcd":
+        cache.store(digest, "n", 1, size=1)
+    assert cache.stats()["entries"] == 2
+
+
+def test_dom_index_is_sized_by_its_source():
+    html = "<ul>" + "<li>item</li>" * 100 + "</ul>"
+    assert value_size(DomIndex.from_html(html)) == INDEX_BYTES_PER_CHAR * len(html)
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from watchers import (
+    CONDITION_CHANGED, CONDITION_SELECTOR_APPEARED, CONDITION_SELECTOR_GONE, CONDITION_URL_CHANGED, PageWatchers,
+    parse_resource_uri
+)
+
+
+class Page:
+    """Tab states and selector counts the watchers read"""
+    def __init__(self):
+        self.states = {}
+        self.counts = {}
+
+    def get_state(self, tab_id):
+        return self.states.get(tab_id)
+
+    async def count_matches(self, tab_id, selector):
+        if tab_id not in self.states:
+            raise LookupError(tab_id)
+        return self.counts.get(selector, 0)
+
+
+class Session:
+    def __init__(self, fail=False):
+        self.updated = []
+        self.fail = fail
+
+    async def send_resource_updated(self, uri):
+        if self.fail:
+            raise RuntimeError("closed")
+        self.updated.append(uri)
+
+
+def test_parse_resource_uri():
+    assert parse_resource_uri("resource://t") == ("t", None)
+    assert parse_resource_uri("resource://t/text/0") == ("t", None)
+    assert parse_resource_uri("resource://t/select/a.b > c") == ("t", "a.b > c")
+    assert parse_resource_uri("file://t") == (None, None)
+
+
+@pytest.fixture
+def page():
+    page = Page()
+    page.states["t"] = {"url": "u1", "hash": "h1"}
+    return page
+
+
+def update(watchers, page, tab_id, state):
+    previous = page.states.get(tab_id)
+    if state is None:
+        page.states.pop(tab_id, None)
+    else:
+        page.states[tab_id] = state
+    watchers.notify(tab_id, previous, state)
+
+
+def test_wait_settles_a_burst_before_evaluating(page):
+    async def scenario():
+        watchers = PageWatchers(page.get_state, page.count_matches, debounce=0.02)
+        waiter = asyncio.create_task(watchers.wait_for("t", page.states["t"], CONDITION_URL_CHANGED, None, 5))
+        await asyncio.sleep(0)
+        # Content changes alone do not satisfy url_changed
+        update(watchers, page, "t", {"url": "u1", "hash": "h2"})
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        for n in range(3):
+            update(watchers, page, "t", {"url": f"u{n + 2}", "hash": "h3"})
+        result = await waiter
+        assert result["matched"] and result["url"] == "u4"
+
+    asyncio.run(scenario())
+
+
+def test_selector_conditions(page):
+    async def scenario():
+        watchers = PageWatchers(page.get_state, page.count_matches, debounce=0)
+        page.counts["#done"] = 1
+        result = await watchers.wait_for("t", page.states["t"], CONDITION_SELECTOR_APPEARED, "#done", 1)
+        assert result["matched"] and result["elapsed"] < 1
+
+        gone = asyncio.create_task(watchers.wait_for("t", page.states["t"], CONDITION_SELECTOR_GONE, "#done", 5))
+        await asyncio.sleep(0)
+        page.counts["#done"] = 0
+        update(watchers, page, "t", {"url": "u1", "hash": "h2"})
+        assert (await gone)["matched"]
+
+    asyncio.run(scenario())
+
+
+def test_wait_times_out_or_ends_on_disconnect(page):
+    async def scenario():
+        watchers = PageWatchers(page.get_state, page.count_matches, debounce=0)
+        result = await watchers.wait_for("t", page.states["t"], CONDITION_CHANGED, None, 0.01)
+        assert not result["matched"] and "Timed out" in result["error"]
+
+        waiter = asyncio.create_task(watchers.wait_for("t", page.states["t"], CONDITION_CHANGED, None, 5))
+        await asyncio.sleep(0)
+        update(watchers, page, "t", None)
+        assert (await waiter)["error"] == "Tab t disconnected"
+        assert watchers._waiters == {}
+
+    asyncio.run(scenario())
+
+
+def test_subscribers_are_notified_once_per_real_change(page):
+    async def scenario():
+        watchers = PageWatchers(page.get_state, page.count_matches, debounce=0.01)
+        session, broken = Session(), Session(fail=True)
+        await watchers.subscribe("resource://t", session)
+        await watchers.subscribe("resource://t/select/li", broken)
+
+        for n in range(3):
+            update(watchers, page, "t", {"url": "u1", "hash": f"h{n + 2}"})
+        await asyncio.sleep(0.05)
+        assert session.updated == ["resource://t"]
+        # Same state again: nothing to report
+        update(watchers, page, "t", dict(page.states["t"]))
+        await asyncio.sleep(0.05)
+        assert session.updated == ["resource://t"]
+
+        page.counts["li"] = 2
+        update(watchers, page, "t", {"url": "u1", "hash": "h9"})
+        await asyncio.sleep(0.05)
+        # The failing session is dropped; the other URI had its own change
+        assert "resource://t/select/li" not in watchers._subscriptions
+        assert session.updated == ["resource://t", "resource://t"]
+
+        watchers.unsubscribe("resource://t", session)
+        assert watchers._subscriptions == {}
+
+    asyncio.run(scenario())